@@ -0,0 +1,154 @@
+"""
+Benchmark agent trên bộ câu hỏi cố định, dùng cassette ghi/phát lại (mcp/replay.py).
+
+Ghi cassette từ một lần chạy thật (cần GOOGLE_API_KEY, PICONE_API_KEY, TAVILY_API_KEY):
+    python -m bench.agent_replay record --cassette bench/cassettes/agent.json
+
+Phát lại (không cần mạng), độ trễ bằng độ trễ đã ghi nhân với --latency-scale:
+    python -m bench.agent_replay replay --cassette bench/cassettes/agent.json --runs 3 --save after.json
+    python -m bench.agent_replay replay --cassette bench/cassettes/agent.json --compare after.json
+
+Với mỗi câu hỏi, báo cáo: thời gian chạy, số bước agent, số lần gọi tool, số lần gọi LLM, số prompt token.
+Dùng --fake để ghi cassette từ model/index giả lập (kiểm tra nhanh harness khi không có key).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+from typing import Dict, List
+
+# Answer cache sẽ trả lời thay agent cho các câu hỏi lặp lại, làm sai lệch số liệu
+os.environ.setdefault("ANSWER_CACHE", "0")
+os.environ.setdefault("RETRIEVAL_CACHE", "0")
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "questions_vi.txt")
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def run_question(rag, question: str, use_async: bool) -> Dict:
+    from mcp.budget import RunBudget
+
+    # Ngân sách rộng để số bước phản ánh hành vi của graph, không bị cắt do hết giờ
+    budget = RunBudget(time_budget_s=600)
+    started = time.perf_counter()
+    if use_async:
+        answer, _ = asyncio.run(rag.aget_response(question, [], budget=budget))
+    else:
+        answer, _ = rag.get_response(question, [], budget=budget)
+    return {
+        "question": question,
+        "wall_s": time.perf_counter() - started,
+        # Mỗi vòng tool là một bước agent, cộng bước trả lời cuối
+        "iterations": budget.tool_rounds + 1,
+        "tool_calls": len(budget.tool_calls),
+        "llm_calls": budget.llm_calls,
+        "prompt_tokens": budget.prompt_tokens,
+        "forced_answer": budget.forced_answer,
+        "answer_chars": len(answer or ""),
+    }
+
+
+def summarize(results: List[List[Dict]]) -> List[Dict]:
+    """Gộp nhiều lượt chạy: wall_s lấy trung vị, các số đếm lấy từ lượt đầu (replay là tất định)."""
+    rows = []
+    for per_run in zip(*results):
+        row = dict(per_run[0])
+        row["wall_s"] = statistics.median(r["wall_s"] for r in per_run)
+        rows.append(row)
+    return rows
+
+
+def print_table(rows: List[Dict], baseline: Dict[str, Dict] = None):
+    header = f"{'wall_s':>8} {'iter':>5} {'tools':>5} {'llm':>4} {'prompt_tok':>10}  câu hỏi"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        line = f"{row['wall_s']:8.3f} {row['iterations']:5d} {row['tool_calls']:5d} {row['llm_calls']:4d} {row['prompt_tokens']:10d}  {row['question'][:60]}"
+        old = (baseline or {}).get(row["question"])
+        if old:
+            line += f"   (Δwall {row['wall_s'] - old['wall_s']:+.3f}s, Δtok {row['prompt_tokens'] - old['prompt_tokens']:+d})"
+        print(line)
+    total = lambda key: sum(row[key] for row in rows)
+    print("-" * len(header))
+    print(f"{total('wall_s'):8.3f} {total('iterations'):5d} {total('tool_calls'):5d} {total('llm_calls'):4d} {total('prompt_tokens'):10d}  TỔNG ({len(rows)} câu hỏi)")
+    if baseline:
+        old_wall = sum(old["wall_s"] for old in baseline.values())
+        old_tokens = sum(old["prompt_tokens"] for old in baseline.values())
+        print(f"So với baseline: wall {old_wall:.3f}s -> {total('wall_s'):.3f}s, prompt token {old_tokens} -> {total('prompt_tokens')}")
+
+
+def use_fakes():
+    from bench.fakes import FakeAsyncIndex, FakeChatModel, FakeIndex
+    from mcp import rag, tools
+    from mcp.cascade import ModelCascade
+
+    rag.set_cascade(ModelCascade.from_models(
+        [("fake-lite", FakeChatModel(latency_s=0.2, weak_answer_ratio=0.3)), ("fake", FakeChatModel(latency_s=0.6))],
+        rag.tools,
+    ))
+    tools.set_index(FakeIndex(0.08), FakeAsyncIndex(0.08))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("--cassette", default="bench/cassettes/agent.json")
+    parser.add_argument("--questions", default=QUESTIONS_PATH)
+    parser.add_argument("--runs", type=int, default=1, help="Số lượt chạy khi replay (lấy trung vị thời gian)")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="Dùng aget_response thay vì get_response")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Nhân độ trễ đã ghi (0 = không chờ)")
+    parser.add_argument("--llm-latency", type=float, default=None, help="Độ trễ cố định cho mỗi lần gọi LLM (giây)")
+    parser.add_argument("--search-latency", type=float, default=None)
+    parser.add_argument("--web-latency", type=float, default=None)
+    parser.add_argument("--fake", action="store_true", help="Ghi từ model/index giả lập thay vì dịch vụ thật")
+    parser.add_argument("--save", help="Lưu kết quả ra file JSON")
+    parser.add_argument("--compare", help="So sánh với kết quả đã lưu")
+    args = parser.parse_args()
+
+    if args.fake or args.mode == "replay":
+        import bench.fakes  # noqa: F401  (đặt key giả trước khi khởi tạo client, replay không gọi mạng)
+    from mcp import rag
+    from mcp.replay import Cassette, LatencyProfile, install
+
+    questions = load_questions(args.questions)
+    if args.mode == "record":
+        if args.fake:
+            use_fakes()
+        cassette = Cassette(args.cassette)
+        restore = install(cassette, mode="record")
+        runs = 1
+    else:
+        cassette = Cassette.load(args.cassette)
+        latency = LatencyProfile(args.latency_scale, llm=args.llm_latency, search=args.search_latency, web=args.web_latency)
+        restore = install(cassette, mode="replay", latency=latency)
+        runs = args.runs
+
+    try:
+        results = [[run_question(rag, q, args.use_async) for q in questions] for _ in range(runs)]
+    finally:
+        restore()
+        if args.mode == "record":
+            cassette.save()
+            print(f"Đã ghi cassette: {args.cassette} ({cassette.stats()})")
+
+    rows = summarize(results)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = {row["question"]: row for row in json.load(f)}
+    print_table(rows, baseline)
+    if args.mode == "replay":
+        print(f"Cassette: {cassette.stats()}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Load test so sánh đường xử lý sync (get_response trên threadpool, như endpoint `def` của FastAPI)
+với đường async (aget_response trên event loop) khi LLM và Pinecone đều chậm.
+
+Chạy:
+    python -m bench.async_load --requests 200 --llm-latency 0.5 --index-latency 0.1
+
+Threadpool mặc định của FastAPI/anyio có 40 thread, nên đường sync chỉ phục vụ được 40 hội thoại
+cùng lúc; đường async chỉ bị giới hạn bởi độ trễ của upstream.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("ANSWER_CACHE", "0")
+
+from bench.fakes import FakeAsyncIndex, FakeChatModel, FakeIndex
+from mcp import rag, tools
+from mcp.budget import RunBudget
+
+
+def _summary(name: str, latencies, wall_s: float) -> str:
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    return (
+        f"{name:<6} requests={len(latencies):<5} wall={wall_s:7.2f}s  "
+        f"throughput={len(latencies) / wall_s:7.1f} req/s  "
+        f"p50={statistics.median(latencies):6.2f}s  p95={p95:6.2f}s"
+    )
+
+
+def _question(i: int) -> str:
+    return f"Điều kiện tốt nghiệp của sinh viên số {i} là gì?"
+
+
+def run_sync(n: int, workers: int) -> str:
+    def one(i: int) -> float:
+        started = time.monotonic()
+        rag.get_response(_question(i), [], budget=RunBudget(time_budget_s=120))
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, range(n)))
+    return _summary("sync", latencies, time.monotonic() - started)
+
+
+async def run_async(n: int) -> str:
+    async def one(i: int) -> float:
+        started = time.monotonic()
+        await rag.aget_response(_question(i), [], budget=RunBudget(time_budget_s=120))
+        return time.monotonic() - started
+
+    started = time.monotonic()
+    latencies = await asyncio.gather(*(one(i) for i in range(n)))
+    return _summary("async", latencies, time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="Số hội thoại đồng thời")
+    parser.add_argument("--workers", type=int, default=40, help="Số thread cho đường sync (mặc định bằng threadpool của FastAPI)")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--index-latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rag.set_llm(FakeChatModel(latency_s=args.llm_latency))
+    tools.set_index(FakeIndex(args.index_latency), FakeAsyncIndex(args.index_latency))
+
+    # Mỗi hội thoại: LLM chọn tool -> search -> LLM trả lời
+    ideal = 2 * args.llm_latency + args.index_latency
+    print(f"Độ trễ lý tưởng một hội thoại: {ideal:.2f}s")
+    print(run_sync(args.requests, args.workers))
+    print(asyncio.run(run_async(args.requests)))
+
+
+if __name__ == "__main__":
+    main()
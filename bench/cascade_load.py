@@ -0,0 +1,61 @@
+"""
+So sánh model cascade (model rẻ trước, chỉ chuyển lên model mạnh khi cần) với chỉ dùng model mạnh,
+trên các chat model giả lập. In ra độ trễ và số lần gọi của từng tầng.
+
+Chạy:
+    python -m bench.cascade_load --requests 100 --cheap-latency 0.2 --strong-latency 0.8 --weak-ratio 0.2
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("ANSWER_CACHE", "0")
+
+from bench.fakes import FakeAsyncIndex, FakeChatModel, FakeIndex
+from mcp import rag, tools
+from mcp.budget import RunBudget
+from mcp.cascade import ModelCascade
+
+
+async def run(name: str, cascade: ModelCascade, n: int):
+    rag.set_cascade(cascade)
+
+    async def one(i: int):
+        budget = RunBudget(time_budget_s=120)
+        started = time.monotonic()
+        await rag.aget_response(f"Quy định về học phần số {i} như thế nào?", [], budget=budget)
+        return time.monotonic() - started, bool(budget.escalations)
+
+    started = time.monotonic()
+    results = await asyncio.gather(*(one(i) for i in range(n)))
+    wall_s = time.monotonic() - started
+    latencies = sorted(latency for latency, _ in results)
+    escalated = sum(1 for _, was_escalated in results if was_escalated)
+    print(
+        f"{name:<8} wall={wall_s:6.2f}s  p50={statistics.median(latencies):5.2f}s  "
+        f"p95={latencies[int(0.95 * (n - 1))]:5.2f}s  escalated={escalated}/{n}"
+    )
+    for tier in cascade.stats()["tiers"]:
+        print(f"         {tier}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--cheap-latency", type=float, default=0.2)
+    parser.add_argument("--strong-latency", type=float, default=0.8)
+    parser.add_argument("--weak-ratio", type=float, default=0.2, help="Tỉ lệ câu hỏi model rẻ trả lời chưa đạt")
+    args = parser.parse_args()
+
+    tools.set_index(FakeIndex(0.05), FakeAsyncIndex(0.05))
+    cheap = FakeChatModel(latency_s=args.cheap_latency, weak_answer_ratio=args.weak_ratio)
+    strong = FakeChatModel(latency_s=args.strong_latency)
+
+    asyncio.run(run("strong", ModelCascade.from_models([("strong", strong)], rag.tools), args.requests))
+    asyncio.run(run("cascade", ModelCascade.from_models([("cheap", cheap), ("strong", strong)], rag.tools), args.requests))
+
+
+if __name__ == "__main__":
+    main()
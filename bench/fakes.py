@@ -0,0 +1,119 @@
+"""
+Các thành phần giả lập dùng cho benchmark/load test: chat model, Pinecone index.
+Không gọi mạng, độ trễ được giả lập bằng sleep để đo phần overhead của server.
+"""
+import asyncio
+import os
+import time
+import zlib
+from typing import Any, List, Optional
+
+# Các client (Gemini, Pinecone, Tavily) chỉ cần có key khi khởi tạo, không gọi mạng
+for _key in ("GOOGLE_API_KEY", "PICONE_API_KEY", "TAVILY_API_KEY"):
+    os.environ.setdefault(_key, "bench-dummy-key")
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model giả lập: lượt đầu gọi `tool_name`, khi đã có kết quả tool thì trả lời.
+    Mỗi lần gọi tốn `latency_s` giây (time.sleep khi chạy sync, asyncio.sleep khi chạy async).
+    Với `weak_answer_ratio` > 0, một tỉ lệ câu hỏi (cố định theo nội dung câu hỏi) nhận câu trả lời
+    né tránh, dùng để giả lập model rẻ trong model cascade.
+    """
+
+    latency_s: float = 0.5
+    tool_name: str = "search_academic_regulations"
+    answer: str = "Theo quy chế đào tạo, sinh viên cần tích luỹ đủ số tín chỉ của chương trình để tốt nghiệp."
+    weak_answer: str = "Tôi không tìm thấy thông tin chính xác về câu hỏi này."
+    weak_answer_ratio: float = 0.0
+    tool_choice: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, tool_choice: Optional[str] = None, **kwargs):
+        return self.model_copy(update={"tool_choice": tool_choice})
+
+    def _is_weak(self, messages: List[BaseMessage]) -> bool:
+        if self.weak_answer_ratio <= 0:
+            return False
+        question = next((str(m.content) for m in reversed(messages) if m.type == "human"), "")
+        return zlib.crc32(question.encode("utf-8")) % 1000 < self.weak_answer_ratio * 1000
+
+    def _reply(self, messages: List[BaseMessage]) -> ChatResult:
+        prompt_tokens = sum(len(str(m.content)) for m in messages) // 4 + 1
+        used_tool = any(isinstance(m, ToolMessage) for m in messages)
+        if used_tool or self.tool_choice == "none" or not self.tool_name:
+            message = AIMessage(content=self.weak_answer if self._is_weak(messages) else self.answer)
+        else:
+            question = str(messages[-1].content)
+            message = AIMessage(
+                content="",
+                tool_calls=[{"name": self.tool_name, "args": {"query": question}, "id": f"call-{time.monotonic_ns()}"}],
+            )
+        message.usage_metadata = {
+            "input_tokens": prompt_tokens,
+            "output_tokens": len(str(message.content)) // 4 + 1,
+            "total_tokens": prompt_tokens + len(str(message.content)) // 4 + 1,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        time.sleep(self.latency_s)
+        return self._reply(messages)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        await asyncio.sleep(self.latency_s)
+        return self._reply(messages)
+
+
+def _fake_hits(text: str, top_k: int) -> dict:
+    return {"result": {"hits": [{"fields": {"text": f"Đoạn {i + 1} liên quan tới: {text}"}} for i in range(top_k)]}}
+
+
+class FakeIndex:
+    """Pinecone index giả lập (bản sync), mỗi lần search tốn `latency_s` giây."""
+
+    def __init__(self, latency_s: float = 0.1):
+        self.latency_s = latency_s
+        self.searches = 0
+
+    def search(self, namespace: str, query: dict, fields=None):
+        self.searches += 1
+        time.sleep(self.latency_s)
+        return _fake_hits(query["inputs"]["text"], query["top_k"])
+
+
+class FakeAsyncIndex(FakeIndex):
+    """Pinecone IndexAsyncio giả lập."""
+
+    async def search(self, namespace: str, query: dict, fields=None):
+        self.searches += 1
+        await asyncio.sleep(self.latency_s)
+        return _fake_hits(query["inputs"]["text"], query["top_k"])
+
+
+def fake_embed(text: str, dim: int = 64) -> List[float]:
+    """Embedding giả lập (túi từ băm vào `dim` chiều), dùng thay Pinecone embed cho answer cache."""
+    vector = [0.0] * dim
+    for word in text.lower().split():
+        vector[zlib.crc32(word.encode("utf-8")) % dim] += 1.0
+    return vector
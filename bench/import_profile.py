@@ -0,0 +1,119 @@
+"""
+Báo cáo thời gian import lúc khởi động (cold start) theo từng module, dựa trên `python -X importtime`.
+
+    python -m bench.import_profile                      # import main, in top 25 module và theo package
+    python -m bench.import_profile --module mcp.rag --top 40
+    python -m bench.import_profile --save bench/baselines/import.json
+    python -m bench.import_profile --compare bench/baselines/import.json
+
+Mỗi lần chạy là một tiến trình Python mới (không dùng lại module đã import); với --runs > 1
+lấy trung vị theo từng module. Dùng --compare để thấy module nào làm chậm khởi động so với trước.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profile_once(module: str) -> Dict:
+    """Import `module` trong tiến trình mới; trả về thời gian tổng và (self, cumulative) của từng module (giây)."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    wall_s = time.perf_counter() - started
+    if result.returncode != 0:
+        raise SystemExit(f"Import {module} lỗi:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules[name] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+    return {"wall_s": wall_s, "modules": modules}
+
+
+def profile(module: str, runs: int) -> Dict:
+    samples = [profile_once(module) for _ in range(runs)]
+    names = set().union(*(s["modules"] for s in samples))
+    modules = {}
+    for name in names:
+        values = [s["modules"][name] for s in samples if name in s["modules"]]
+        modules[name] = {
+            "self_s": statistics.median(v[0] for v in values),
+            "cumulative_s": statistics.median(v[1] for v in values),
+        }
+    packages: Dict[str, float] = {}
+    for name, row in modules.items():
+        top = name.split(".")[0]
+        packages[top] = packages.get(top, 0.0) + row["self_s"]
+    return {
+        "module": module,
+        "runs": runs,
+        "wall_s": statistics.median(s["wall_s"] for s in samples),
+        "import_s": modules.get(module, {}).get("cumulative_s", 0.0),
+        "module_count": len(modules),
+        "modules": modules,
+        "packages": packages,
+    }
+
+
+def print_report(report: Dict, top: int, baseline: Dict = None):
+    base_modules = (baseline or {}).get("modules", {})
+    base_packages = (baseline or {}).get("packages", {})
+
+    def delta(new: float, old) -> str:
+        return f"  ({new - old:+.3f}s)" if old is not None else ""
+
+    print(f"import {report['module']}: {report['import_s']:.3f}s ({report['module_count']} module), "
+          f"tiến trình {report['wall_s']:.3f}s, trung vị {report['runs']} lần chạy"
+          + (delta(report["import_s"], baseline.get("import_s")) if baseline else ""))
+
+    print(f"\n{'cumulative':>10} {'self':>8}  module (top {top} theo thời gian cộng dồn)")
+    rows: List = sorted(report["modules"].items(), key=lambda item: item[1]["cumulative_s"], reverse=True)[:top]
+    for name, row in rows:
+        old = base_modules.get(name)
+        print(f"{row['cumulative_s']:10.3f} {row['self_s']:8.3f}  {name}{delta(row['cumulative_s'], old['cumulative_s'] if old else None)}")
+
+    print(f"\n{'self':>10}  package (tổng thời gian tự thân của các module trong package)")
+    for name, seconds in sorted(report["packages"].items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{seconds:10.3f}  {name}{delta(seconds, base_packages.get(name))}")
+    if baseline:
+        gone = sorted(set(base_packages) - set(report["packages"]))
+        added = sorted(set(report["packages"]) - set(base_packages))
+        if gone:
+            print(f"\nKhông còn import lúc khởi động: {', '.join(gone)}")
+        if added:
+            print(f"Mới được import lúc khởi động: {', '.join(added)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module cần đo (mặc định: main)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--save", help="Lưu báo cáo ra file JSON")
+    parser.add_argument("--compare", help="So sánh với báo cáo đã lưu")
+    args = parser.parse_args()
+
+    report = profile(args.module, args.runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, args.top, baseline)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+So sánh snapshot tin tuyển dụng dạng cột (mcp/job_snapshot.py, file .jobsnap) với file JSON gốc (job_data/*.json).
+
+    python -m bench.job_snapshot
+    python -m bench.job_snapshot --repeat 20
+
+Mỗi định dạng chạy trong một tiến trình riêng (bộ nhớ không lẫn nhau) và đo:
+- dung lượng file;
+- thời gian nạp cả ba file và dựng danh sách tin (tên, công ty, hạn nộp, địa điểm, chuyên ngành), lấy lần nhanh nhất;
+- bộ nhớ thường trú (RSS) tăng thêm sau khi nạp;
+- thời gian lấy đầy đủ một tin (với snapshot: giải nén description/requirements/benefits).
+
+Trước khi đo, kiểm tra snapshot đọc lại đúng từng tin của file JSON; thoát mã 1 nếu khác.
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from mcp.job_snapshot import EXTENSION, JobSnapshot, convert_json
+
+JOB_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "job_data")
+LIST_FIELDS = ("title", "company_name", "deadline", "location", "majors_required")
+
+
+def rss_bytes() -> int:
+    """RSS hiện tại (Linux: /proc/self/statm), nếu không có thì RSS lớn nhất từ getrusage."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_json(paths: List[str]):
+    jobs = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            jobs.append(json.load(f))
+    return jobs, [{key: job.get(key) for key in LIST_FIELDS} for data in jobs for job in data]
+
+
+def load_snapshot(paths: List[str]):
+    snapshots = [JobSnapshot(path) for path in paths]
+    return snapshots, [summary for snapshot in snapshots for summary in snapshot.summaries(LIST_FIELDS)]
+
+
+def run_worker(mode: str, paths: List[str], repeat: int) -> Dict:
+    loader = load_json if mode == "json" else load_snapshot
+    gc.collect()
+    rss_before = rss_bytes()
+    data, listing = loader(paths)
+    gc.collect()
+    rss_after = rss_bytes()
+
+    load_times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        other, _ = loader(paths)
+        load_times.append(time.perf_counter() - started)
+        if mode == "snapshot":
+            for snapshot in other:
+                snapshot.close()
+
+    started = time.perf_counter()
+    details = 0
+    for _ in range(repeat):
+        if mode == "json":
+            for jobs in data:
+                for job in jobs:
+                    details += len(dict(job))
+        else:
+            for snapshot in data:
+                for index in range(len(snapshot)):
+                    details += len(snapshot.job(index))
+    detail_s = (time.perf_counter() - started) / (repeat * len(listing))
+
+    return {
+        "mode": mode,
+        "file_bytes": sum(os.path.getsize(path) for path in paths),
+        "jobs": len(listing),
+        "load_ms": min(load_times) * 1000,
+        "rss_delta_bytes": rss_after - rss_before,
+        "detail_us": detail_s * 1e6,
+    }
+
+
+def check_equal(json_paths: List[str], snapshot_paths: List[str]) -> int:
+    mismatches = 0
+    for json_path, snapshot_path in zip(json_paths, snapshot_paths):
+        with open(json_path, "r", encoding="utf-8") as f:
+            jobs = json.load(f)
+        with JobSnapshot(snapshot_path) as snapshot:
+            if len(snapshot) != len(jobs):
+                mismatches += 1
+                continue
+            mismatches += sum(snapshot.job(index) != job for index, job in enumerate(jobs))
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--worker", choices=["json", "snapshot"], help=argparse.SUPPRESS)
+    parser.add_argument("paths", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args.worker, args.paths, args.repeat)))
+        return
+
+    json_paths = sorted(os.path.join(JOB_DATA_DIR, name) for name in os.listdir(JOB_DATA_DIR) if name.endswith(".json"))
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_paths = [
+            convert_json(path, os.path.join(directory, os.path.splitext(os.path.basename(path))[0] + EXTENSION))
+            for path in json_paths
+        ]
+        mismatches = check_equal(json_paths, snapshot_paths)
+        print(f"Kiểm tra đọc lại: {mismatches} tin khác với JSON gốc")
+
+        rows = []
+        for mode, paths in (("json", json_paths), ("snapshot", snapshot_paths)):
+            output = subprocess.run(
+                [sys.executable, "-m", "bench.job_snapshot", "--worker", mode, "--repeat", str(args.repeat), *paths],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            rows.append(json.loads(output.strip().splitlines()[-1]))
+
+    header = f"{'định dạng':<10}{'số tin':>8}{'file KB':>10}{'nạp ms':>9}{'RSS +KB':>10}{'chi tiết µs/tin':>17}"
+    print(header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['mode']:<10}{row['jobs']:>8}{row['file_bytes'] / 1024:>10.1f}{row['load_ms']:>9.2f}"
+              f"{row['rss_delta_bytes'] / 1024:>10.0f}{row['detail_us']:>17.1f}")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
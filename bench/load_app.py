@@ -0,0 +1,40 @@
+"""
+Chạy `main.app` với chat model và Pinecone index giả lập, dùng làm server cho bench/load_test.py.
+Các dịch vụ ngoài khác (ctsv, TTS) trỏ tới mock qua biến môi trường CTSV_BASE_URL, EXTERNAL_TTS_URL.
+
+    CTSV_BASE_URL=http://127.0.0.1:8101 EXTERNAL_TTS_URL=http://127.0.0.1:8102 \\
+        python -m bench.load_app --port 8100 --llm-latency 0.6 --search-latency 0.08
+"""
+import argparse
+
+import bench.fakes  # noqa: F401  (đặt key giả trước khi import main)
+from bench.fakes import FakeAsyncIndex, FakeChatModel, FakeIndex, fake_embed
+
+
+def install_fakes(llm_latency_s: float, search_latency_s: float):
+    from mcp import rag, tools
+
+    rag.set_llm(FakeChatModel(latency_s=llm_latency_s))
+    tools.set_index(FakeIndex(search_latency_s), FakeAsyncIndex(search_latency_s))
+    if rag.answer_cache is not None:
+        rag.answer_cache.embed_fn = fake_embed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--llm-latency", type=float, default=0.6, help="Độ trễ mỗi lần gọi LLM giả lập (giây)")
+    parser.add_argument("--search-latency", type=float, default=0.08, help="Độ trễ mỗi truy vấn index giả lập (giây)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    import main as server
+
+    install_fakes(args.llm_latency, args.search_latency)
+    uvicorn.run(server.app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Load test toàn bộ server: khởi động `main.app` (model/index giả lập, bench/load_app.py) cùng
+mock ctsv và mock TTS (bench/mock_upstreams.py), mỗi thứ một tiến trình, rồi bắn lưu lượng hỗn hợp
+vào /ask, /jobs, /scholarships, /activities/{id} và /tts với số kết nối đồng thời cho trước.
+
+    python -m bench.load_test --concurrency 32 --duration 30
+    python -m bench.load_test --mix ask=1 --concurrency 64 --requests 500 --save ask.json
+    python -m bench.load_test --target http://127.0.0.1:8000 --duration 60   # server đã chạy sẵn
+
+Báo cáo theo từng endpoint: số request, số lỗi, throughput, độ trễ p50/p90/p99/max.
+Mặc định tắt answer cache và retrieval cache để đo trọn đường đi của agent (bật bằng --caches).
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "questions_vi.txt")
+DEFAULT_MIX = "ask=50,jobs=15,scholarships=10,activity=15,tts=10"
+TTS_TEXTS = [
+    "Theo quy chế đào tạo, sinh viên cần tích luỹ đủ 132 tín chỉ để tốt nghiệp.",
+    "Hạn nộp hồ sơ học bổng là ngày 30/09/2025, mỗi suất trị giá 5.000.000 đồng.",
+    "Sinh viên CNTT&TT có thể đăng ký thực tập tại doanh nghiệp từ năm thứ 3.",
+    "Điểm rèn luyện được đánh giá theo 5 tiêu chí, tối đa 100 điểm mỗi học kỳ.",
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Endpoint không hợp lệ trong --mix: {name} (chọn trong {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile theo nearest-rank trên danh sách đã sắp xếp."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values), math.ceil(q / 100 * len(sorted_values))) - 1)
+    return sorted_values[rank]
+
+
+# --- Các loại request ---
+
+class Worker:
+    """Một kết nối ảo: giữ session /ask riêng, đổi phiên sau `turns_per_session` lượt."""
+
+    def __init__(self, rng: random.Random, questions: List[str], turns_per_session: int, activity_ids: range):
+        self.rng = rng
+        self.questions = questions
+        self.turns_per_session = turns_per_session
+        self.activity_ids = activity_ids
+        self.session_id: Optional[str] = None
+        self.turns = 0
+
+    async def ask(self, client: httpx.AsyncClient) -> httpx.Response:
+        if self.turns >= self.turns_per_session:
+            self.session_id, self.turns = None, 0
+        response = await client.post("/ask", json={"question": self.rng.choice(self.questions), "session_id": self.session_id})
+        if response.status_code == 200:
+            self.session_id = response.json().get("session_id")
+            self.turns += 1
+        return response
+
+    async def jobs(self, client: httpx.AsyncClient) -> httpx.Response:
+        params = {"job_type": self.rng.choice(["hot", "new", "internship"])}
+        if self.rng.random() < 0.3:
+            params["city"] = self.rng.choice(["Hà Nội", "Bắc Ninh", "TP Hồ Chí Minh"])
+        return await client.get("/jobs", params=params)
+
+    async def scholarships(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.get("/scholarships")
+
+    async def activity(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.get(f"/activities/{self.rng.choice(self.activity_ids)}")
+
+    async def activities(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.get("/activities")
+
+    async def tts(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post("/tts", json={"text": self.rng.choice(TTS_TEXTS), "speaker_id": 1})
+
+
+ENDPOINTS = ("ask", "jobs", "scholarships", "activity", "activities", "tts")
+
+
+async def run_load(
+    base_url: str,
+    mix: Dict[str, float],
+    concurrency: int,
+    duration_s: Optional[float],
+    total_requests: Optional[int],
+    turns_per_session: int,
+    timeout_s: float,
+    seed: int,
+) -> Dict:
+    from bench.mock_upstreams import ACTIVITY_ID_START, DEFAULT_ACTIVITY_COUNT
+
+    with open(QUESTIONS_PATH, "r", encoding="utf-8") as f:
+        questions = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    activity_ids = range(ACTIVITY_ID_START, ACTIVITY_ID_START + DEFAULT_ACTIVITY_COUNT)
+    names, weights = list(mix), list(mix.values())
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, Dict[str, int]] = {name: {} for name in names}
+    issued = 0
+    started = time.perf_counter()
+    deadline = started + duration_s if duration_s else None
+
+    def next_slot() -> bool:
+        nonlocal issued
+        if deadline is not None and time.perf_counter() >= deadline:
+            return False
+        if total_requests is not None and issued >= total_requests:
+            return False
+        issued += 1
+        return True
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout_s, limits=limits) as client:
+
+        async def worker_loop(index: int):
+            rng = random.Random(seed * 1000 + index)
+            worker = Worker(rng, questions, turns_per_session, activity_ids)
+            while next_slot():
+                name = rng.choices(names, weights)[0]
+                t0 = time.perf_counter()
+                try:
+                    response = await getattr(worker, name)(client)
+                    outcome = None if response.status_code < 400 else str(response.status_code)
+                except httpx.HTTPError as e:
+                    outcome = type(e).__name__
+                latency = time.perf_counter() - t0
+                if outcome is None:
+                    samples[name].append(latency)
+                else:
+                    errors[name][outcome] = errors[name].get(outcome, 0) + 1
+
+        await asyncio.gather(*(worker_loop(i) for i in range(concurrency)))
+    wall_s = time.perf_counter() - started
+    return summarize(samples, errors, wall_s, concurrency)
+
+
+def summarize(samples: Dict[str, List[float]], errors: Dict[str, Dict[str, int]], wall_s: float, concurrency: int) -> Dict:
+    rows = {}
+    all_latencies = []
+    for name, latencies in samples.items():
+        latencies.sort()
+        all_latencies.extend(latencies)
+        rows[name] = _row(latencies, sum(errors[name].values()), wall_s)
+        rows[name]["error_kinds"] = errors[name]
+    all_latencies.sort()
+    total = _row(all_latencies, sum(sum(e.values()) for e in errors.values()), wall_s)
+    return {"wall_s": round(wall_s, 3), "concurrency": concurrency, "endpoints": rows, "total": total}
+
+
+def _row(latencies: List[float], error_count: int, wall_s: float) -> Dict:
+    count = len(latencies)
+    return {
+        "requests": count + error_count,
+        "errors": error_count,
+        "rps": round(count / wall_s, 2) if wall_s else 0.0,
+        "mean_s": round(sum(latencies) / count, 4) if count else 0.0,
+        "p50_s": round(percentile(latencies, 50), 4),
+        "p90_s": round(percentile(latencies, 90), 4),
+        "p99_s": round(percentile(latencies, 99), 4),
+        "max_s": round(latencies[-1], 4) if latencies else 0.0,
+    }
+
+
+def print_report(report: Dict, baseline: Optional[Dict] = None):
+    header = f"{'endpoint':<14}{'req':>7}{'err':>6}{'rps':>9}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("TỔNG", report["total"])]
+    for name, row in rows:
+        line = (
+            f"{name:<14}{row['requests']:>7}{row['errors']:>6}{row['rps']:>9.2f}"
+            f"{row['mean_s']:>9.3f}{row['p50_s']:>9.3f}{row['p90_s']:>9.3f}{row['p99_s']:>9.3f}{row['max_s']:>9.3f}"
+        )
+        old = (baseline or {}).get("endpoints", {}).get(name) if name != "TỔNG" else (baseline or {}).get("total")
+        if old:
+            line += f"   (Δrps {row['rps'] - old['rps']:+.2f}, Δp99 {row['p99_s'] - old['p99_s']:+.3f}s)"
+        print(line)
+    print(f"Thời gian chạy: {report['wall_s']}s, {report['concurrency']} kết nối đồng thời")
+    for name, row in report["endpoints"].items():
+        if row["error_kinds"]:
+            print(f"  Lỗi {name}: {row['error_kinds']}")
+
+
+# --- Khởi động các tiến trình ---
+
+def wait_ready(url: str, process: subprocess.Popen, timeout_s: float = 90):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"Tiến trình {process.args} đã thoát (mã {process.returncode}).")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Hết thời gian chờ {url} sẵn sàng.")
+
+
+def start_stack(args, log_file) -> Tuple[str, List[subprocess.Popen]]:
+    """Khởi động mock ctsv, mock TTS và main.app; trả về (base_url của app, danh sách tiến trình)."""
+    ctsv_port, tts_port, app_port = free_port(), free_port(), free_port()
+    env = dict(os.environ)
+    env.update({
+        "CTSV_BASE_URL": f"http://127.0.0.1:{ctsv_port}",
+        "EXTERNAL_TTS_URL": f"http://127.0.0.1:{tts_port}",
+        "CTSV_PAGE_DELAY_S": str(args.page_delay),
+        "PYTHONUNBUFFERED": "1",
+    })
+    # Không gọi gTTS thật khi mock TTS lỗi; không dùng lại audio đã cache ở lần chạy trước
+    env.setdefault("TTS_GTTS", "0")
+    env.setdefault("AUDIO_CACHE", "0")
+    if not args.caches:
+        env.setdefault("ANSWER_CACHE", "0")
+        env.setdefault("RETRIEVAL_CACHE", "0")
+
+    def spawn(*argv) -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, "-m", *argv], env=env, stdout=log_file, stderr=subprocess.STDOUT)
+
+    processes = [
+        spawn("bench.mock_upstreams", "ctsv", "--port", str(ctsv_port), "--latency", str(args.ctsv_latency)),
+        spawn("bench.mock_upstreams", "tts", "--port", str(tts_port), "--latency", str(args.tts_latency)),
+        spawn("bench.load_app", "--port", str(app_port), "--llm-latency", str(args.llm_latency), "--search-latency", str(args.search_latency)),
+    ]
+    try:
+        wait_ready(f"http://127.0.0.1:{ctsv_port}/health", processes[0])
+        wait_ready(f"http://127.0.0.1:{tts_port}/health", processes[1])
+        wait_ready(f"http://127.0.0.1:{app_port}/jobs/careers", processes[2])
+    except BaseException:
+        stop_stack(processes)
+        raise
+    return f"http://127.0.0.1:{app_port}", processes
+
+
+def stop_stack(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="URL của server đã chạy sẵn (bỏ qua việc khởi động app và mock)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Số kết nối đồng thời")
+    parser.add_argument("--duration", type=float, default=None, help="Thời gian chạy (giây), mặc định 30 nếu không có --requests")
+    parser.add_argument("--requests", type=int, default=None, help="Tổng số request cần gửi")
+    parser.add_argument("--warmup", type=int, default=0, help="Số request khởi động (không tính vào báo cáo)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Trọng số từng endpoint, ví dụ {DEFAULT_MIX}")
+    parser.add_argument("--turns-per-session", type=int, default=3, help="Số lượt /ask trước khi đổi phiên mới")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout mỗi request (giây)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.6)
+    parser.add_argument("--search-latency", type=float, default=0.08)
+    parser.add_argument("--ctsv-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.8)
+    parser.add_argument("--page-delay", type=float, default=0.5, help="CTSV_PAGE_DELAY_S của app (nghỉ giữa các trang khi crawl)")
+    parser.add_argument("--caches", action="store_true", help="Bật answer cache và retrieval cache")
+    parser.add_argument("--log", help="File ghi log của các tiến trình server (mặc định: file tạm)")
+    parser.add_argument("--save", help="Lưu báo cáo ra file JSON")
+    parser.add_argument("--compare", help="So sánh với báo cáo đã lưu")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    duration = args.duration if args.duration or args.requests else 30.0
+    processes: List[subprocess.Popen] = []
+    log_path = args.log or tempfile.mkstemp(prefix="sotay-load-", suffix=".log")[1]
+
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        if args.target:
+            base_url = args.target.rstrip("/")
+        else:
+            print(f"Khởi động app và mock upstream (log: {log_path})...")
+            base_url, processes = start_stack(args, log_file)
+        try:
+            if args.warmup:
+                asyncio.run(run_load(base_url, mix, min(args.concurrency, args.warmup), None, args.warmup, args.turns_per_session, args.timeout, args.seed + 1))
+            report = asyncio.run(run_load(base_url, mix, args.concurrency, duration, args.requests, args.turns_per_session, args.timeout, args.seed))
+        finally:
+            stop_stack(processes)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Microbenchmark cho các hàm thuần Python chạy trên mỗi request:
+preprocess_text (utils.py), parse_job_data/html_to_text (mcp/jobs.py),
+parse_detailed_activity_data (mcp/activities.py), Scholarship.__init__/get_full_info_string/get_summary (mcp/scholarship.py).
+
+Dữ liệu: job_data/*.json (đổi về dạng thô của API), học bổng/hoạt động từ file payload đã ghi
+(--scholarships/--activities, danh sách dict thô của API) hoặc bộ sinh tất định trong bench/mock_upstreams.py.
+
+    python -m bench.micro                                   # in bảng ops/s và bộ nhớ cấp phát
+    python -m bench.micro --save bench/baselines/micro.json # lưu baseline
+    python -m bench.micro --compare bench/baselines/micro.json --tolerance 0.15
+
+Với --compare, thoát mã 1 nếu một case chậm hơn baseline quá `tolerance` (theo ops/s)
+hoặc cấp phát nhiều hơn quá `tolerance` (theo peak bytes mỗi op). Baseline phụ thuộc máy chạy,
+nên lưu và so sánh trên cùng một máy.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Sequence
+
+DEFAULT_MIN_TIME_S = 0.2
+DEFAULT_REPEAT = 5
+
+SHORT_TEXTS = [
+    "Theo quy chế đào tạo, sv cần tích luỹ đủ 132 tín chỉ để tốt nghiệp.",
+    "Hạn nộp hồ sơ học bổng là ngày 30/09/2025, mỗi suất trị giá 5.000.000 đồng.",
+    "Sinh viên CNTT&TT có thể đăng ký thực tập tại doanh nghiệp từ năm thứ 3.",
+    "Điểm rèn luyện được đánh giá theo 5 tiêu chí, tối đa 100 điểm mỗi học kỳ.",
+    "Cơ sở tại TP hcm tuyển 40 kỹ sư, lương 10.000.000 - 15.000.000 VNĐ/tháng.",
+]
+
+
+class Case:
+    """Một hàm cần đo, chạy lần lượt trên tất cả `inputs` (mỗi input là một op)."""
+
+    def __init__(self, name: str, fn: Callable, inputs: Sequence):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+
+    def run_once(self):
+        fn = self.fn
+        for item in self.inputs:
+            fn(item)
+
+
+def load_payload(path: Optional[str], default: Callable[[], List[Dict]]) -> List[Dict]:
+    if not path:
+        return default()
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def long_answers(raw_jobs: List[Dict], count: int = 20) -> List[str]:
+    """Câu trả lời dài kiểu RAG: ghép mô tả/yêu cầu/quyền lợi của tin tuyển dụng ở dạng văn bản."""
+    from mcp.jobs import html_to_text
+
+    answers = []
+    for job in raw_jobs[:count]:
+        parts = [job.get("Title") or "", html_to_text(job.get("WorkDescription")), html_to_text(job.get("WorkRequire")), html_to_text(job.get("Benefit"))]
+        answers.append(f"Hạn nộp: {str(job.get('Deadline') or '')[:10]}. " + "\n".join(p for p in parts if p))
+    return answers
+
+
+def build_cases(scholarships_path: Optional[str] = None, activities_path: Optional[str] = None) -> List[Case]:
+    from bench.mock_upstreams import load_raw_jobs, make_activities, make_scholarships
+    from mcp.activities import parse_detailed_activity_data
+    from mcp.jobs import html_to_text, parse_job_data
+    from mcp.scholarship import Scholarship
+    from utils import preprocess_text
+
+    raw_jobs = [job for jobs in load_raw_jobs().values() for job in jobs]
+    scholarships = load_payload(scholarships_path, make_scholarships)
+    activities = load_payload(activities_path, make_activities)
+    html_fields = [job[key] for job in raw_jobs for key in ("WorkDescription", "WorkRequire", "Benefit") if job.get(key)]
+
+    return [
+        Case("preprocess_text[short]", preprocess_text, SHORT_TEXTS),
+        Case("preprocess_text[long]", preprocess_text, long_answers(raw_jobs)),
+        Case("jobs.html_to_text", html_to_text, html_fields),
+        Case("parse_job_data", parse_job_data, raw_jobs),
+        Case("parse_detailed_activity_data", parse_detailed_activity_data, activities),
+        Case("Scholarship.__init__", Scholarship, scholarships),
+        # Nội dung HTML được chuyển sang văn bản khi dùng lần đầu, nên đo trên đối tượng mới tạo
+        Case("Scholarship.get_full_info_string", lambda data: Scholarship(data).get_full_info_string(), scholarships),
+        Case("Scholarship.get_summary", lambda data: Scholarship(data).get_summary(), scholarships),
+    ]
+
+
+def time_case(case: Case, min_time_s: float, repeat: int) -> float:
+    """Trả về ops/s tốt nhất qua `repeat` lần đo, mỗi lần chạy đủ lâu ít nhất `min_time_s`."""
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            case.run_once()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time_s:
+            break
+        loops *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(loops):
+            case.run_once()
+        best = min(best, time.perf_counter() - started)
+    return loops * len(case.inputs) / best
+
+
+def measure_allocations(case: Case) -> Dict[str, float]:
+    """
+    Đo bằng tracemalloc: peak bytes trung bình của một op (bộ nhớ tạm cấp phát trong lúc chạy)
+    và số block cấp phát trung bình mỗi op (theo snapshot, chưa trừ block đã giải phóng).
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peaks = []
+        for item in case.inputs:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            case.fn(item)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+        before = tracemalloc.take_snapshot()
+        case.run_once()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    new_blocks = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "filename"))
+    return {
+        "peak_bytes_per_op": sum(peaks) / len(peaks),
+        "retained_blocks_per_op": new_blocks / len(case.inputs),
+    }
+
+
+def run_cases(cases: List[Case], min_time_s: float, repeat: int, only: Optional[str] = None) -> Dict[str, Dict]:
+    results = {}
+    # preprocess_text và Scholarship in ra console; bỏ output để không đo I/O của terminal
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for case in cases:
+            if only and only not in case.name:
+                continue
+            case.run_once()  # khởi động: regex cache, import lười...
+            results[case.name] = {
+                "ops_per_s": time_case(case, min_time_s, repeat),
+                **measure_allocations(case),
+                "inputs": len(case.inputs),
+            }
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Danh sách các case bị chậm đi/cấp phát nhiều hơn baseline quá `tolerance`."""
+    regressions = []
+    for name, row in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        if row["ops_per_s"] < old["ops_per_s"] * (1 - tolerance):
+            regressions.append(f"{name}: ops/s {old['ops_per_s']:.0f} -> {row['ops_per_s']:.0f}")
+        if row["peak_bytes_per_op"] > old["peak_bytes_per_op"] * (1 + tolerance) + 64:
+            regressions.append(f"{name}: peak bytes/op {old['peak_bytes_per_op']:.0f} -> {row['peak_bytes_per_op']:.0f}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict], baseline: Optional[Dict[str, Dict]] = None):
+    header = f"{'case':<36}{'ops/s':>12}{'µs/op':>10}{'peak B/op':>12}{'blocks/op':>11}"
+    print(header)
+    print("-" * len(header))
+    for name, row in results.items():
+        line = f"{name:<36}{row['ops_per_s']:>12.0f}{1e6 / row['ops_per_s']:>10.1f}{row['peak_bytes_per_op']:>12.0f}{row['retained_blocks_per_op']:>11.1f}"
+        old = (baseline or {}).get(name)
+        if old:
+            line += f"   ({row['ops_per_s'] / old['ops_per_s'] - 1:+.1%} ops/s, {row['peak_bytes_per_op'] - old['peak_bytes_per_op']:+.0f} B/op)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scholarships", help="File JSON payload học bổng đã ghi (danh sách dict thô của API)")
+    parser.add_argument("--activities", help="File JSON payload hoạt động đã ghi (danh sách dict thô của API)")
+    parser.add_argument("--only", help="Chỉ chạy các case có tên chứa chuỗi này")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME_S, help="Thời gian tối thiểu mỗi lần đo (giây)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Số lần đo, lấy lần nhanh nhất")
+    parser.add_argument("--save", help="Lưu kết quả làm baseline")
+    parser.add_argument("--compare", help="So sánh với baseline, thoát mã 1 nếu có regression")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Mức chênh lệch cho phép so với baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    results = run_cases(build_cases(args.scholarships, args.activities), args.min_time, args.repeat, args.only)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=1)
+        print(f"Đã lưu baseline: {args.save}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nREGRESSION (vượt {args.tolerance:.0%} so với baseline):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nKhông có regression (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Các dịch vụ ngoài giả lập cho load test: API ctsv (việc làm, học bổng, hoạt động) và server TTS.
+
+- ctsv: phục vụ job_data/*.json (đổi ngược về khoá thô của API), cùng bộ học bổng/hoạt động
+  sinh tất định. Phân trang theo NumberRow/PageNumber giống API thật.
+- TTS: trả về file WAV im lặng, độ dài tỉ lệ với số ký tự, sau `latency_s` giây;
+  có thể giả lập chậm/lỗi/tắt qua POST /control (xem create_tts_app).
+
+Chạy riêng từng server (bench/load_test.py tự khởi động cả hai):
+    python -m bench.mock_upstreams ctsv --port 8101 --latency 0.05
+    python -m bench.mock_upstreams tts --port 8102 --latency 0.8
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import wave
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from fastapi import FastAPI, Request, Response
+
+JOB_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "job_data")
+# PublishLocation của API ctsv -> file dữ liệu đã crawl
+JOB_FILES = {
+    1: "hust_hot_jobs_clean.json",
+    2: "hust_new_jobs_clean.json",
+    3: "hust_intern_jobs_clean.json",
+}
+# Khoá đã làm sạch (mcp/jobs.py: parse_job_data) -> khoá thô của API
+RAW_JOB_KEYS = {
+    "title": "Title",
+    "company_name": "CompanyName",
+    "salary": "AmountType",
+    "deadline": "Deadline",
+    "location": "WorkAddress",
+    "work_type": "WorkType",
+    "experience_required": "WorkExperience",
+    "majors_required": "CareerRequire",
+    "positions_available": "QuantityCandidate",
+    "description": "WorkDescription",
+    "requirements": "WorkRequire",
+    "benefits": "Benefit",
+    "contact_name": "ContactName",
+    "contact_email": "ContactEmail",
+    "contact_phone": "ContactPhone",
+}
+ACTIVITY_ID_START = 14000
+DEFAULT_ACTIVITY_COUNT = 300
+DEFAULT_SCHOLARSHIP_COUNT = 40
+
+
+def load_raw_jobs() -> Dict[int, List[Dict]]:
+    """Đọc job_data/*.json và đổi về dạng thô của API, gán DocumentId tăng dần."""
+    jobs_by_location = {}
+    next_id = 1
+    for location, filename in JOB_FILES.items():
+        with open(os.path.join(JOB_DATA_DIR, filename), "r", encoding="utf-8") as f:
+            clean_jobs = json.load(f)
+        raw_jobs = []
+        for job in clean_jobs:
+            raw = {raw_key: job.get(clean_key) for clean_key, raw_key in RAW_JOB_KEYS.items()}
+            raw["DocumentId"] = job.get("document_id") or next_id
+            next_id += 1
+            raw_jobs.append(raw)
+        jobs_by_location[location] = raw_jobs
+    return jobs_by_location
+
+
+def make_scholarships(count: int = DEFAULT_SCHOLARSHIP_COUNT) -> List[Dict]:
+    """Sinh danh sách học bổng thô (khoá giống GetApprovedScholarship), nửa còn hạn nửa hết hạn."""
+    now = datetime.now().replace(microsecond=0)
+    scholarships = []
+    for i in range(count):
+        deadline = now + timedelta(days=30 - 2 * i)
+        paragraphs = "".join(
+            f"<p>Điều kiện {k + 1}: sinh viên có điểm trung bình tích luỹ từ {2.5 + k * 0.2:.1f} trở lên, "
+            f"không bị kỷ luật trong năm học.</p>"
+            for k in range(6)
+        )
+        scholarships.append({
+            "DocumentId": 5000 + i,
+            "Title": f"Học bổng tài trợ số {i + 1} năm học 2025-2026",
+            "Deadline": deadline.strftime("%Y-%m-%d %H:%M:%S"),
+            "TotalPrice": f"{(i % 5 + 1) * 5}.000.000 VNĐ/suất",
+            "Description": f"Học bổng do doanh nghiệp đối tác số {i + 1} tài trợ.",
+            "Content": f"<div><h3>Thông tin học bổng</h3>{paragraphs}<ul><li>Hồ sơ: đơn đăng ký</li><li>Bảng điểm</li></ul></div>",
+            "Quantity": i % 10 + 1,
+            "TypeInfo": "Học bổng tài trợ",
+            "ContactEmail": f"hocbong{i + 1}@hust.edu.vn",
+            "CreateMail": "ctsv@hust.edu.vn",
+        })
+    return scholarships
+
+
+def make_activities(count: int = DEFAULT_ACTIVITY_COUNT) -> List[Dict]:
+    """Sinh danh sách hoạt động thô (khoá giống GetPublishActivity/GetActivityById)."""
+    start = datetime(2025, 9, 1, 8, 0, 0)
+    activities = []
+    for i in range(count):
+        begin = start + timedelta(days=i % 90, hours=i % 8)
+        activities.append({
+            "AId": ACTIVITY_ID_START + i,
+            "AName": f"Hoạt động tình nguyện số {i + 1}",
+            "GName": f"Đoàn Thanh niên khoa {i % 12 + 1}",
+            "AType": ["Tình nguyện", "Học thuật", "Văn nghệ", "Thể thao"][i % 4],
+            "StartTime": begin.strftime("%Y-%m-%dT%H:%M:%S"),
+            "FinishTime": (begin + timedelta(hours=4)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "Deadline": (begin - timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%S"),
+            "Avatar": f"Upload/Activity/{ACTIVITY_ID_START + i}.jpg",
+            "APlace": f"Hội trường C{i % 3 + 1}",
+            "ADesc": "<p>Mô tả hoạt động.</p>" + "".join(f"<p>Nội dung phần {k + 1} của hoạt động.</p>" for k in range(8)),
+            "CriteriaLst": [
+                {"CName": "Ý thức tham gia hoạt động chính trị, xã hội", "CMaxPoint": 5},
+                {"CName": "Ý thức công dân trong quan hệ cộng đồng", "CMaxPoint": 3},
+            ],
+        })
+    return activities
+
+
+def _page(items: List[Dict], payload: Dict) -> List[Dict]:
+    size = int(payload.get("NumberRow") or 20)
+    page = int(payload.get("PageNumber") or 1)
+    return items[(page - 1) * size: page * size]
+
+
+def create_ctsv_app(latency_s: float = 0.05) -> FastAPI:
+    """API ctsv giả lập; mỗi request chờ `latency_s` giây trước khi trả lời."""
+    app = FastAPI(title="mock ctsv")
+    jobs = load_raw_jobs()
+    scholarships = make_scholarships()
+    activities = make_activities()
+    activities_by_id = {a["AId"]: a for a in activities}
+    # Danh sách hoạt động chỉ gồm các trường tóm tắt, giống API thật
+    summary_keys = ("AId", "AName", "GName", "AType", "StartTime", "Avatar")
+    activity_summaries = [{k: a[k] for k in summary_keys} for a in activities]
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    @app.post("/api-t/HWRecruitment/GetPublishRecruitment")
+    async def get_publish_recruitment(request: Request):
+        payload = await request.json()
+        await asyncio.sleep(latency_s)
+        return {"RecruitmentLst": _page(jobs.get(int(payload.get("PublishLocation") or 1), []), payload)}
+
+    @app.post("/api-t/HWScholarship/GetApprovedScholarship")
+    async def get_approved_scholarship():
+        await asyncio.sleep(latency_s)
+        return {"ScholarshipLst": scholarships}
+
+    @app.post("/api-t/Activity/GetPublishActivity")
+    async def get_publish_activity(request: Request):
+        payload = await request.json()
+        await asyncio.sleep(latency_s)
+        return {"Activities": _page(activity_summaries, payload)}
+
+    @app.post("/api-t/Activity/GetActivityById")
+    async def get_activity_by_id(request: Request):
+        payload = await request.json()
+        await asyncio.sleep(latency_s)
+        activity = activities_by_id.get(int(payload.get("AId") or 0))
+        return {"Activities": [activity] if activity else []}
+
+    return app
+
+
+def silent_wav(duration_s: float, sample_rate: int = 22050) -> bytes:
+    """WAV mono 16-bit toàn im lặng."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x00\x00" * int(duration_s * sample_rate))
+    return buffer.getvalue()
+
+
+def create_tts_app(latency_s: float = 0.8, seconds_per_char: float = 0.06, sample_rate: int = 22050, failure_rate: float = 0.0) -> FastAPI:
+    """
+    Server TTS giả lập, cùng giao diện POST /tts {text, speaker_id} với dịch vụ thật.
+    Giả lập sự cố (cho kiểm tra circuit breaker/hedging của /tts) qua POST /control
+    {"latency_s": .., "failure_rate": .., "down": true/false}: `down` làm /health và /tts trả 503,
+    `failure_rate` làm một phần request /tts trả 500.
+    """
+    app = FastAPI(title="mock tts")
+    state = {"latency_s": latency_s, "failure_rate": failure_rate, "down": False, "requests": 0}
+    rng = random.Random(0)
+
+    @app.get("/health")
+    async def health():
+        if state["down"]:
+            return Response(status_code=503)
+        return {"ok": True}
+
+    @app.post("/control")
+    async def control(request: Request):
+        state.update({key: value for key, value in (await request.json()).items() if key in ("latency_s", "failure_rate", "down")})
+        return state
+
+    @app.post("/tts")
+    async def tts(request: Request):
+        state["requests"] += 1
+        if state["down"]:
+            return Response(status_code=503)
+        payload = await request.json()
+        text = payload.get("text") or ""
+        await asyncio.sleep(state["latency_s"])
+        if rng.random() < state["failure_rate"]:
+            return Response(status_code=500)
+        return Response(content=silent_wav(len(text) * seconds_per_char, sample_rate), media_type="audio/wav")
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("service", choices=["ctsv", "tts"])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--latency", type=float, default=None, help="Độ trễ mỗi request (giây)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="TTS: tỉ lệ request trả lỗi 500")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    if args.service == "ctsv":
+        app = create_ctsv_app(0.05 if args.latency is None else args.latency)
+    else:
+        app = create_tts_app(0.8 if args.latency is None else args.latency, failure_rate=args.failure_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Kiểm tra và đo utils.preprocess_text (VietnameseNormalizer) so với bản cũ (bench/legacy_preprocess.py).
+
+    python -m bench.normalizer                 # kiểm tra kết quả giống hệt + đo tốc độ
+    python -m bench.normalizer --fuzz 50000    # tăng số chuỗi sinh ngẫu nhiên
+
+1. Tương đương: chạy cả hai bản trên văn bản tin tuyển dụng (job_data), học bổng, hoạt động
+   và các chuỗi ngẫu nhiên ghép từ những mẩu khó (ngày không hợp lệ, số có dấu phân cách, "lẽ", '&', '/'...).
+   Thoát mã 1 nếu có chuỗi cho kết quả khác nhau.
+2. Tốc độ: ops/s trên câu trả lời ngắn, câu trả lời dài và theo lô (preprocess_texts).
+"""
+import argparse
+import random
+import sys
+from typing import List
+
+from bench.legacy_preprocess import legacy_preprocess_text
+from bench.micro import SHORT_TEXTS, Case, long_answers, time_case
+
+FUZZ_PIECES = [
+    "sv", "SV", "Sv", "hcm", "HCM", "CNTT&TT", "cntt&tt", "svx", "xsv", "sv1",
+    "12/05/2023", "6/3/1956", "32/13/2023", "29/02/2023", "29/02/2024", "1.12/05/2023", "12/05/20231",
+    "0", "06", "105", "2005", "2.005", "200.000", "1,5", "3.", "10.000.000-15.000.000", "0936841368",
+    "lẽ", "l", "ẽ", "&", "/", ".", ",", "a", "Đ", "năm", "ngày", "-", "(", ")", "ſv", "\u212a", "٣",
+    # Khoảng trắng Unicode: kiểm tra gộp khoảng trắng bằng str.split() so với regex \s+
+    " ", "  ", "\n", "\t", "\r\n", "\xa0", "\u2028", "\u3000", "\x1c", "\x85", "\u200b",
+]
+
+
+def fuzz_texts(count: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return ["".join(rng.choice(FUZZ_PIECES) for _ in range(rng.randint(1, 25))) for _ in range(count)]
+
+
+def corpus_texts() -> List[str]:
+    from bench.mock_upstreams import load_raw_jobs, make_activities, make_scholarships
+    from mcp.activities import parse_detailed_activity_data
+    from mcp.jobs import html_to_text, parse_job_data
+    from mcp.scholarship import Scholarship
+
+    texts = list(SHORT_TEXTS)
+    raw_jobs = [job for jobs in load_raw_jobs().values() for job in jobs]
+    for job in map(parse_job_data, raw_jobs):
+        texts.extend(str(job[key]) for key in ("title", "salary", "deadline", "location", "positions_available"))
+        texts.extend(html_to_text(job[key]) for key in ("description", "requirements", "benefits"))
+    texts.extend(Scholarship(data).get_full_info_string() for data in make_scholarships())
+    texts.extend(parse_detailed_activity_data(data)["description"] for data in make_activities())
+    texts.extend(long_answers(raw_jobs))
+    return texts
+
+
+def check_equivalence(texts: List[str]) -> List[str]:
+    from utils import preprocess_text
+
+    mismatches = []
+    for text in texts:
+        expected, actual = legacy_preprocess_text(text), preprocess_text(text)
+        if expected != actual:
+            mismatches.append(f"{text!r}\n    cũ:  {expected!r}\n    mới: {actual!r}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fuzz", type=int, default=20000, help="Số chuỗi sinh ngẫu nhiên để kiểm tra")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    from bench.mock_upstreams import load_raw_jobs
+    from utils import preprocess_text, preprocess_texts
+
+    corpus = corpus_texts()
+    mismatches = check_equivalence(corpus + fuzz_texts(args.fuzz, args.seed))
+    print(f"Tương đương: {len(corpus)} văn bản thật + {args.fuzz} chuỗi ngẫu nhiên, {len(mismatches)} khác biệt")
+    for line in mismatches[:10]:
+        print(f"  {line}")
+
+    raw_jobs = [job for jobs in load_raw_jobs().values() for job in jobs]
+    long_texts = long_answers(raw_jobs)
+    header = f"{'case':<28}{'cũ ops/s':>12}{'mới ops/s':>12}{'tăng tốc':>10}"
+    print(f"\n{header}\n{'-' * len(header)}")
+    for name, texts in (("câu ngắn", SHORT_TEXTS), ("câu trả lời dài", long_texts)):
+        old = time_case(Case(name, legacy_preprocess_text, texts), args.min_time, args.repeat)
+        new = time_case(Case(name, preprocess_text, texts), args.min_time, args.repeat)
+        print(f"{name:<28}{old:>12.0f}{new:>12.0f}{new / old:>9.1f}x")
+    # Theo lô: mỗi op là cả danh sách câu trả lời dài
+    old = time_case(Case("lô", lambda batch: [legacy_preprocess_text(t) for t in batch], [long_texts]), args.min_time, args.repeat)
+    new = time_case(Case("lô", preprocess_texts, [long_texts]), args.min_time, args.repeat)
+    print(f"{f'lô {len(long_texts)} câu dài':<28}{old:>12.1f}{new:>12.1f}{new / old:>9.1f}x")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
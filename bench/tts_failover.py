@@ -0,0 +1,156 @@
+"""
+Kịch bản kiểm tra chọn backend TTS (mcp/tts_backends.py) với hai server TTS giả lập (bench/mock_upstreams.py):
+backend chính "primary" và backend dự phòng "secondary".
+
+    python -m bench.tts_failover
+    python -m bench.tts_failover --requests 20 --hedge-after 0.3
+
+Các pha, mỗi pha gửi `--requests` request lần lượt qua TTSRegistry:
+1. bình thường: mọi request do primary trả lời;
+2. primary chậm (--slow-latency): sau `--hedge-after` giây gọi thêm secondary, secondary thắng;
+3. primary tắt (503): vài request đầu chuyển ngay sang secondary, sau đó circuit breaker mở
+   và primary không còn bị gọi;
+4. primary hồi phục: một lượt health probe đóng breaker, primary trả lời trở lại.
+
+In bảng theo pha (backend thắng, p50/max độ trễ, số request tới primary) và thoát mã 1 nếu
+một kỳ vọng không đạt.
+"""
+import argparse
+import asyncio
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+import httpx
+
+from bench.load_test import free_port, percentile, stop_stack, wait_ready
+from mcp.tts_backends import CircuitBreaker, HttpTTSBackend, TTSClient, TTSError, TTSRegistry
+
+TEXT = "Sinh viên năm ba đăng ký học bổng trước ngày ba mươi tháng Chín."
+
+
+async def control(url: str, **state) -> Dict:
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{url}/control", json=state)
+        return response.json()
+
+
+async def run_phase(registry: TTSRegistry, primary_url: str, requests: int) -> Dict:
+    primary_before = (await control(primary_url))["requests"]
+    winners: Dict[str, int] = {}
+    latencies: List[float] = []
+    errors = 0
+    for _ in range(requests):
+        started = time.perf_counter()
+        try:
+            backend, _ = await registry.synthesize(TEXT, 1)
+            winners[backend.name] = winners.get(backend.name, 0) + 1
+        except TTSError:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+    # Chờ các request bị huỷ (hedge) tới server trước khi đếm
+    await asyncio.sleep(0.05)
+    latencies.sort()
+    return {
+        "winners": winners,
+        "errors": errors,
+        "p50_s": percentile(latencies, 50),
+        "max_s": latencies[-1],
+        "primary_requests": (await control(primary_url))["requests"] - primary_before,
+        "primary_state": registry.get("primary").breaker.state,
+    }
+
+
+async def run_scenario(primary_url: str, secondary_url: str, args) -> List[str]:
+    client = TTSClient()
+    registry = TTSRegistry(
+        [
+            HttpTTSBackend("primary", primary_url, client, timeout_s=10, breaker=CircuitBreaker(args.failures, cooldown_s=300)),
+            HttpTTSBackend("secondary", secondary_url, client, timeout_s=10, breaker=CircuitBreaker(args.failures, cooldown_s=300)),
+        ],
+        hedge_after_s=args.hedge_after,
+        client=client,
+    )
+    failures: List[str] = []
+
+    def check(ok: bool, message: str):
+        print(f"    {'OK ' if ok else 'LỖI'} {message}")
+        if not ok:
+            failures.append(message)
+
+    header = f"{'pha':<22}{'primary':>9}{'secondary':>11}{'lỗi':>6}{'p50 s':>8}{'max s':>8}{'gọi primary':>13}  breaker"
+    print(header)
+    print("-" * len(header))
+
+    def report(name: str, row: Dict):
+        print(f"{name:<22}{row['winners'].get('primary', 0):>9}{row['winners'].get('secondary', 0):>11}{row['errors']:>6}"
+              f"{row['p50_s']:>8.3f}{row['max_s']:>8.3f}{row['primary_requests']:>13}  {row['primary_state']}")
+
+    try:
+        await control(primary_url, latency_s=args.latency, down=False)
+        await control(secondary_url, latency_s=args.latency, down=False)
+        await registry.probe_all()
+
+        row = await run_phase(registry, primary_url, args.requests)
+        report("1. bình thường", row)
+        check(row["winners"].get("primary", 0) == args.requests, "primary trả lời mọi request khi khoẻ")
+
+        await control(primary_url, latency_s=args.slow_latency)
+        row = await run_phase(registry, primary_url, args.requests)
+        report("2. primary chậm", row)
+        check(row["winners"].get("secondary", 0) == args.requests, "hedge: secondary thắng khi primary chậm")
+        check(row["p50_s"] < args.hedge_after + args.latency + 0.5, f"p50 ~ hedge_after + độ trễ secondary (< {args.hedge_after + args.latency + 0.5:.2f}s)")
+
+        await control(primary_url, latency_s=args.latency, down=True)
+        row = await run_phase(registry, primary_url, args.requests)
+        report("3. primary tắt", row)
+        check(row["errors"] == 0, "không request nào lỗi khi primary tắt")
+        check(row["primary_requests"] <= args.failures, f"breaker mở sau {args.failures} lỗi liên tiếp, primary không còn bị gọi")
+        check(row["primary_state"] == CircuitBreaker.OPEN, "breaker của primary đang mở")
+
+        await control(primary_url, down=False)
+        await registry.probe_all()
+        row = await run_phase(registry, primary_url, args.requests)
+        report("4. primary hồi phục", row)
+        check(row["winners"].get("primary", 0) == args.requests, "health probe đóng breaker, primary trả lời trở lại")
+
+        print(f"\n{'backend':<12}{'requests':>9}{'errors':>8}{'huỷ':>6}{'error rate':>12}{'avg s':>8}{'mở breaker':>12}")
+        for backend in registry.stats()["backends"]:
+            avg = f"{backend['avg_latency_s']:.3f}" if backend["avg_latency_s"] is not None else "-"
+            print(f"{backend['name']:<12}{backend['requests']:>9}{backend['errors']:>8}{backend['cancelled']:>6}"
+                  f"{backend['error_rate']:>12.2%}{avg:>8}{backend['circuit_opened']:>12}")
+        print(f"hedge: {registry.hedges} lần, backend dự phòng thắng {registry.hedge_wins} lần")
+    finally:
+        await registry.aclose()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=10, help="Số request mỗi pha")
+    parser.add_argument("--latency", type=float, default=0.05, help="Độ trễ bình thường của server giả lập (giây)")
+    parser.add_argument("--slow-latency", type=float, default=2.0, help="Độ trễ của primary ở pha 'chậm' (giây)")
+    parser.add_argument("--hedge-after", type=float, default=0.3)
+    parser.add_argument("--failures", type=int, default=3, help="Số lỗi liên tiếp để mở circuit breaker")
+    args = parser.parse_args()
+
+    ports = [free_port(), free_port()]
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "bench.mock_upstreams", "tts", "--port", str(port), "--latency", str(args.latency)],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        for port in ports
+    ]
+    try:
+        urls = [f"http://127.0.0.1:{port}" for port in ports]
+        for url, process in zip(urls, processes):
+            wait_ready(f"{url}/health", process)
+        failures = asyncio.run(run_scenario(urls[0], urls[1], args))
+    finally:
+        stop_stack(processes)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,118 @@
-from mcp.scholarship import *
-from mcp.rag import *
-from mcp.jobs import *
-from mcp.activities import *
+from mcp.scholarship import crawl_all_scholarships
+from mcp.rag import acompact_history, aget_response, answer_cache, astream_response
+from mcp.jobs import CAREER_MAP, CAREER_MAP_LOWER, VIETNAM_CITIES, fetch_jobs
+from mcp.job_snapshot import get_snapshot
+from mcp.activities import fetch_activities, fetch_activity_details
+from mcp.budget import RunBudget, DEFAULT_TIME_BUDGET_S, DEFAULT_MAX_TOOL_ROUNDS
+from mcp.session_store import SessionConflictError, create_session_store
+from mcp.session_guard import SessionCoordinator, make_dedup_key
+from mcp.batch import BatchItem, DEFAULT_CONCURRENCY, MAX_QUESTIONS as BATCH_MAX_QUESTIONS, messages_from_dicts, run_batch
+from mcp.audio_cache import AUDIO_CACHE_ENABLED, AudioCache, AudioEntry
+from mcp.tts_stream import TTS_CHUNKED, finalize_wav, parse_wav, split_sentences, synthesize_in_order
+from mcp.audio_format import AudioFormatError, OutputSpec, Transcoder, resolve_output, transcode_bytes
+from mcp import audio_format
+from mcp.tts_backends import TTSBackend, TTSError, create_tts_registry
+from mcp import metrics, rag, startup
 from utils import preprocess_text
-import gtts
-from fastapi import FastAPI, HTTPException, Query, Response
+from fastapi import BackgroundTasks, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from enum import Enum
-import io
+import json
+import time
 import uuid # Thêm thư viện uuid để tạo session id
-from typing import List, Dict, Optional 
+from typing import List, Dict, Optional, Tuple
 from langchain_core.messages import BaseMessage
+from contextlib import asynccontextmanager
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Model, graph và client Pinecone/Tavily được tạo khi dùng lần đầu; prewarm tạo trước trong thread nền
+    # để server nhận request ngay (/jobs, /activities không cần chờ LLM) mà lượt /ask đầu vẫn nhanh.
+    if startup.PREWARM_ENABLED:
+        startup.start_prewarm()
+    tts_registry.start_probes()
+    yield
+    await tts_registry.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # --- BỘ NHỚ LƯU TRỮ CÁC PHIÊN HỘI THOẠI (SESSION STORE) ---
-# Đây là một giải pháp đơn giản dùng dictionary.
-# Dữ liệu sẽ bị mất khi khởi động lại server.
+# Mặc định dùng SQLite (SESSION_STORE=sqlite): còn dữ liệu sau khi khởi động lại
+# và dùng chung được giữa nhiều worker uvicorn. SESSION_STORE=memory dùng LRU + TTL trong bộ nhớ.
 # Key: session_id (str), Value: list of BaseMessage
-conversation_histories: Dict[str, List[BaseMessage]] = {}
+session_store = create_session_store()
+# Xếp hàng các lượt của cùng một phiên và gộp các yêu cầu gửi trùng (double-tap)
+session_coordinator = SessionCoordinator()
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Ghi thời gian xử lý mỗi request theo route (với response streaming: tính tới khi gửi header)."""
+    started = time.perf_counter()
+    status = "500"
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            # Dùng mẫu route (/activities/{activity_id}) để số nhãn không tăng theo id
+            route=route.path if route is not None else "unmatched",
+            status=status,
+        )
+
+
+def collect_state_metrics():
+    """Số liệu lấy tại thời điểm /metrics được gọi: cache (câu trả lời, search, audio TTS), session store, chống gửi trùng, model cascade."""
+    from mcp.tools import retrieval_cache
+
+    if answer_cache is not None:
+        stats = answer_cache.stats()
+        yield "answer_cache_entries", "Số câu trả lời đang được cache.", "gauge", [({}, stats["entries"])]
+        yield "answer_cache_lookups_total", "Số lần tra answer cache.", "counter", [({}, stats["lookups"])]
+        yield "answer_cache_hits_total", "Số lần trúng answer cache.", "counter", [
+            ({"match": "exact"}, stats["exact_hits"]),
+            ({"match": "semantic"}, stats["semantic_hits"]),
+        ]
+        yield "answer_cache_latency_saved_seconds_total", "Tổng thời gian tiết kiệm được nhờ answer cache.", "counter", [({}, stats["latency_saved_s"])]
+    if retrieval_cache is not None:
+        stats = retrieval_cache.stats()
+        yield "retrieval_cache_entries", "Số kết quả search đang được cache.", "gauge", [({}, stats["entries"])]
+        yield "retrieval_cache_requests_total", "Số lần tra retrieval cache.", "counter", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "miss"}, stats["misses"]),
+            ({"result": "shared_inflight"}, stats["shared_inflight"]),
+        ]
+    if audio_cache is not None:
+        stats = audio_cache.stats()
+        yield "tts_audio_cache_bytes", "Dung lượng audio TTS đang cache trên đĩa.", "gauge", [({}, stats["bytes"])]
+        yield "tts_audio_cache_requests_total", "Số lần tra cache audio TTS.", "counter", [
+            ({"result": "hit"}, stats["hits"]),
+            ({"result": "miss"}, stats["misses"]),
+        ]
+        yield "tts_audio_cache_bytes_saved_total", "Tổng số byte audio phục vụ từ cache thay vì tổng hợp lại.", "counter", [({}, stats["bytes_saved"])]
+        yield "tts_audio_cache_evictions_total", "Số file audio bị loại bỏ do vượt dung lượng.", "counter", [({}, stats["evictions"])]
+    stats = session_store.stats()
+    yield "session_store_sessions", "Số phiên hội thoại đang lưu.", "gauge", [({"backend": stats["backend"]}, stats["sessions"])]
+    yield "session_store_bytes", "Dung lượng lịch sử hội thoại đang lưu.", "gauge", [({"backend": stats["backend"]}, stats["bytes"])]
+    yield "session_store_evictions_total", "Số phiên bị loại bỏ do vượt giới hạn.", "counter", [({"backend": stats["backend"]}, stats["evictions"])]
+    yield "deduplicated_requests_total", "Số yêu cầu gửi trùng được gộp.", "counter", [({}, session_coordinator.deduplicated)]
+    # Không ép khởi tạo model chỉ để xuất số liệu
+    if rag.is_llm_ready():
+        yield "cascade_escalations_total", "Số lần chuyển từ một tầng model lên tầng mạnh hơn.", "counter", [
+            ({"model": tier["name"]}, tier["escalated"]) for tier in rag.get_cascade().stats()["tiers"]
+        ]
+
+
+metrics.register_collector(collect_state_metrics)
+metrics.register_collector(startup.collect_metrics)
 
 # Cho phép CORS để frontend có thể truy cập API
 app.add_middleware(
@@ -35,11 +127,107 @@ class QuestionRequest(BaseModel):
     question: str
     # Client sẽ gửi kèm session_id để duy trì cuộc hội thoại
     session_id: Optional[str] = None
+    # Ngân sách cho lần chạy agent; client chỉ được giảm, không được vượt mức mặc định của server
+    time_budget_s: Optional[float] = None
+    max_tool_rounds: Optional[int] = None
+    # Khoá chống gửi trùng (cũng có thể gửi qua header Idempotency-Key)
+    idempotency_key: Optional[str] = None
+    # Trả về dạng server-sent events (progress / token / done) thay vì một JSON
+    stream: bool = False
 
 class AnswerResponse(BaseModel):
     answer: str
     # Server sẽ trả về session_id để client dùng cho lần gọi tiếp theo
     session_id: str
+    # Mức sử dụng ngân sách (thời gian, số vòng tool, tool bị huỷ...)
+    budget: Optional[dict] = None
+    # Số token của lượt này (prompt/completion/lịch sử) để theo dõi độ dài prompt theo thời gian
+    usage: Optional[dict] = None
+
+
+def make_budget(time_budget_s: Optional[float] = None, max_tool_rounds: Optional[int] = None) -> RunBudget:
+    """Tạo RunBudget từ tham số client, kẹp trong giới hạn mặc định của server."""
+    if time_budget_s is not None:
+        time_budget_s = min(max(time_budget_s, 1.0), DEFAULT_TIME_BUDGET_S)
+    if max_tool_rounds is not None:
+        max_tool_rounds = min(max(max_tool_rounds, 0), DEFAULT_MAX_TOOL_ROUNDS)
+    return RunBudget(time_budget_s=time_budget_s, max_tool_rounds=max_tool_rounds)
+
+
+async def compact_session(session_id: str, snapshot: List[BaseMessage]):
+    """
+    Chạy nền sau khi đã trả lời: tóm tắt các lượt cũ của phiên.
+    Chỉ ghi đè nếu lịch sử chưa bị thay đổi ở phần đã tóm tắt (tránh làm mất lượt mới chen vào).
+    """
+    try:
+        compacted = await acompact_history(snapshot)
+        if compacted is snapshot:
+            return
+        async with session_coordinator.session_lock(session_id):
+            current, version = await run_in_threadpool(session_store.load, session_id)
+            if current is None or current[:len(snapshot)] != snapshot:
+                return
+            await run_in_threadpool(session_store.set, session_id, compacted + current[len(snapshot):], expected_version=version)
+        print(f"--- Đã tóm tắt lịch sử phiên {session_id}: {len(snapshot)} -> {len(compacted)} message ---")
+    except SessionConflictError:
+        # Worker khác vừa ghi phiên này: bỏ qua lần tóm tắt, lượt sau sẽ tóm tắt lại
+        print(f"--- Bỏ qua tóm tắt phiên {session_id}: lịch sử vừa thay đổi ---")
+    except Exception as e:
+        print(f"Lỗi khi tóm tắt lịch sử phiên {session_id}: {e}")
+
+
+async def run_turn(session_id: str, question: str, budget: RunBudget) -> Tuple[str, List[BaseMessage]]:
+    """
+    Chạy một lượt hỏi đáp cho phiên: đọc lịch sử, gọi agent, ghi lịch sử mới.
+    Toàn bộ được giữ trong khoá của phiên, nên hai lượt đồng thời sẽ xếp hàng thay vì ghi đè nhau;
+    với nhiều worker, lượt mới được ghi bằng compare-and-set (xem SessionStore.save_turn).
+    """
+    async with session_coordinator.session_lock(session_id):
+        # Store (SQLite) là I/O đồng bộ nên chạy trong threadpool, không chặn event loop
+        history, version = await run_in_threadpool(session_store.load, session_id)
+        history = history or []
+        final_answer, updated_history = await aget_response(question, history, budget=budget)
+        updated_history = await run_in_threadpool(session_store.save_turn, session_id, history, version, updated_history)
+    return final_answer, updated_history
+
+
+async def stream_turn(session_id: str, question: str, budget: RunBudget):
+    """
+    Bản streaming của run_turn: trả về dần các sự kiện của astream_response.
+    Khoá phiên được giữ tới khi stream kết thúc (hoặc client ngắt kết nối).
+    """
+    async with session_coordinator.session_lock(session_id):
+        history, version = await run_in_threadpool(session_store.load, session_id)
+        history = history or []
+        async for event in astream_response(question, history, budget=budget):
+            if event["type"] == "done":
+                event["history"] = await run_in_threadpool(session_store.save_turn, session_id, history, version, event["history"])
+            yield event
+
+
+def sse(data: dict, event: Optional[str] = None) -> str:
+    """Định dạng một server-sent event."""
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def reject_streaming_idempotency(idempotency_key: Optional[str]):
+    """
+    Stream không gắn được vào lượt đang chạy (mỗi client cần nhận token của riêng mình), nên idempotency
+    chỉ áp dụng cho yêu cầu không stream; báo lỗi thay vì âm thầm chạy agent hai lần.
+    """
+    if idempotency_key:
+        raise HTTPException(status_code=400, detail="idempotency_key chỉ dùng được khi stream=false.")
+
+
+def stream_error(error: Exception, session_id: str) -> dict:
+    """Nội dung báo lỗi khi agent lỗi giữa lúc đang stream (status 200 đã gửi, không đổi được nữa)."""
+    if isinstance(error, SessionConflictError):
+        return {"message": str(error), "type": "session_conflict", "code": 409, "session_id": session_id}
+    return {"message": str(error) or type(error).__name__, "type": "server_error", "code": 500, "session_id": session_id}
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
 
 class JobType(str, Enum):
     hot = "hot"
@@ -49,55 +237,254 @@ class JobType(str, Enum):
 class TTSRequest(BaseModel):
     text: str
     speaker_id : int = 1
+    # Định dạng đầu ra (wav, mp3, opus) và tần số lấy mẫu; bỏ trống = giữ audio gốc của backend (xem /tts/formats)
+    format: Optional[str] = None
+    sample_rate: Optional[int] = None
+
+# Backend TTS theo thứ tự ưu tiên (server TTS ngoài, rồi gTTS), có health probe, circuit breaker và hedging
+tts_registry = create_tts_registry()
+metrics.register_collector(tts_registry.collect_metrics)
+# Cache audio trên đĩa theo (văn bản đã chuẩn hoá, speaker_id, backend); tắt bằng AUDIO_CACHE=0
+audio_cache = AudioCache() if AUDIO_CACHE_ENABLED else None
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def synthesize_and_cache(text: str, speaker_id: int, backends: Optional[List[TTSBackend]] = None) -> Optional[Tuple[TTSBackend, bytes]]:
+    """Tổng hợp qua registry (bỏ qua backend đang lỗi, hedge khi chậm) và lưu vào cache theo backend đã trả lời."""
+    try:
+        backend, content = await tts_registry.synthesize(text, speaker_id, backends)
+    except TTSError as e:
+        print(f"--> [TTS] Không backend nào tổng hợp được: {e}")
+        return None
+    if audio_cache is not None:
+        await run_in_threadpool(audio_cache.put, AudioCache.make_key(text, speaker_id, backend.name), content, backend.media_type)
+    return backend, content
+
+
+async def synthesize_chunk(text: str, speaker_id: int, backends: Optional[List[TTSBackend]] = None) -> Optional[Tuple[TTSBackend, bytes]]:
+    """Tổng hợp một đoạn, dùng lại audio đã cache của đoạn đó (câu lặp lại giữa các câu trả lời)."""
+    backends = backends or tts_registry.backends
+    if audio_cache is not None:
+        found = audio_cache.get_any([AudioCache.make_key(text, speaker_id, backend.name) for backend in backends])
+        if found is not None:
+            index, entry = found
+            try:
+                return backends[index], await run_in_threadpool(read_file, entry.path)
+            except OSError:
+                pass
+    return await synthesize_and_cache(text, speaker_id, backends)
+
+
+def synthesize_rest(backend: TTSBackend, chunks: List[str], speaker_id: int):
+    """Bắt đầu tổng hợp song song các đoạn sau đoạn đầu trên `backend` (kết quả lấy theo thứ tự qua chunk_audio)."""
+    return synthesize_in_order(chunks[1:], lambda chunk: synthesize_chunk(chunk, speaker_id, [backend]))
+
+
+def chunk_source(result: Optional[Tuple[TTSBackend, bytes]], pcm_format) -> Optional[bytes]:
+    """Audio nguồn của một đoạn để nối vào luồng: WAV chỉ lấy phần PCM (phải cùng tham số với đoạn đầu); MP3 giữ nguyên."""
+    data = result[1] if result is not None else None
+    if data is not None and pcm_format is not None:
+        parsed = parse_wav(data)
+        data = parsed[1] if parsed is not None and parsed[0] == pcm_format else None
+    return data
+
+
+async def chunk_audio(backend: TTSBackend, chunks: List[str], first: bytes, speaker_id: int, pcm_format, rest=None):
+    """
+    Audio nguồn của từng đoạn theo thứ tự: đoạn đầu có sẵn, các đoạn sau tổng hợp song song trên cùng backend
+    (`rest`: đã bắt đầu từ trước bằng synthesize_rest, nếu không thì bắt đầu ở đây).
+    Đoạn lỗi được thử lại trên các backend khác cùng định dạng; vẫn lỗi thì ném TTSError để kết thúc luồng
+    (không được bỏ qua một đoạn, người nghe sẽ mất nội dung).
+    """
+    results = rest if rest is not None else synthesize_rest(backend, chunks, speaker_id)
+    try:
+        yield first
+        index = 0
+        async for result in results:
+            index += 1
+            data = chunk_source(result, pcm_format)
+            if data is None:
+                others = [other for other in tts_registry.backends if other is not backend and other.media_type == backend.media_type]
+                print(f"--> Đoạn {index + 1} lỗi trên {backend.name}, thử lại trên {[other.name for other in others]}.")
+                data = chunk_source(await synthesize_chunk(chunks[index], speaker_id, others), pcm_format) if others else None
+            if data is None:
+                raise TTSError(f"không tổng hợp được đoạn {index + 1}/{len(chunks)}")
+            yield data
+    finally:
+        await results.aclose()
+
+
+async def stream_chunks(backend: TTSBackend, key: str, chunks: List[str], first: bytes, speaker_id: int, transcoder: Transcoder, spec: Optional[OutputSpec], rest=None):
+    """
+    Gửi audio theo từng đoạn qua `transcoder` (WAV streaming, hoặc mã hoá sang định dạng client yêu cầu).
+    Khi gửi xong mọi đoạn, cả câu trả lời (đúng định dạng đã gửi) được lưu cache. Một đoạn không tổng hợp được
+    thì luồng bị cắt (client nhận response không trọn vẹn) thay vì âm thầm thiếu nội dung.
+    """
+    # Chỉ giữ lại để lưu cache khi còn vừa giới hạn của cache, nên bộ nhớ không tăng theo độ dài câu trả lời
+    parts = [] if audio_cache is not None else None
+    size = 0
+    try:
+        async for data in transcoder.run(chunk_audio(backend, chunks, first, speaker_id, transcoder.pcm_format, rest)):
+            yield data
+            if parts is not None:
+                size += len(data)
+                if size <= audio_cache.max_bytes:
+                    parts.append(data)
+                else:
+                    parts = None
+    except AudioFormatError as e:
+        print(f"--> [TTS] Lỗi chuyển định dạng giữa luồng: {e}")
+        return
+    except TTSError as e:
+        print(f"--> [TTS] Dừng luồng audio: {e}")
+        raise
+
+    # Không lưu audio bị giữ nguyên định dạng gốc (thiếu ffmpeg) dưới khoá của định dạng đã yêu cầu
+    if parts is not None and (spec is None or transcoder.media_type == spec.format.media_type):
+        full = b"".join(parts)
+        if transcoder.media_type == "audio/wav":
+            full = finalize_wav(full)
+        await run_in_threadpool(audio_cache.put, key, full, transcoder.media_type)
+
+
+def audio_response(key: str, backend: str, cache_status: str, output_format: str, entry: Optional[AudioEntry] = None, content: bytes = b"", media_type: str = "") -> Response:
+    """
+    Audio lấy từ cache được gửi thẳng từ file (FileResponse: hỗ trợ header Range, trình phát có thể tua).
+    Header X-Audio-Key cho phép client tải lại đúng file đó qua GET /tts/audio/{key}.
+    """
+    headers = {"X-TTS-Backend": backend, "X-TTS-Cache": cache_status, "X-TTS-Format": output_format}
+    if entry is not None:
+        return FileResponse(entry.path, media_type=entry.media_type, headers={**headers, "X-Audio-Key": key})
+    if audio_cache is not None:
+        headers["X-Audio-Key"] = key
+    return Response(content=content, media_type=media_type, headers=headers)
+
 
-EXTERNAL_TTS_URL = "https://9721771d4d78.ngrok-free.app"
 @app.post("/tts", summary="Tổng hợp văn bản thành giọng nói với logic ưu tiên")
 async def text_to_speech(request: TTSRequest):
     """
-    Ưu tiên 1: Gọi API TTS ngoài qua Ngrok.
-    Ưu tiên 2: Nếu thất bại, dùng gTTS làm phương án dự phòng.
+    Gọi các backend TTS theo thứ tự ưu tiên (server TTS ngoài qua Ngrok, rồi gTTS làm phương án dự phòng),
+    bỏ qua backend đang lỗi và gọi song song backend dự phòng khi backend chính quá chậm (xem /tts/backends).
+    Audio đã tổng hợp trước đó (cùng văn bản sau chuẩn hoá, cùng speaker_id) được lấy từ cache.
+    Văn bản nhiều câu được chia đoạn, tổng hợp song song và stream về theo thứ tự (X-TTS-Cache: chunked).
+    `format`/`sample_rate` chuyển audio sang định dạng gọn hơn ngay trên server (vd opus, hoặc WAV 16 kHz mono);
+    định dạng thực tế trả về nằm ở header X-TTS-Format.
     """
     if not request.text:
         raise HTTPException(status_code=400, detail="Văn bản không được để trống.")
-    # --- ƯU TIÊN 1: THỬ GỌI API BÊN NGOÀI ---
-    if EXTERNAL_TTS_URL:
-        print(f"--> [Ưu tiên 1] Thử gọi API ngoài: {EXTERNAL_TTS_URL}")
-        print(request)
-        try:
-            external_payload = {"text": preprocess_text(request.text), "speaker_id": request.speaker_id}
-            # Đặt timeout hợp lý để không phải chờ quá lâu
-            response = requests.post(f"{EXTERNAL_TTS_URL}/tts", json=external_payload, timeout=60)
-
-            # Nếu request thành công (status code 2xx)
-            if response.ok:
-                print("--> [Ưu tiên 1] Thành công! Trả về audio từ API ngoài.")
-                return Response(content=response.content, media_type='audio/wav')
-            else:
-                # Nếu service trả về lỗi (4xx, 5xx), ghi nhận và chuyển sang gTTS
-                print(f"--> [Ưu tiên 1] Thất bại. Status: {response.status_code}. Chuyển sang gTTS.")
-
-        except requests.exceptions.RequestException as e:
-            print(f"--> [Ưu tiên 1] Thất bại. Lỗi mạng hoặc timeout: {e}. Chuyển sang gTTS.")
-
-    # --- ƯU TIÊN 2 (DỰ PHÒNG): SỬ DỤNG GTTS ---
-    print("--> [Ưu tiên 2] Sử dụng gTTS làm phương án dự phòng.")
+    print(request)
     try:
-        mp3_fp = io.BytesIO()
-        tts = gtts.gTTS(text=request.text, lang='vi')
-        tts.write_to_fp(mp3_fp)
-        mp3_fp.seek(0)
-
-        # gTTS trả về audio/mpeg (MP3)
-        return Response(content=mp3_fp.read(), media_type="audio/mpeg")
+        spec = resolve_output(request.format, request.sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    variant = spec.variant if spec is not None else ""
+    text = preprocess_text(request.text)
+    # Chia câu trên văn bản gốc: preprocess_text nuốt dấu chấm đứng sau số ("năm 3." -> "năm ba")
+    chunks = [chunk for chunk in map(preprocess_text, split_sentences(request.text)) if chunk] if TTS_CHUNKED else [text]
+    keys = [AudioCache.make_key(text, request.speaker_id, backend.name, variant) for backend in tts_registry.backends]
+    if audio_cache is not None:
+        found = audio_cache.get_any(keys)
+        if found is not None:
+            index, entry = found
+            print(f"--> Audio đã có trong cache ({tts_registry.backends[index].name}, {entry.size} bytes).")
+            return audio_response(keys[index], tts_registry.backends[index].name, "hit", variant or "source", entry)
+
+    if len(chunks) > 1:
+        # Đoạn đầu quyết định backend và định dạng của cả luồng. Các đoạn sau được bắt đầu cùng lúc trên
+        # backend nhiều khả năng trả lời nhất; nếu đoạn đầu do backend khác trả lời thì bắt đầu lại trên backend đó.
+        candidates = tts_registry.candidates()
+        guess = candidates[0] if candidates else None
+        rest = synthesize_rest(guess, chunks, request.speaker_id) if guess is not None else None
+        try:
+            first = await synthesize_chunk(chunks[0], request.speaker_id)
+        except BaseException:
+            if rest is not None:
+                await rest.aclose()
+            raise
+        if first is None or first[0] is not guess:
+            if rest is not None:
+                await rest.aclose()
+            rest = None
+        if first is None:
+            raise HTTPException(status_code=500, detail="Lỗi server nội bộ: không tổng hợp được audio.")
+        backend, content = first
+        key = keys[tts_registry.backends.index(backend)]
+        pcm_format = None
+        if backend.media_type == "audio/wav":
+            parsed = parse_wav(content)
+            if parsed is not None:
+                pcm_format, content = parsed
+        if backend.media_type != "audio/wav" or pcm_format is not None:
+            transcoder = Transcoder(spec, backend.media_type, pcm_format)
+            headers = {"X-TTS-Backend": backend.name, "X-TTS-Cache": "chunked", "X-TTS-Format": transcoder.label}
+            if audio_cache is not None:
+                headers["X-Audio-Key"] = key
+            return StreamingResponse(
+                stream_chunks(backend, key, chunks, content, request.speaker_id, transcoder, spec, rest),
+                media_type=transcoder.media_type,
+                headers=headers,
+            )
+        # WAV không phải PCM thì không nối được các đoạn: tổng hợp cả văn bản một lần (bên dưới) thay vì chỉ trả câu đầu
+        print("--> Audio WAV không phải PCM, không nối được các đoạn; tổng hợp cả văn bản một lần.")
+        if rest is not None:
+            await rest.aclose()
+
+    # Khi cần chuyển định dạng, audio gốc vẫn được cache riêng để các định dạng khác dùng lại mà không tổng hợp lại
+    result = await (synthesize_chunk(text, request.speaker_id) if spec is not None else synthesize_and_cache(text, request.speaker_id))
+    if result is None:
+        raise HTTPException(status_code=500, detail="Lỗi server nội bộ: không tổng hợp được audio.")
+    backend, content = result
+    key = keys[tts_registry.backends.index(backend)]
+    media_type = backend.media_type
+    converted = await transcode_bytes(content, media_type, spec) if spec is not None else None
+    if converted is None:
+        key = AudioCache.make_key(text, request.speaker_id, backend.name)
+        return audio_response(key, backend.name, "miss", "source", content=content, media_type=media_type)
+    content, media_type = converted
+    if audio_cache is not None:
+        await run_in_threadpool(audio_cache.put, key, content, media_type)
+    return audio_response(key, backend.name, "miss", variant, content=content, media_type=media_type)
+
+
+@app.get("/tts/backends")
+async def get_tts_backends():
+    """Trạng thái từng backend TTS: circuit breaker, health probe gần nhất, số lần gọi, tỉ lệ lỗi, độ trễ trung bình."""
+    return tts_registry.stats()
+
+
+@app.get("/tts/formats")
+async def get_tts_formats():
+    """Định dạng đầu ra hỗ trợ (mp3/opus cần ffmpeg) và số liệu theo định dạng: dung lượng trung bình, tỉ lệ nén, thời gian mã hoá."""
+    return audio_format.stats()
+
+
+@app.get("/tts/audio/{key}", summary="Tải audio đã tổng hợp từ cache (hỗ trợ Range)")
+async def get_cached_audio(key: str):
+    if audio_cache is None or len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+        raise HTTPException(status_code=404, detail="Không tìm thấy audio.")
+    entry = await run_in_threadpool(audio_cache.get, key, False)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy audio.")
+    return FileResponse(entry.path, media_type=entry.media_type, headers={"X-TTS-Cache": "hit"})
 
-    except Exception as e:
-        print(f"--> [Ưu tiên 2] Lỗi khi tạo audio bằng gTTS: {e}")
-        raise HTTPException(status_code=500, detail=f"Lỗi server nội bộ: {str(e)}")
-    
 @app.post("/ask", response_model=AnswerResponse)
-def ask_question(request: QuestionRequest):
+async def ask_question(
+    request: QuestionRequest,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None),
+):
     """
     Endpoint để nhận câu hỏi và trả lời, có duy trì ngữ cảnh hội thoại.
+    Yêu cầu gửi trùng (cùng phiên + cùng idempotency key hoặc cùng câu hỏi, trong một khoảng ngắn)
+    sẽ nhận chung kết quả với yêu cầu đầu tiên thay vì chạy lại agent. Chống gửi trùng chỉ áp dụng cho
+    yêu cầu không stream: gửi idempotency key kèm `stream=true` bị từ chối (400).
+    Với `stream=true`, trả về server-sent events: `progress` khi chạy tool, `token` cho từng đoạn
+    câu trả lời và `done` ở cuối (kèm session_id, budget, usage); nếu agent lỗi giữa chừng, stream kết thúc
+    bằng sự kiện `error` thay cho `done`.
     """
     try:
         if not request.question:
@@ -105,30 +492,102 @@ def ask_question(request: QuestionRequest):
         
         # --- LOGIC QUẢN LÝ PHIÊN ---
         session_id = request.session_id
-        
-        # 1. Nếu client không gửi session_id hoặc id không tồn tại, tạo phiên mới.
-        if not session_id or session_id not in conversation_histories:
-            session_id = str(uuid.uuid4())
-            conversation_histories[session_id] = []
-            print(f"--- Bắt đầu phiên hội thoại mới: {session_id} ---")
-
-        # 2. Lấy lịch sử hội thoại của phiên hiện tại.
-        current_history = conversation_histories[session_id]
-        
-        # 3. Gọi hàm get_response đã được sửa đổi với câu hỏi và lịch sử.
-        final_answer, updated_history = get_response(request.question, current_history)
-        
-        # 4. Cập nhật lại lịch sử cho phiên này trong bộ nhớ.
-        conversation_histories[session_id] = updated_history
-        
-        # 5. Trả về câu trả lời và session_id cho client.
-        return {"answer": final_answer, "session_id": session_id}
 
+        if request.stream:
+            reject_streaming_idempotency(idempotency_key or request.idempotency_key)
+            if not session_id or not await run_in_threadpool(session_store.exists, session_id):
+                session_id = str(uuid.uuid4())
+                print(f"--- Bắt đầu phiên hội thoại mới: {session_id} ---")
+            budget = make_budget(request.time_budget_s, request.max_tool_rounds)
+
+            async def event_stream():
+                try:
+                    async for event in stream_turn(session_id, request.question, budget):
+                        if event["type"] == "token":
+                            yield sse({"text": event["text"]}, event="token")
+                        elif event["type"] == "done":
+                            background_tasks.add_task(compact_session, session_id, event["history"])
+                            yield sse({"answer": event["answer"], "session_id": session_id, "budget": budget.report(), "usage": budget.usage()}, event="done")
+                        else:
+                            yield sse(event, event="progress")
+                except Exception as e:
+                    # Header 200 đã gửi đi: báo lỗi bằng sự kiện `error` để client không chờ `done` mãi
+                    import traceback
+                    traceback.print_exc()
+                    yield sse(stream_error(e, session_id), event="error")
+
+            return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS, background=background_tasks)
+
+        dedup_key = make_dedup_key(session_id, request.question, idempotency_key or request.idempotency_key)
+
+        async def answer():
+            sid = session_id
+            # 1. Nếu client không gửi session_id hoặc id không tồn tại (hoặc đã hết hạn), tạo phiên mới.
+            if not sid or not await run_in_threadpool(session_store.exists, sid):
+                sid = str(uuid.uuid4())
+                print(f"--- Bắt đầu phiên hội thoại mới: {sid} ---")
+
+            # 2. Đọc lịch sử, gọi agent và ghi lại lịch sử (xếp hàng theo phiên).
+            budget = make_budget(request.time_budget_s, request.max_tool_rounds)
+            final_answer, updated_history = await run_turn(sid, request.question, budget)
+            background_tasks.add_task(compact_session, sid, updated_history)
+
+            # 3. Trả về câu trả lời, session_id và mức sử dụng ngân sách cho client.
+            return {"answer": final_answer, "session_id": sid, "budget": budget.report(), "usage": budget.usage()}
+
+        return await session_coordinator.run_once(dedup_key, answer, request.question)
+
+    except HTTPException:
+        raise
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
     
+class BatchQuestion(BaseModel):
+    question: str
+    id: Optional[str] = None
+    # Lịch sử dạng [{"role": "user" | "assistant", "content": ...}]
+    history: List[Dict[str, str]] = []
+
+class BatchRequest(BaseModel):
+    questions: List[BatchQuestion]
+    concurrency: int = DEFAULT_CONCURRENCY
+    time_budget_s: Optional[float] = None
+    max_tool_rounds: Optional[int] = None
+
+@app.post("/ask/batch")
+async def ask_batch(request: BatchRequest):
+    """
+    Chạy một loạt câu hỏi (không gắn với phiên nào) với số câu chạy đồng thời giới hạn.
+    Trả về NDJSON: mỗi dòng là kết quả của một câu hỏi theo thứ tự hoàn thành,
+    dòng cuối là tổng kết (số câu hỏi, số câu duy nhất, số lỗi, thống kê retrieval cache).
+    Tối đa BATCH_MAX_QUESTIONS câu mỗi request, vượt quá trả về 413.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Danh sách câu hỏi trống.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Tối đa {BATCH_MAX_QUESTIONS} câu hỏi mỗi batch (nhận {len(request.questions)}).",
+        )
+    try:
+        items = [
+            BatchItem(q.question, history=messages_from_dicts(q.history), item_id=q.id)
+            for q in request.questions
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    budget = make_budget(request.time_budget_s, request.max_tool_rounds)
+
+    async def results():
+        async for event in run_batch(items, request.concurrency, budget.time_budget_s, budget.max_tool_rounds):
+            yield json.dumps(event, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson", headers=SSE_HEADERS)
+
 # -------------------------------
 # OpenAI-style Chat Completions API
 # -------------------------------
@@ -142,9 +601,17 @@ class ChatCompletionRequest(BaseModel):
     model: str = Field(default="sotay-llm")
     messages: List[ChatMessage]
     session_id: Optional[str] = None
+    time_budget_s: Optional[float] = None
+    max_tool_rounds: Optional[int] = None
+    idempotency_key: Optional[str] = None
+    stream: bool = False
 
 @app.post("/v1/chat/completions")
-async def chat_completions(request: ChatCompletionRequest):
+async def chat_completions(
+    request: ChatCompletionRequest,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None),
+):
     """
     Endpoint tương thích OpenAI API (/v1/chat/completions).
     Cho phép các công cụ (như LangChain, OpenAI SDK) gọi trực tiếp.
@@ -152,7 +619,6 @@ async def chat_completions(request: ChatCompletionRequest):
     try:
         # Lấy hoặc tạo session 
         session_id = request.session_id or str(uuid.uuid4())
-        history = conversation_histories.get(session_id, [])
 
         # Lấy message cuối cùng của user
         user_message = None
@@ -163,9 +629,26 @@ async def chat_completions(request: ChatCompletionRequest):
         if not user_message:
             raise HTTPException(status_code=400, detail="Không có user message trong request")
 
-        # Gọi LLM (RAG) 
-        final_answer, updated_history = get_response(user_message, history)
-        conversation_histories[session_id] = updated_history
+        if request.stream:
+            reject_streaming_idempotency(idempotency_key or request.idempotency_key)
+            budget = make_budget(request.time_budget_s, request.max_tool_rounds)
+            return StreamingResponse(
+                stream_chat_completion(request.model, session_id, user_message, budget, background_tasks),
+                media_type="text/event-stream",
+                headers=SSE_HEADERS,
+                background=background_tasks,
+            )
+
+        dedup_key = make_dedup_key(request.session_id, user_message, idempotency_key or request.idempotency_key)
+
+        async def answer():
+            # Gọi LLM (RAG), xếp hàng theo phiên
+            budget = make_budget(request.time_budget_s, request.max_tool_rounds)
+            final_answer, updated_history = await run_turn(session_id, user_message, budget)
+            background_tasks.add_task(compact_session, session_id, updated_history)
+            return final_answer, budget
+
+        final_answer, budget = await session_coordinator.run_once(dedup_key, answer, user_message)
 
         # Trả về kết quả theo format OpenAI 
         return {
@@ -180,9 +663,15 @@ async def chat_completions(request: ChatCompletionRequest):
                     "finish_reason": "stop"
                 }
             ],
-            "session_id": session_id
+            "usage": budget.usage(),
+            "session_id": session_id,
+            "budget": budget.report()
         }
 
+    except HTTPException:
+        raise
+    except SessionConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -190,13 +679,80 @@ async def chat_completions(request: ChatCompletionRequest):
 
 
 
+async def stream_chat_completion(model: str, session_id: str, user_message: str, budget: RunBudget, background_tasks: BackgroundTasks):
+    """
+    Sinh các chunk `chat.completion.chunk` theo chuẩn OpenAI.
+    Giai đoạn chạy tool được báo qua chunk có `delta` rỗng và trường `progress` bổ sung
+    (client OpenAI bỏ qua trường lạ). Chunk cuối mang `finish_reason`, `usage` và `budget` (có ttft_s).
+    """
+    completion_id = f"chatcmpl-{uuid.uuid4()}"
+    created = int(time.time())
+
+    def chunk(delta: dict, finish_reason: Optional[str] = None, **extra) -> str:
+        return sse({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            "session_id": session_id,
+            **extra,
+        })
+
+    yield chunk({"role": "assistant", "content": ""})
+    try:
+        async for event in stream_turn(session_id, user_message, budget):
+            if event["type"] == "token":
+                yield chunk({"content": event["text"]})
+            elif event["type"] == "done":
+                background_tasks.add_task(compact_session, session_id, event["history"])
+                yield chunk({}, finish_reason="stop", usage=budget.usage(), budget=budget.report())
+            else:
+                yield chunk({}, progress=event)
+    except Exception as e:
+        # Lỗi giữa chừng: gửi chunk lỗi kiểu OpenAI ({"error": {...}}) rồi vẫn kết thúc bằng [DONE]
+        import traceback
+        traceback.print_exc()
+        yield sse({"error": stream_error(e, session_id)})
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Số liệu của answer cache (tỉ lệ trúng, số entry, tổng thời gian tiết kiệm được), retrieval cache và cache audio TTS."""
+    from mcp.tools import retrieval_cache
+    stats = {"enabled": False} if answer_cache is None else {"enabled": True, **answer_cache.stats()}
+    stats["retrieval_cache"] = retrieval_cache.stats() if retrieval_cache is not None else None
+    stats["tts_audio_cache"] = audio_cache.stats() if audio_cache is not None else None
+    return stats
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Số liệu theo định dạng Prometheus: độ trễ theo route/bước agent/LLM/tool/Pinecone/HTTP ngoài, cache, phiên."""
+    # Collector của session store đọc SQLite nên render chạy trong threadpool
+    return PlainTextResponse(await run_in_threadpool(metrics.render), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/health")
+async def health():
+    """Server đang chạy; kèm trạng thái khởi tạo agent (llm_ready) và thời gian prewarm từng thành phần."""
+    return {"status": "ok", **startup.status()}
+
+
+@app.get("/cascade/stats")
+async def get_cascade_stats():
+    """Số lần gọi, số lần chấp nhận/chuyển tầng, lỗi và độ trễ của từng tầng model."""
+    return rag.get_cascade().stats()
+
+
 @app.get("/scholarships", response_model=List[dict])
 async def get_scholarships():
     """
     Endpoint để lấy danh sách tất cả học bổng.
     """
     try:
-        scholarships_data = crawl_all_scholarships()
+        scholarships_data = await run_in_threadpool(crawl_all_scholarships)
         if scholarships_data is None:
             raise HTTPException(status_code=500, detail="Không thể crawl dữ liệu học bổng.")
         
@@ -229,13 +785,20 @@ async def get_jobs(
         raise HTTPException(status_code=400, detail="Tên thành phố không hợp lệ.")
         
     try:
-        jobs_data = fetch_jobs(
+        jobs_data = await run_in_threadpool(
+            fetch_jobs,
             location_code=location_code,
             career=career,
             city=city
         )
         if jobs_data is None:
-             raise HTTPException(status_code=500, detail="Không thể crawl dữ liệu việc làm.")
+            # Không gọi được ctsv: dùng snapshot nếu có cấu hình JOB_SNAPSHOT_DIR (xem mcp/job_snapshot.py),
+            # không có snapshot thì trả danh sách rỗng như trước
+            snapshot = await run_in_threadpool(get_snapshot, location_code)
+            if snapshot is None:
+                return []
+            print(f"--> Không lấy được tin từ ctsv, dùng snapshot {snapshot.path}.")
+            return await run_in_threadpool(snapshot.jobs, career, city)
         return jobs_data
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Lỗi server nội bộ.")
@@ -256,7 +819,7 @@ async def get_activities():
     Endpoint để lấy danh sách các hoạt động, sự kiện.
     """
     try:
-        activities_data = fetch_activities()
+        activities_data = await run_in_threadpool(fetch_activities)
         
         if activities_data is None:
              raise HTTPException(status_code=500, detail="Không thể crawl dữ liệu hoạt động.")
@@ -271,7 +834,7 @@ async def get_activity_details(activity_id: int):
     Endpoint để lấy thông tin chi tiết của một hoạt động dựa trên ID.
     """
     try:
-        details_data = fetch_activity_details(activity_id=activity_id)
+        details_data = await run_in_threadpool(fetch_activity_details, activity_id=activity_id)
         
         if not details_data:
              raise HTTPException(status_code=404, detail="Không tìm thấy hoạt động.")
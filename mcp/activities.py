@@ -1,11 +1,19 @@
 # mcp/activities.py
 
-import requests
+import os
+import re
 import json
 import time
 from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 
+from .metrics import http_post
+
+# Địa chỉ API của ctsv; đổi sang mock server khi chạy load test (bench/load_test.py)
+CTSV_BASE_URL = os.getenv("CTSV_BASE_URL", "https://ctsv.hust.edu.vn").rstrip("/")
+# Thời gian nghỉ giữa hai trang khi crawl, tránh gửi dồn dập tới ctsv
+CTSV_PAGE_DELAY_S = float(os.getenv("CTSV_PAGE_DELAY_S", "0.5"))
+
 def html_to_text(html_string: str) -> str:
     """
     Chuyển đổi một chuỗi HTML thành văn bản thuần túy,
@@ -76,7 +84,7 @@ def parse_detailed_activity_data(raw_activity: dict) -> dict:
 # --- CÁC HÀM CRAWL ---
 def get_raw_activities_from_page(page_number: int, signature: str = "sample string 4", page_size: int = 1000) -> Optional[List[Dict]]:
     """Lấy danh sách hoạt động thô từ một trang cụ thể."""
-    url = "https://ctsv.hust.edu.vn/api-t/Activity/GetPublishActivity"
+    url = f"{CTSV_BASE_URL}/api-t/Activity/GetPublishActivity"
     headers = {'Content-Type': 'application/json', 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36'}
     payload = {
         "Signature": signature,
@@ -84,7 +92,7 @@ def get_raw_activities_from_page(page_number: int, signature: str = "sample stri
         "PageNumber": page_number
     }
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=20)
+        response = http_post("ctsv_activities", url, headers=headers, json=payload, timeout=20)
         response.raise_for_status()
         data = response.json()
         
@@ -114,7 +122,7 @@ def fetch_activities(max_pages: int = 5) -> List[Dict]:
             clean_activity = parse_activity_data(raw_activity)
             all_clean_activities.append(clean_activity)
         
-        time.sleep(0.5)
+        time.sleep(CTSV_PAGE_DELAY_S)
         
     print(f"Crawl xong. Có tổng cộng {len(all_clean_activities)} hoạt động.")
     return all_clean_activities
@@ -123,14 +131,14 @@ def fetch_activity_details(activity_id: int) -> Optional[Dict]:
     """
     HÀM MỚI: Gọi API GetActivityById để lấy thông tin chi tiết.
     """
-    url = "https://ctsv.hust.edu.vn/api-t/Activity/GetActivityById"
+    url = f"{CTSV_BASE_URL}/api-t/Activity/GetActivityById"
     headers = {'Content-Type': 'application/json', 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/116.0.0.0 Safari/537.36'}
     payload = {"AId": activity_id}
     
     print(f"--- Fetching details for Activity ID: {activity_id} ---")
     
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
+        response = http_post("ctsv_activity_detail", url, headers=headers, json=payload, timeout=15)
         response.raise_for_status()
         data = response.json()
         
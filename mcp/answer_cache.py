@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .session_guard import normalize_question
+
+# Cấu hình mặc định (có thể chỉnh qua biến môi trường)
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1") == "1"
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", str(6 * 3600)))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.93"))
+
+# Phiên bản dữ liệu mà câu trả lời phụ thuộc vào. Tăng INDEX_VERSION sau mỗi lần nạp lại
+# Pinecone (ví dụ re-ingest QCDT2025) để vô hiệu các câu trả lời cũ.
+INDEX_VERSION = os.getenv("INDEX_VERSION", "1")
+
+# Nguồn dữ liệu mà mỗi tool phụ thuộc
+TOOL_SOURCES = {
+    "search_student_handbook": "index",
+    "search_academic_regulations": "index",
+    "search_law_vietnam": "index",
+}
+# Tool trả về dữ liệu thay đổi theo thời gian: câu trả lời dùng tới chúng không được cache
+TIME_SENSITIVE_TOOLS = {"get_scholarships", "get_scholarship_detail", "search_website"}
+
+
+_NUMBER_RE = re.compile(r"\d+")
+# Dấu câu ở đầu/cuối câu hỏi không đổi nghĩa ("... là gì?" và "... là gì")
+_EDGE_PUNCTUATION = "?.!…,;:\"'“”‘’()[]- "
+
+
+def current_versions() -> Dict[str, str]:
+    return {"index": INDEX_VERSION}
+
+
+def normalize_cache_question(question: str) -> str:
+    """Chuẩn hoá câu hỏi cho answer cache: như normalize_question, bỏ thêm dấu câu ở đầu/cuối câu."""
+    return normalize_question(question).strip(_EDGE_PUNCTUATION)
+
+
+def question_numbers(question: str) -> frozenset:
+    """Các số trong câu hỏi (năm, khoá, học kỳ...): "học phí 2024" và "học phí 2025" rất gần nhau về embedding."""
+    return frozenset(_NUMBER_RE.findall(normalize_question(question)))
+
+
+class CacheEntry:
+    def __init__(self, question: str, answer: str, versions: Dict[str, str], latency_s: float, embedding: Optional[np.ndarray]):
+        self.question = question
+        self.answer = answer
+        # Phiên bản của từng nguồn dữ liệu đã dùng để tạo câu trả lời
+        self.versions = versions
+        # Thời gian đã tốn để tạo câu trả lời (để tính thời gian tiết kiệm được)
+        self.latency_s = latency_s
+        self.embedding = embedding
+        self.numbers = question_numbers(question)
+        self.expires_at = time.monotonic() + ANSWER_CACHE_TTL_S
+        self.hits = 0
+
+
+class AnswerCache:
+    """
+    Cache câu trả lời cho các câu hỏi không có ngữ cảnh (lượt đầu tiên của phiên).
+
+    - Khớp chính xác theo câu hỏi đã chuẩn hoá, hoặc theo độ tương đồng embedding
+      (cosine >= `similarity_threshold`) nếu có `embed_fn`; khớp theo embedding còn đòi hỏi
+      các số trong câu hỏi (năm, khoá...) trùng nhau hoàn toàn.
+    - Mỗi entry ghi lại phiên bản index/prompt mà nó phụ thuộc; khi phiên bản thay đổi entry bị bỏ qua.
+    - Loại bỏ theo LRU + TTL. Câu trả lời dùng tool nhạy thời gian (học bổng, web) không được lưu.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        similarity_threshold: float = ANSWER_CACHE_SIMILARITY,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        prompt_version: str = "",
+    ):
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        # Đổi system prompt cũng làm các câu trả lời cũ mất hiệu lực
+        self.prompt_version = prompt_version
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.stores = 0
+        self.rejected = 0
+        self.latency_saved_s = 0.0
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.sha1(normalize_cache_question(question).encode("utf-8")).hexdigest()
+
+    def _is_valid(self, entry: CacheEntry, now: float) -> bool:
+        if entry.expires_at < now:
+            return False
+        versions = current_versions()
+        if entry.versions.get("prompt") != self.prompt_version:
+            return False
+        return all(versions.get(source) == version for source, version in entry.versions.items() if source != "prompt")
+
+    def embed(self, question: str) -> Optional[np.ndarray]:
+        if self.embed_fn is None:
+            return None
+        try:
+            vector = np.asarray(self.embed_fn(normalize_cache_question(question)), dtype=np.float32)
+        except Exception as e:
+            print(f"Lỗi khi tạo embedding cho answer cache: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _lookup_exact(self, question: str) -> Optional[CacheEntry]:
+        key = self._key(question)
+        with self._lock:
+            self.lookups += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._is_valid(entry, time.monotonic()):
+                self._entries.move_to_end(key)
+                self._hit(entry)
+                self.exact_hits += 1
+                return entry
+            del self._entries[key]
+            return None
+
+    def _lookup_semantic(self, question: str, embedding: np.ndarray) -> Optional[CacheEntry]:
+        now = time.monotonic()
+        numbers = question_numbers(question)
+        with self._lock:
+            best_key, best_score = None, -1.0
+            for entry_key, entry in self._entries.items():
+                if entry.embedding is None or entry.numbers != numbers or not self._is_valid(entry, now):
+                    continue
+                score = float(np.dot(entry.embedding, embedding))
+                if score > best_score:
+                    best_key, best_score = entry_key, score
+            if best_key is None or best_score < self.similarity_threshold:
+                return None
+            entry = self._entries[best_key]
+            self._entries.move_to_end(best_key)
+            self._hit(entry)
+            self.semantic_hits += 1
+            return entry
+
+    def lookup(self, question: str) -> Tuple[Optional[CacheEntry], Optional[np.ndarray]]:
+        """
+        Tìm câu trả lời đã cache. Trả về (entry hoặc None, embedding của câu hỏi)
+        để lần `store` sau không phải tính lại embedding.
+        """
+        entry = self._lookup_exact(question)
+        if entry is not None:
+            return entry, entry.embedding
+        embedding = self.embed(question)
+        if embedding is None:
+            return None, None
+        return self._lookup_semantic(question, embedding), embedding
+
+    async def alookup(self, question: str) -> Tuple[Optional[CacheEntry], Optional[np.ndarray]]:
+        """Bản async của lookup: việc gọi API embedding chạy ngoài event loop."""
+        entry = self._lookup_exact(question)
+        if entry is not None:
+            return entry, entry.embedding
+        if self.embed_fn is None:
+            return None, None
+        embedding = await asyncio.to_thread(self.embed, question)
+        if embedding is None:
+            return None, None
+        return self._lookup_semantic(question, embedding), embedding
+
+    def _hit(self, entry: CacheEntry):
+        entry.hits += 1
+        self.latency_saved_s += entry.latency_s
+
+    def store(self, question: str, answer: str, tools_used: Iterable[str], latency_s: float, embedding: Optional[np.ndarray] = None) -> bool:
+        """Lưu câu trả lời nếu nó không phụ thuộc vào tool nhạy thời gian. Trả về True nếu đã lưu."""
+        tools_used = set(tools_used)
+        if tools_used & TIME_SENSITIVE_TOOLS or not answer:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        versions = current_versions()
+        depends_on = {"prompt": self.prompt_version}
+        for tool_name in tools_used:
+            source = TOOL_SOURCES.get(tool_name)
+            if source:
+                depends_on[source] = versions[source]
+
+        entry = CacheEntry(question, answer, depends_on, latency_s, embedding)
+        key = self._key(question)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.stores += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "entries": len(self._entries),
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "hit_rate": round(hits / self.lookups, 4) if self.lookups else 0.0,
+                "stores": self.stores,
+                "rejected": self.rejected,
+                "latency_saved_s": round(self.latency_saved_s, 3),
+            }
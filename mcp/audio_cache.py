@@ -0,0 +1,203 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+# Cấu hình mặc định (có thể chỉnh qua biến môi trường)
+AUDIO_CACHE_ENABLED = os.getenv("AUDIO_CACHE", "1") == "1"
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "tts_cache")
+AUDIO_CACHE_MAX_BYTES = int(os.getenv("AUDIO_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Tăng khi đổi cách chuẩn hoá văn bản/giọng đọc để bỏ các file audio cũ
+AUDIO_CACHE_VERSION = os.getenv("AUDIO_CACHE_VERSION", "1")
+
+# Đuôi file <-> media type của audio được lưu
+MEDIA_TYPES = {
+    ".wav": "audio/wav",
+    ".mp3": "audio/mpeg",
+    ".ogg": "audio/ogg",
+}
+EXTENSIONS = {media_type: ext for ext, media_type in MEDIA_TYPES.items()}
+
+
+class AudioEntry:
+    def __init__(self, path: str, size: int, media_type: str):
+        self.path = path
+        self.size = size
+        self.media_type = media_type
+
+
+class AudioCache:
+    """
+    Cache audio của /tts trên đĩa, đánh địa chỉ theo nội dung: khoá là sha256 của
+    (văn bản đã qua preprocess_text, speaker_id, backend), file nằm ở `<directory>/<2 ký tự đầu>/<khoá><đuôi>`.
+
+    - Giới hạn tổng dung lượng `max_bytes`, loại bỏ file dùng lâu nhất (LRU) khi vượt.
+    - Ghi file tạm rồi os.replace nên các worker uvicorn dùng chung thư mục không đọc phải file ghi dở.
+      Mỗi worker giữ chỉ mục LRU riêng; file do worker khác ghi được nhận vào chỉ mục khi tra trúng.
+    - Khởi động lại server không mất cache: chỉ mục được dựng lại từ thư mục theo thời gian truy cập (mtime).
+    """
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, AudioEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @staticmethod
+    def make_key(text: str, speaker_id: int, backend: str, variant: str = "") -> str:
+        """
+        `text` là văn bản đã chuẩn hoá (preprocess_text), nên các cách viết khác nhau của cùng một câu dùng chung audio.
+        `variant` là định dạng đầu ra đã chuyển đổi (vd "mp3@16000"); rỗng = audio gốc của backend.
+        """
+        parts = (AUDIO_CACHE_VERSION, backend, str(speaker_id), text) + ((variant,) if variant else ())
+        raw = "\0".join(parts)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str, media_type: str) -> str:
+        return os.path.join(self.directory, key[:2], key + EXTENSIONS[media_type])
+
+    def _load(self):
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                key, ext = os.path.splitext(name)
+                if ext not in MEDIA_TYPES:
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, key, AudioEntry(path, stat.st_size, MEDIA_TYPES[ext])))
+        for _, key, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[key] = entry
+            self._bytes += entry.size
+        self._evict()
+
+    def _find_on_disk(self, key: str) -> Optional[AudioEntry]:
+        """File có thể do worker khác ghi sau khi worker này dựng chỉ mục."""
+        for media_type in MEDIA_TYPES.values():
+            path = self._path(key, media_type)
+            try:
+                return AudioEntry(path, os.path.getsize(path), media_type)
+            except OSError:
+                continue
+        return None
+
+    def get(self, key: str, record_stats: bool = True) -> Optional[AudioEntry]:
+        """
+        Trả về entry (đường dẫn, kích thước, media type) nếu audio đã có trong cache.
+        `record_stats=False` khi client chỉ tải lại file đã có (không tính là một lần tránh được việc tổng hợp).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._find_on_disk(key)
+                if entry is not None:
+                    self._entries[key] = entry
+                    self._bytes += entry.size
+            elif not os.path.exists(entry.path):
+                # File bị xoá từ bên ngoài (hoặc worker khác loại bỏ)
+                del self._entries[key]
+                self._bytes -= entry.size
+                entry = None
+            if entry is None:
+                if record_stats:
+                    self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if record_stats:
+                self.hits += 1
+                self.bytes_saved += entry.size
+        try:
+            # Ghi lại thời điểm dùng để thứ tự LRU còn đúng sau khi khởi động lại
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return entry
+
+    def get_any(self, keys: Sequence[str]) -> Optional[Tuple[int, AudioEntry]]:
+        """
+        Tra lần lượt các khoá (cùng văn bản, các backend theo thứ tự ưu tiên), tính là một lần tra.
+        Trả về (vị trí của khoá trúng, entry).
+        """
+        for index, key in enumerate(keys):
+            entry = self.get(key, record_stats=False)
+            if entry is not None:
+                with self._lock:
+                    self.hits += 1
+                    self.bytes_saved += entry.size
+                return index, entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, content: bytes, media_type: str) -> Optional[AudioEntry]:
+        """Lưu audio; trả về entry, hoặc None nếu không lưu được (file lớn hơn giới hạn, lỗi ghi đĩa)."""
+        if media_type not in EXTENSIONS or len(content) > self.max_bytes:
+            return None
+        path = self._path(key, media_type)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"--- AUDIO CACHE: không ghi được {path}: {e} ---")
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+        entry = AudioEntry(path, len(content), media_type)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[key] = entry
+            self._bytes += entry.size
+            self._evict()
+        return entry
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,304 @@
+"""
+Định dạng audio đầu ra của /tts: đổi định dạng/tần số lấy mẫu ngay trên server để giảm dung lượng gửi về
+(WAV gốc của server TTS ~1 MB cho một câu ngắn).
+
+- wav: PCM 16-bit mono, đổi tần số lấy mẫu bằng audioop.ratecv (giữ trạng thái giữa các đoạn nên resample theo luồng được).
+- mp3 / opus (trong ogg): mã hoá bằng tiến trình ffmpeg (FFMPEG_PATH hoặc ffmpeg trong PATH); dữ liệu đi qua pipe
+  theo từng đoạn nên bộ nhớ không tăng theo độ dài câu trả lời. Không có ffmpeg thì yêu cầu các định dạng này
+  được trả về dạng WAV.
+
+Số liệu theo định dạng (số byte nguồn/đầu ra, thời gian mã hoá) có ở /tts/formats và /metrics.
+"""
+import asyncio
+import audioop
+import os
+import shutil
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .metrics import TTS_ENCODE_SECONDS, TTS_OUTPUT_BYTES, TTS_SOURCE_BYTES, observe
+from .tts_stream import PcmFormat, finalize_wav, parse_wav, wav_stream_header
+
+FFMPEG_PATH = os.getenv("FFMPEG_PATH") or shutil.which("ffmpeg")
+TTS_MP3_BITRATE = os.getenv("TTS_MP3_BITRATE", "48k")
+TTS_OPUS_BITRATE = os.getenv("TTS_OPUS_BITRATE", "24k")
+# Định dạng mặc định khi client không chỉ định; rỗng = giữ nguyên định dạng của backend
+TTS_DEFAULT_FORMAT = os.getenv("TTS_DEFAULT_FORMAT", "")
+# Tần số lấy mẫu client được chọn (giới hạn để số nhãn metrics và số biến thể trong cache không tăng tuỳ ý)
+SAMPLE_RATES = (8000, 16000, 22050, 24000, 44100, 48000)
+# Tần số mặc định khi giải mã MP3 (gTTS) sang WAV mà client không chỉ định
+DECODE_SAMPLE_RATE = 24000
+_READ_SIZE = 64 * 1024
+
+
+class AudioFormatError(Exception):
+    """Không chuyển được định dạng (ffmpeg lỗi, WAV không phải PCM...)."""
+
+
+class OutputFormat:
+    def __init__(self, name: str, media_type: str, encoder_args: Optional[List[str]] = None):
+        self.name = name
+        self.media_type = media_type
+        # Tham số ffmpeg cho bộ mã hoá; None = tự xử lý bằng audioop (PCM)
+        self.encoder_args = encoder_args
+
+    @property
+    def available(self) -> bool:
+        return self.encoder_args is None or FFMPEG_PATH is not None
+
+
+OUTPUT_FORMATS: Dict[str, OutputFormat] = {
+    "wav": OutputFormat("wav", "audio/wav"),
+    "mp3": OutputFormat("mp3", "audio/mpeg", ["-c:a", "libmp3lame", "-b:a", TTS_MP3_BITRATE, "-f", "mp3"]),
+    "opus": OutputFormat("opus", "audio/ogg", ["-c:a", "libopus", "-b:a", TTS_OPUS_BITRATE, "-application", "voip", "-f", "ogg"]),
+}
+
+
+class OutputSpec:
+    """Định dạng + tần số lấy mẫu client yêu cầu (None = giữ tần số của nguồn)."""
+
+    def __init__(self, output_format: OutputFormat, sample_rate: Optional[int] = None):
+        self.format = output_format
+        self.sample_rate = sample_rate
+
+    @property
+    def variant(self) -> str:
+        """Phần thêm vào khoá cache audio: mỗi định dạng/tần số là một file riêng."""
+        return f"{self.format.name}@{self.sample_rate or 'src'}"
+
+
+def resolve_output(format_name: Optional[str], sample_rate: Optional[int]) -> Optional[OutputSpec]:
+    """
+    Đọc tham số của client; None nếu giữ nguyên audio của backend. ValueError nếu tham số không hợp lệ.
+    Định dạng nén khi không có ffmpeg được đổi sang WAV (vẫn nhỏ hơn nhờ mono/giảm tần số).
+    """
+    format_name = (format_name or TTS_DEFAULT_FORMAT or "").lower()
+    if not format_name and sample_rate is None:
+        return None
+    if sample_rate is not None and sample_rate not in SAMPLE_RATES:
+        raise ValueError(f"sample_rate phải là một trong {', '.join(map(str, SAMPLE_RATES))}")
+    output_format = OUTPUT_FORMATS.get(format_name or "wav")
+    if output_format is None:
+        raise ValueError(f"format phải là một trong {', '.join(OUTPUT_FORMATS)}")
+    if not output_format.available:
+        print(f"--> [TTS] Không có ffmpeg, trả về WAV thay cho {output_format.name}.")
+        output_format = OUTPUT_FORMATS["wav"]
+    return OutputSpec(output_format, sample_rate)
+
+
+class PcmConverter:
+    """Chuyển PCM (8/16/24/32-bit, mono/stereo) sang 16-bit mono ở `sample_rate`, theo từng đoạn."""
+
+    def __init__(self, source: PcmFormat, sample_rate: Optional[int] = None):
+        self.channels, self.sample_width, self.source_rate = source
+        if self.channels > 2:
+            raise AudioFormatError(f"không hỗ trợ {self.channels} kênh")
+        self.sample_rate = sample_rate or self.source_rate
+        self._state = None
+
+    @property
+    def output_format(self) -> PcmFormat:
+        return 1, 2, self.sample_rate
+
+    def convert(self, pcm: bytes) -> bytes:
+        if self.sample_width == 1:
+            # WAV 8-bit là số không dấu, audioop cần số có dấu
+            pcm = audioop.bias(pcm, 1, -128)
+        if self.sample_width != 2:
+            pcm = audioop.lin2lin(pcm, self.sample_width, 2)
+        if self.channels == 2:
+            pcm = audioop.tomono(pcm, 2, 0.5, 0.5)
+        if self.sample_rate != self.source_rate:
+            pcm, self._state = audioop.ratecv(pcm, 2, 1, self.source_rate, self.sample_rate, self._state)
+        return pcm
+
+
+class Transcoder:
+    """
+    Chuyển một luồng audio nguồn sang định dạng đầu ra. Nguồn là PCM thô (các đoạn WAV đã tách header,
+    `pcm_format` cho biết tham số) hoặc MP3 (gTTS). `spec=None` giữ nguyên định dạng: PCM được gửi
+    thành WAV streaming, MP3 đi thẳng.
+    """
+
+    def __init__(self, spec: Optional[OutputSpec], source_media_type: str, pcm_format: Optional[PcmFormat] = None):
+        self.spec = spec
+        self.source_media_type = source_media_type
+        self.pcm_format = pcm_format
+        self.passthrough = spec is None and pcm_format is None
+        # MP3 -> WAV hoặc MP3 -> định dạng nén khác cần ffmpeg để giải mã; không có thì giữ nguyên MP3
+        if not self.passthrough and pcm_format is None and FFMPEG_PATH is None:
+            self.passthrough = True
+        if not self.passthrough and pcm_format is None and spec.format.name == "mp3" and spec.sample_rate is None:
+            self.passthrough = True
+        self.media_type = source_media_type if self.passthrough else (spec.format.media_type if spec else "audio/wav")
+        # Nhãn định dạng trong số liệu và header X-TTS-Format; "source" = định dạng gốc của backend
+        self.label = "source" if self.passthrough or spec is None else spec.variant
+        self.source_bytes = 0
+        self._waiting_s = 0.0
+
+    async def _timed(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        """Đếm số byte nguồn và thời gian chờ nguồn (không tính vào thời gian mã hoá)."""
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    self._waiting_s += time.perf_counter() - started
+                self.source_bytes += len(chunk)
+                yield chunk
+        finally:
+            # Đóng nguồn ngay (huỷ các đoạn đang tổng hợp) khi client ngắt kết nối hoặc ffmpeg dừng giữa chừng
+            await chunks.aclose()
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        self.source_bytes = 0
+        output_bytes = 0
+        started = time.perf_counter()
+        self._waiting_s = 0.0
+        source = self._timed(chunks)
+        encoded = self._encode(source)
+        try:
+            async for data in encoded:
+                output_bytes += len(data)
+                yield data
+        finally:
+            await encoded.aclose()
+            await source.aclose()
+            record(self.label, self.source_bytes, output_bytes, max(0.0, time.perf_counter() - started - self._waiting_s))
+
+    async def _encode(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        if self.passthrough:
+            async for chunk in chunks:
+                yield chunk
+            return
+
+        sample_rate = self.spec.sample_rate if self.spec else None
+        if self.pcm_format is not None:
+            converter = PcmConverter(self.pcm_format, sample_rate)
+            if self.spec is None or self.spec.format.encoder_args is None:
+                yield wav_stream_header(converter.output_format)
+                async for chunk in chunks:
+                    data = converter.convert(chunk)
+                    if data:
+                        yield data
+                return
+            channels, sample_width, source_rate = self.pcm_format
+            input_args = ["-f", {1: "u8", 2: "s16le", 3: "s24le", 4: "s32le"}[sample_width], "-ar", str(source_rate), "-ac", str(channels)]
+        else:
+            input_args = ["-f", "mp3"]
+
+        if self.spec.format.encoder_args is None:
+            # MP3 -> WAV: ffmpeg giải mã ra PCM thô, header WAV do ta tự ghi
+            rate = sample_rate or DECODE_SAMPLE_RATE
+            yield wav_stream_header((1, 2, rate))
+            output_args = ["-ac", "1", "-ar", str(rate), "-f", "s16le"]
+        else:
+            output_args = ["-ac", "1"] + (["-ar", str(sample_rate)] if sample_rate else []) + self.spec.format.encoder_args
+        async for data in run_ffmpeg(input_args, output_args, chunks):
+            yield data
+
+
+async def run_ffmpeg(input_args: List[str], output_args: List[str], chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Chạy ffmpeg qua pipe: ghi từng đoạn vào stdin (có backpressure) trong khi đọc stdout."""
+    process = await asyncio.create_subprocess_exec(
+        FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-nostdin",
+        *input_args, "-i", "pipe:0", *output_args, "pipe:1",
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+            await chunks.aclose()
+
+    feeder = asyncio.create_task(feed())
+    stderr = asyncio.create_task(process.stderr.read())
+    try:
+        while True:
+            data = await process.stdout.read(_READ_SIZE)
+            if not data:
+                break
+            yield data
+        await feeder
+        if await process.wait() != 0:
+            raise AudioFormatError(f"ffmpeg lỗi ({process.returncode}): {(await stderr).decode(errors='replace').strip()[-500:]}")
+    finally:
+        feeder.cancel()
+        stderr.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def transcode_bytes(content: bytes, source_media_type: str, spec: OutputSpec) -> Optional[Tuple[bytes, str]]:
+    """Chuyển cả một file audio; trả về (audio, media type), hoặc None nếu không chuyển được (giữ audio gốc)."""
+    pcm_format = None
+    if source_media_type == "audio/wav":
+        parsed = parse_wav(content)
+        if parsed is None:
+            return None
+        pcm_format, content = parsed
+    transcoder = Transcoder(spec, source_media_type, pcm_format)
+    if transcoder.passthrough:
+        return None
+
+    async def single():
+        yield content
+
+    try:
+        data = b"".join([part async for part in transcoder.run(single())])
+    except AudioFormatError as e:
+        print(f"--> [TTS] Không chuyển được sang {spec.variant}: {e}")
+        return None
+    return (finalize_wav(data) if transcoder.media_type == "audio/wav" else data), transcoder.media_type
+
+
+# --- Số liệu theo định dạng ---
+
+_lock = threading.Lock()
+# nhãn định dạng -> [số lần, byte nguồn, byte đầu ra, thời gian mã hoá]
+_stats: Dict[str, List[float]] = {}
+
+
+def record(label: str, source_bytes: int, output_bytes: int, encode_s: float):
+    with _lock:
+        row = _stats.setdefault(label, [0, 0, 0, 0.0])
+        row[0] += 1
+        row[1] += source_bytes
+        row[2] += output_bytes
+        row[3] += encode_s
+    TTS_SOURCE_BYTES.inc(source_bytes, format=label)
+    TTS_OUTPUT_BYTES.inc(output_bytes, format=label)
+    observe(TTS_ENCODE_SECONDS, encode_s, format=label)
+
+
+def stats() -> Dict:
+    with _lock:
+        rows = {label: list(row) for label, row in _stats.items()}
+    return {
+        "ffmpeg": FFMPEG_PATH,
+        "formats": {name: {"media_type": f.media_type, "available": f.available} for name, f in OUTPUT_FORMATS.items()},
+        "sample_rates": list(SAMPLE_RATES),
+        "default_format": TTS_DEFAULT_FORMAT or None,
+        "encoded": {
+            label: {
+                "responses": count,
+                "avg_source_bytes": round(source / count),
+                "avg_output_bytes": round(output / count),
+                # Tỉ lệ dung lượng đầu ra / nguồn (byte nguồn là PCM thô hoặc MP3 của backend)
+                "size_ratio": round(output / source, 4) if source else None,
+                "avg_encode_ms": round(encode_s / count * 1000, 2),
+            }
+            for label, (count, source, output, encode_s) in rows.items() if count
+        },
+    }
@@ -0,0 +1,176 @@
+"""
+Chạy một loạt câu hỏi qua agent với số luồng đồng thời giới hạn (dùng cho các job chạy đêm:
+làm mới FAQ, kiểm tra hồi quy sau khi nạp lại QCDT2025...).
+
+- Câu hỏi trùng nhau (cùng câu hỏi đã chuẩn hoá + cùng lịch sử) chỉ chạy agent một lần.
+- Kết quả search Pinecone dùng chung qua `tools.retrieval_cache`.
+- Kết quả được trả về ngay khi từng câu hỏi xong, không đợi cả batch.
+
+CLI:
+    python -m mcp.batch questions.jsonl --concurrency 8 --output results.jsonl
+
+Mỗi dòng của file đầu vào là JSON {"id": ..., "question": ..., "history": [{"role": ..., "content": ...}]}
+(id và history không bắt buộc) hoặc chỉ là câu hỏi dạng văn bản.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from . import rag, tools
+from .budget import RunBudget
+from .session_guard import normalize_question
+from .session_store import serialize_messages
+
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+# Số câu hỏi tối đa trong một request /ask/batch; mỗi câu duy nhất là một lượt chạy agent
+MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", "100"))
+
+
+class BatchItem:
+    def __init__(self, question: str, history: Optional[List[BaseMessage]] = None, item_id: Optional[str] = None):
+        self.question = question
+        self.history = history or []
+        self.item_id = item_id
+
+    def group_key(self) -> str:
+        """Hai câu hỏi có cùng khoá thì cho cùng câu trả lời, chỉ cần chạy một lần."""
+        digest = hashlib.sha1(serialize_messages(self.history))
+        digest.update(normalize_question(self.question).encode("utf-8"))
+        return digest.hexdigest()
+
+
+def messages_from_dicts(messages: List[Dict]) -> List[BaseMessage]:
+    """Chuyển lịch sử dạng [{"role": "user"|"assistant"|"system", "content": ...}] thành message của langchain."""
+    history: List[BaseMessage] = []
+    for message in messages:
+        role, content = message.get("role"), message.get("content", "")
+        if role == "user":
+            history.append(HumanMessage(content=content))
+        elif role == "assistant":
+            history.append(AIMessage(content=content))
+        elif role == "system":
+            history.append(SystemMessage(content=content))
+        else:
+            raise ValueError(f"role không hợp lệ trong lịch sử: '{role}'")
+    return history
+
+
+async def run_batch(
+    items: List[BatchItem],
+    concurrency: int = DEFAULT_CONCURRENCY,
+    time_budget_s: Optional[float] = None,
+    max_tool_rounds: Optional[int] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Chạy các câu hỏi qua `rag.aget_response`, tối đa `concurrency` câu cùng lúc.
+    Trả về dần một sự kiện {"type": "result", ...} cho mỗi câu hỏi theo thứ tự hoàn thành,
+    cuối cùng là {"type": "summary", ...}.
+    """
+    concurrency = max(1, min(concurrency, MAX_CONCURRENCY))
+    started = time.monotonic()
+
+    groups: "OrderedDict[str, List[BatchItem]]" = OrderedDict()
+    for index, item in enumerate(items):
+        if item.item_id is None:
+            item.item_id = str(index)
+        groups.setdefault(item.group_key(), []).append(item)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_group(group: List[BatchItem]):
+        item = group[0]
+        async with semaphore:
+            budget = RunBudget(time_budget_s=time_budget_s, max_tool_rounds=max_tool_rounds)
+            try:
+                answer, _ = await rag.aget_response(item.question, item.history, budget=budget)
+                return group, answer, None, budget
+            except Exception as e:
+                print(f"Lỗi khi chạy batch cho câu hỏi '{item.question}': {e}")
+                return group, None, str(e), budget
+
+    tasks = [asyncio.create_task(run_group(group)) for group in groups.values()]
+    failed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            group, answer, error, budget = await next_done
+            failed += len(group) if error else 0
+            for position, item in enumerate(group):
+                yield {
+                    "type": "result",
+                    "id": item.item_id,
+                    "question": item.question,
+                    "answer": answer,
+                    "error": error,
+                    # Câu hỏi trùng với câu đứng trước trong batch, dùng chung kết quả
+                    "deduplicated": position > 0,
+                    "budget": budget.report(),
+                    "usage": budget.usage(),
+                }
+    finally:
+        # Client ngắt kết nối giữa chừng: huỷ các câu hỏi chưa chạy xong
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "type": "summary",
+        "total": len(items),
+        "unique": len(groups),
+        "failed": failed,
+        "concurrency": concurrency,
+        "elapsed_s": round(time.monotonic() - started, 3),
+        "retrieval_cache": tools.retrieval_cache.stats() if tools.retrieval_cache is not None else None,
+    }
+
+
+def load_items(path: str) -> List[BatchItem]:
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not line.startswith("{"):
+                items.append(BatchItem(line))
+                continue
+            row = json.loads(line)
+            item_id = row.get("id")
+            items.append(BatchItem(
+                row["question"],
+                history=messages_from_dicts(row.get("history") or []),
+                item_id=str(item_id) if item_id is not None else None,
+            ))
+    return items
+
+
+async def _run_cli(args):
+    items = load_items(args.input)
+    output = args.output or os.path.splitext(args.input)[0] + ".results.jsonl"
+    done = 0
+    with open(output, "w", encoding="utf-8") as f:
+        async for event in run_batch(items, args.concurrency, args.time_budget_s, args.max_tool_rounds):
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            f.flush()
+            if event["type"] == "result":
+                done += 1
+                print(f"=== BATCH: {done}/{len(items)} xong (id={event['id']}) ===")
+            else:
+                print(f"=== BATCH: {event} ===")
+    print(f"Đã ghi kết quả vào {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy một loạt câu hỏi qua trợ lý ảo.")
+    parser.add_argument("input", help="File .jsonl (hoặc mỗi dòng một câu hỏi)")
+    parser.add_argument("--output", help="File kết quả .jsonl (mặc định: <input>.results.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--time-budget-s", type=float, default=None)
+    parser.add_argument("--max-tool-rounds", type=int, default=None)
+    asyncio.run(_run_cli(parser.parse_args()))
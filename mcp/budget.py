@@ -0,0 +1,127 @@
+import os
+import time
+from typing import Dict, List, Optional
+
+# Giới hạn mặc định cho một lần chạy agent (có thể chỉnh qua biến môi trường)
+DEFAULT_TIME_BUDGET_S = float(os.getenv("AGENT_TIME_BUDGET_S", "30"))
+DEFAULT_MAX_TOOL_ROUNDS = int(os.getenv("AGENT_MAX_TOOL_ROUNDS", "4"))
+# Thời gian chừa lại cho lượt LLM cuối cùng viết câu trả lời
+DEFAULT_ANSWER_RESERVE_S = float(os.getenv("AGENT_ANSWER_RESERVE_S", "8"))
+
+
+class RunBudget:
+    """
+    Ngân sách (thời gian + số vòng gọi tool) cho một lần chạy agent.
+    Đồng thời ghi nhận mức sử dụng thực tế để báo cáo lại cho client.
+    """
+
+    def __init__(
+        self,
+        time_budget_s: Optional[float] = None,
+        max_tool_rounds: Optional[int] = None,
+        answer_reserve_s: Optional[float] = None,
+    ):
+        self.time_budget_s: float = DEFAULT_TIME_BUDGET_S if time_budget_s is None else time_budget_s
+        self.max_tool_rounds: int = DEFAULT_MAX_TOOL_ROUNDS if max_tool_rounds is None else max_tool_rounds
+        self.answer_reserve_s: float = DEFAULT_ANSWER_RESERVE_S if answer_reserve_s is None else answer_reserve_s
+        # Lượt trả lời cuối không được chiếm quá nửa ngân sách
+        self.answer_reserve_s = min(self.answer_reserve_s, self.time_budget_s / 2)
+
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.tool_rounds: int = 0
+        self.tool_calls: List[str] = []
+        self.cancelled_tools: List[str] = []
+        # Tool trả về lỗi (ToolMessage status="error", kể cả tool bị huỷ do quá thời gian)
+        self.tool_errors: List[str] = []
+        self.forced_answer: bool = False
+        # Số lượt gọi model bị dừng do hết thời gian (câu trả lời là LLM_TIMEOUT_ANSWER của cascade)
+        self.llm_timeouts: int = 0
+        # Câu trả lời lấy từ answer cache (không chạy agent)
+        self.cache_hit: bool = False
+        # Thời điểm (tính từ lúc bắt đầu) sinh ra token đầu tiên của câu trả lời, khi chạy streaming
+        self.first_token_s: Optional[float] = None
+        # Token sử dụng trong lần chạy (theo usage_metadata mà LLM trả về)
+        self.llm_calls: int = 0
+        self.prompt_tokens: int = 0
+        self.completion_tokens: int = 0
+        # Ước lượng số token của phần lịch sử được gửi kèm
+        self.history_tokens: int = 0
+        # Tên model của từng lần gọi LLM và các lần chuyển lên model mạnh hơn (model cascade)
+        self.models: List[str] = []
+        self.escalations: List[str] = []
+
+    def start(self) -> "RunBudget":
+        """Bắt đầu tính giờ (gọi một lần ở đầu get_response)."""
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        return self
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return end - self.started_at
+
+    def remaining(self) -> float:
+        """Số giây còn lại trước deadline."""
+        return max(0.0, self.time_budget_s - self.elapsed())
+
+    def tool_time_left(self) -> float:
+        """Số giây tool còn được chạy (đã trừ phần chừa cho lượt trả lời cuối)."""
+        return max(0.0, self.remaining() - self.answer_reserve_s)
+
+    def exhausted(self) -> bool:
+        """True nếu agent không được gọi thêm tool nữa và phải trả lời ngay."""
+        return self.tool_rounds >= self.max_tool_rounds or self.tool_time_left() <= 0
+
+    def mark_first_token(self):
+        if self.first_token_s is None:
+            self.first_token_s = self.elapsed()
+
+    def record_round(self, tool_names: List[str], cancelled: List[str], errors: Optional[List[str]] = None):
+        self.tool_rounds += 1
+        self.tool_calls.extend(tool_names)
+        self.cancelled_tools.extend(cancelled)
+        self.tool_errors.extend(errors or [])
+
+    def record_llm_usage(self, message, model: Optional[str] = None):
+        """Cộng dồn token từ usage_metadata của một AIMessage (nếu model có trả về)."""
+        self.llm_calls += 1
+        if model is not None:
+            self.models.append(model)
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.prompt_tokens += usage.get("input_tokens", 0)
+        self.completion_tokens += usage.get("output_tokens", 0)
+
+    def usage(self) -> Dict:
+        """Số token của lần chạy, theo định dạng `usage` của OpenAI."""
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "history_tokens": self.history_tokens,
+            "llm_calls": self.llm_calls,
+        }
+
+    def report(self) -> Dict:
+        """Báo cáo mức sử dụng ngân sách của lần chạy."""
+        return {
+            "elapsed_s": round(self.elapsed(), 3),
+            "time_budget_s": self.time_budget_s,
+            "tool_rounds": self.tool_rounds,
+            "max_tool_rounds": self.max_tool_rounds,
+            "tool_calls": list(self.tool_calls),
+            "cancelled_tools": list(self.cancelled_tools),
+            "tool_errors": list(self.tool_errors),
+            "forced_answer": self.forced_answer,
+            "llm_timeouts": self.llm_timeouts,
+            "cache_hit": self.cache_hit,
+            "ttft_s": round(self.first_token_s, 3) if self.first_token_s is not None else None,
+            "prompt_tokens": self.prompt_tokens,
+            "models": list(self.models),
+            "escalations": list(self.escalations),
+        }
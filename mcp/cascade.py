@@ -0,0 +1,266 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langgraph.constants import TAG_NOSTREAM
+
+from .budget import RunBudget
+from .metrics import record_llm_call
+
+# Danh sách model từ rẻ/nhanh tới mạnh, phân tách bằng dấu phẩy
+DEFAULT_CASCADE_MODELS = [
+    name.strip()
+    for name in os.getenv("CASCADE_MODELS", "gemini-2.5-flash-lite,gemini-2.5-flash").split(",")
+    if name.strip()
+]
+# Câu trả lời có dùng kết quả tool mà ngắn hơn ngưỡng này bị coi là chưa đạt
+CASCADE_MIN_ANSWER_CHARS = int(os.getenv("CASCADE_MIN_ANSWER_CHARS", "40"))
+# Ngưỡng avg_logprobs (nếu model có trả về) dưới đó coi là model thiếu tự tin
+CASCADE_MIN_AVG_LOGPROB = float(os.getenv("CASCADE_MIN_AVG_LOGPROB", "-1.0"))
+# Chỉ chuyển lên model mạnh hơn nếu ngân sách còn ít nhất chừng này giây
+CASCADE_MIN_ESCALATION_S = float(os.getenv("CASCADE_MIN_ESCALATION_S", "5"))
+
+# Các câu cho thấy model không tìm được câu trả lời từ ngữ cảnh
+HEDGE_PHRASES = (
+    "không tìm thấy thông tin",
+    "không có thông tin",
+    "tôi không chắc",
+    "không rõ",
+)
+# Câu trả lời thay thế khi lượt gọi model vượt quá thời gian còn lại của ngân sách
+LLM_TIMEOUT_ANSWER = (
+    "Xin lỗi, hệ thống đang phản hồi chậm nên chưa thể trả lời câu hỏi này. "
+    "Bạn vui lòng thử lại sau ít phút."
+)
+# Thread cho lượt gọi model của bản sync (để chờ có giới hạn thời gian). Thread của lượt gọi
+# quá hạn không dừng được, nó chạy tới khi model trả lời; server dùng bản async (ainvoke) nên không gặp giới hạn này.
+# Mỗi lượt sync đang chạy giữ một thread, nên số thread không được nhỏ hơn số thread gọi get_response
+# (threadpool của FastAPI: 40), cộng thêm chỗ cho các lượt quá hạn chưa kết thúc.
+_sync_executor = ThreadPoolExecutor(max_workers=int(os.getenv("CASCADE_SYNC_WORKERS", "64")), thread_name_prefix="cascade")
+
+# finish_reason cho thấy câu trả lời bị cắt hoặc bị chặn
+BAD_FINISH_REASONS = {"MAX_TOKENS", "SAFETY", "RECITATION", "OTHER", "length", "content_filter"}
+
+
+def _text_of(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def needs_escalation(response: AIMessage, messages: Sequence[BaseMessage], tool_names: Sequence[str]) -> Optional[str]:
+    """
+    Heuristic đánh giá đầu ra của một tầng model. Trả về lý do cần chuyển lên tầng mạnh hơn,
+    hoặc None nếu chấp nhận được.
+    - Gọi tool: chỉ từ chối khi gọi tool không tồn tại.
+    - Câu trả lời: rỗng, bị cắt/chặn, logprob thấp, né tránh ("không tìm thấy thông tin...")
+      hoặc quá ngắn so với ngữ cảnh tool đã thu thập.
+    """
+    if response.tool_calls:
+        unknown = [call["name"] for call in response.tool_calls if call["name"] not in tool_names]
+        return f"unknown_tool:{','.join(unknown)}" if unknown else None
+
+    text = _text_of(response).strip()
+    if not text:
+        return "empty_answer"
+
+    metadata = response.response_metadata or {}
+    finish_reason = str(metadata.get("finish_reason") or "")
+    if finish_reason in BAD_FINISH_REASONS:
+        return f"finish_reason:{finish_reason}"
+
+    avg_logprobs = metadata.get("avg_logprobs")
+    if avg_logprobs is not None and avg_logprobs < CASCADE_MIN_AVG_LOGPROB:
+        return "low_confidence"
+
+    lowered = text.lower()
+    if any(phrase in lowered for phrase in HEDGE_PHRASES):
+        return "hedged_answer"
+
+    if len(text) < CASCADE_MIN_ANSWER_CHARS and any(isinstance(m, ToolMessage) for m in messages):
+        return "short_answer"
+    return None
+
+
+class ModelTier:
+    """Một tầng của cascade: model gốc, hai bản đã bind tool và số liệu của tầng."""
+
+    def __init__(self, name: str, llm, tools: Sequence):
+        self.name = name
+        self.llm = llm
+        self.llm_with_tools = llm.bind_tools(tools)
+        # Vẫn khai báo tool để model hiểu lịch sử gọi tool, nhưng cấm gọi thêm
+        self.llm_answer_only = llm.bind_tools(tools, tool_choice="none")
+        self.calls = 0
+        self.errors = 0
+        self.accepted = 0
+        self.escalated = 0
+        self.latency_s = 0.0
+        self._lock = threading.Lock()
+
+    def model(self, answer_only: bool):
+        return self.llm_answer_only if answer_only else self.llm_with_tools
+
+    def record(self, latency_s: float, outcome: str):
+        with self._lock:
+            self.calls += 1
+            self.latency_s += latency_s
+            if outcome == "error":
+                self.errors += 1
+            elif outcome == "accepted":
+                self.accepted += 1
+            else:
+                self.escalated += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "accepted": self.accepted,
+                "escalated": self.escalated,
+                "errors": self.errors,
+                "latency_s": round(self.latency_s, 3),
+                "avg_latency_s": round(self.latency_s / self.calls, 3) if self.calls else 0.0,
+            }
+
+
+class ModelCascade:
+    """
+    Gọi lần lượt các tầng model, từ rẻ/nhanh tới mạnh:
+    tầng đầu xử lý việc chọn tool và câu trả lời đơn giản; chỉ khi `escalation_check`
+    đánh giá đầu ra chưa đạt (hoặc tầng đó lỗi) mới chuyển lên tầng tiếp theo.
+
+    Chỉ đầu ra của tầng cuối được stream token trực tiếp; các tầng trước được gắn tag
+    `nostream` để câu trả lời bị loại không lọt ra client.
+    """
+
+    def __init__(
+        self,
+        tiers: List[ModelTier],
+        escalation_check: Callable[[AIMessage, Sequence[BaseMessage], Sequence[str]], Optional[str]] = needs_escalation,
+        min_escalation_s: float = CASCADE_MIN_ESCALATION_S,
+    ):
+        if not tiers:
+            raise ValueError("Cascade cần ít nhất một model.")
+        self.tiers = tiers
+        self.escalation_check = escalation_check
+        self.min_escalation_s = min_escalation_s
+        self.tool_names: List[str] = []
+
+    @classmethod
+    def from_models(cls, models: Sequence[Tuple[str, object]], tools: Sequence, **kwargs) -> "ModelCascade":
+        """Tạo cascade từ danh sách (tên, chat model) theo thứ tự từ rẻ tới mạnh."""
+        cascade = cls([ModelTier(name, llm, tools) for name, llm in models], **kwargs)
+        cascade.tool_names = [t.name for t in tools]
+        return cascade
+
+    @property
+    def cheapest(self) -> ModelTier:
+        return self.tiers[0]
+
+    @property
+    def strongest(self) -> ModelTier:
+        return self.tiers[-1]
+
+    def _can_escalate(self, index: int, budget: Optional[RunBudget]) -> bool:
+        if index == len(self.tiers) - 1:
+            return False
+        return budget is None or budget.remaining() >= self.min_escalation_s
+
+    def _call_config(self, index: int, budget: Optional[RunBudget]) -> Optional[dict]:
+        # Đầu ra có thể bị loại thì không stream
+        return {"tags": [TAG_NOSTREAM]} if self._can_escalate(index, budget) else None
+
+    def _review(self, index: int, tier: ModelTier, response: AIMessage, messages, budget, started: float) -> bool:
+        """Ghi nhận kết quả của một tầng. Trả về True nếu chấp nhận đầu ra này."""
+        latency_s = time.monotonic() - started
+        if budget is not None:
+            budget.record_llm_usage(response, model=tier.name)
+        reason = self.escalation_check(response, messages, self.tool_names) if self._can_escalate(index, budget) else None
+        if reason is None:
+            tier.record(latency_s, "accepted")
+            record_llm_call(tier.name, latency_s, "accepted", response)
+            return True
+        tier.record(latency_s, "escalated")
+        record_llm_call(tier.name, latency_s, "escalated", response)
+        print(f"--- CASCADE: {tier.name} -> {self.tiers[index + 1].name} ({reason}) ---")
+        if budget is not None:
+            budget.escalations.append(f"{tier.name}:{reason}")
+        return False
+
+    def _on_error(self, index: int, tier: ModelTier, error: Exception, budget, started: float):
+        latency_s = time.monotonic() - started
+        tier.record(latency_s, "error")
+        record_llm_call(tier.name, latency_s, "error")
+        if index == len(self.tiers) - 1:
+            raise error
+        print(f"--- CASCADE: {tier.name} lỗi ({error}), chuyển sang {self.tiers[index + 1].name} ---")
+        if budget is not None:
+            budget.escalations.append(f"{tier.name}:error")
+
+    def _on_timeout(self, tier: ModelTier, budget: Optional[RunBudget], started: float) -> AIMessage:
+        """Hết ngân sách thời gian trong lúc chờ model: không chuyển tầng (không còn thời gian), trả lời thay thế."""
+        latency_s = time.monotonic() - started
+        tier.record(latency_s, "error")
+        record_llm_call(tier.name, latency_s, "timeout")
+        print(f"--- CASCADE: {tier.name} quá thời gian ({latency_s:.1f}s), dừng chờ ---")
+        if budget is not None:
+            budget.llm_timeouts += 1
+        return AIMessage(content=LLM_TIMEOUT_ANSWER)
+
+    def invoke(self, messages: List[BaseMessage], answer_only: bool = False, budget: Optional[RunBudget] = None) -> AIMessage:
+        for index, tier in enumerate(self.tiers):
+            started = time.monotonic()
+            try:
+                call = tier.model(answer_only).invoke
+                config = self._call_config(index, budget)
+                if budget is None:
+                    response = call(messages, config=config)
+                else:
+                    if budget.remaining() <= 0:
+                        raise FutureTimeoutError
+                    future = _sync_executor.submit(contextvars.copy_context().run, call, messages, config=config)
+                    response = future.result(timeout=budget.remaining())
+            except FutureTimeoutError as e:
+                if budget is None:
+                    self._on_error(index, tier, e, budget, started)
+                    continue
+                return self._on_timeout(tier, budget, started)
+            except Exception as e:
+                self._on_error(index, tier, e, budget, started)
+                continue
+            if self._review(index, tier, response, messages, budget, started):
+                return response
+
+    async def ainvoke(self, messages: List[BaseMessage], answer_only: bool = False, budget: Optional[RunBudget] = None) -> AIMessage:
+        """Bản async của invoke."""
+        for index, tier in enumerate(self.tiers):
+            started = time.monotonic()
+            try:
+                call = tier.model(answer_only).ainvoke(messages, config=self._call_config(index, budget))
+                if budget is None:
+                    response = await call
+                elif budget.remaining() <= 0:
+                    call.close()
+                    raise asyncio.TimeoutError
+                else:
+                    response = await asyncio.wait_for(call, timeout=budget.remaining())
+            except asyncio.TimeoutError as e:
+                if budget is None:
+                    self._on_error(index, tier, e, budget, started)
+                    continue
+                return self._on_timeout(tier, budget, started)
+            except Exception as e:
+                self._on_error(index, tier, e, budget, started)
+                continue
+            if self._review(index, tier, response, messages, budget, started):
+                return response
+
+    def stats(self) -> Dict:
+        return {"tiers": [{"name": tier.name, **tier.stats()} for tier in self.tiers]}
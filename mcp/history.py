@@ -0,0 +1,173 @@
+import os
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+# Cấu hình mặc định cho việc cắt gọn lịch sử hội thoại
+DEFAULT_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+DEFAULT_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+# Độ dài tối đa (ước lượng token) của bản tóm tắt
+DEFAULT_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+
+# Đánh dấu SystemMessage chứa bản tóm tắt ở đầu lịch sử
+SUMMARY_KEY = "conversation_summary"
+
+SUMMARY_PROMPT = """Tóm tắt ngắn gọn cuộc hội thoại giữa sinh viên và trợ lý ảo Đại học Bách Khoa Hà Nội dưới đây.
+Giữ lại: chủ đề sinh viên đang hỏi, các dữ kiện cụ thể đã được trả lời (số liệu, hạn nộp, tên học bổng, quy định...),
+và thông tin cá nhân sinh viên đã cung cấp (ngành học, khoá...). Không thêm thông tin mới. Tối đa khoảng {max_words} từ.
+
+Tóm tắt trước đó:
+{previous_summary}
+
+Đoạn hội thoại cần gộp vào tóm tắt:
+{transcript}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (tiếng Việt trung bình ~4 ký tự/token), đủ dùng để cắt lịch sử."""
+    return len(text) // 4 + 1
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return str(content)
+
+
+def is_summary_message(message: BaseMessage) -> bool:
+    return isinstance(message, SystemMessage) and message.additional_kwargs.get(SUMMARY_KEY, False)
+
+
+class HistoryManager:
+    """
+    Quản lý lịch sử hội thoại theo ngân sách token:
+    - Giữ nguyên văn tối đa `max_turns` lượt gần nhất, miễn là nằm trong `token_budget`.
+    - Các lượt cũ hơn được gộp vào một bản tóm tắt cuốn chiếu (rolling summary),
+      lưu ở đầu lịch sử dưới dạng SystemMessage có đánh dấu `SUMMARY_KEY`.
+
+    Việc tóm tắt (gọi LLM) được thực hiện bằng `compact`, nên chạy sau khi đã trả lời client.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        max_turns: int = DEFAULT_MAX_TURNS,
+        token_budget: int = DEFAULT_TOKEN_BUDGET,
+        summary_tokens: int = DEFAULT_SUMMARY_TOKENS,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        self.llm = llm
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.token_counter = token_counter
+
+    # --- Đếm token ---
+
+    def count_tokens(self, messages: List[BaseMessage]) -> int:
+        return sum(self.token_counter(_message_text(m)) for m in messages)
+
+    # --- Tách lịch sử ---
+
+    @staticmethod
+    def split_summary(history: List[BaseMessage]) -> Tuple[Optional[str], List[BaseMessage]]:
+        """Tách bản tóm tắt (nếu có) khỏi phần hội thoại nguyên văn."""
+        if history and is_summary_message(history[0]):
+            return _message_text(history[0]), list(history[1:])
+        return None, list(history)
+
+    @staticmethod
+    def split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+        """Chia danh sách message thành các lượt, mỗi lượt bắt đầu bằng một HumanMessage."""
+        turns: List[List[BaseMessage]] = []
+        for message in messages:
+            if isinstance(message, HumanMessage) or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return turns
+
+    def _select_recent(self, turns: List[List[BaseMessage]]) -> int:
+        """Trả về số lượt cuối cùng được giữ nguyên văn (theo max_turns và token_budget)."""
+        kept, tokens = 0, 0
+        for turn in reversed(turns[-self.max_turns:] if self.max_turns > 0 else []):
+            turn_tokens = self.count_tokens(turn)
+            # Luôn giữ ít nhất một lượt để agent hiểu câu hỏi nối tiếp
+            if kept and tokens + turn_tokens > self.token_budget:
+                break
+            kept += 1
+            tokens += turn_tokens
+        return kept
+
+    def prepare(self, history: List[BaseMessage]) -> Tuple[Optional[str], List[BaseMessage]]:
+        """
+        Chọn phần lịch sử sẽ gửi cho LLM ở lượt này: (bản tóm tắt, các lượt gần nhất).
+        Không gọi LLM, nên an toàn trên đường xử lý chính.
+        """
+        summary, messages = self.split_summary(history)
+        turns = self.split_turns(messages)
+        kept = self._select_recent(turns)
+        recent = [m for turn in turns[len(turns) - kept:] for m in turn] if kept else []
+        return summary, recent
+
+    def needs_compaction(self, history: List[BaseMessage]) -> bool:
+        _, messages = self.split_summary(history)
+        turns = self.split_turns(messages)
+        return self._select_recent(turns) < len(turns)
+
+    # --- Tóm tắt cuốn chiếu ---
+
+    def _summary_prompt(self, previous_summary: Optional[str], messages: List[BaseMessage]) -> str:
+        transcript = "\n".join(
+            f"{'Sinh viên' if isinstance(m, HumanMessage) else 'Trợ lý'}: {_message_text(m)}"
+            for m in messages if isinstance(m, (HumanMessage, AIMessage))
+        )
+        return SUMMARY_PROMPT.format(
+            max_words=self.summary_tokens * 3 // 4,
+            previous_summary=previous_summary or "(chưa có)",
+            transcript=transcript,
+        )
+
+    def summarize(self, previous_summary: Optional[str], messages: List[BaseMessage]) -> str:
+        response = self.llm.invoke([HumanMessage(content=self._summary_prompt(previous_summary, messages))])
+        return _message_text(response).strip()
+
+    async def asummarize(self, previous_summary: Optional[str], messages: List[BaseMessage]) -> str:
+        response = await self.llm.ainvoke([HumanMessage(content=self._summary_prompt(previous_summary, messages))])
+        return _message_text(response).strip()
+
+    def _split_for_compaction(self, history: List[BaseMessage]):
+        """Trả về (tóm tắt cũ, các message cần gộp, các message giữ nguyên) hoặc None nếu không cần nén."""
+        summary, messages = self.split_summary(history)
+        turns = self.split_turns(messages)
+        kept = self._select_recent(turns)
+        if kept == len(turns) or self.llm is None:
+            return None
+        old_messages = [m for turn in turns[:len(turns) - kept] for m in turn]
+        recent = [m for turn in turns[len(turns) - kept:] for m in turn]
+        return summary, old_messages, recent
+
+    def compact(self, history: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Gộp các lượt nằm ngoài cửa sổ nguyên văn vào bản tóm tắt.
+        Trả về lịch sử mới: [SystemMessage(tóm tắt), *các lượt gần nhất].
+        """
+        parts = self._split_for_compaction(history)
+        if parts is None:
+            return list(history)
+        summary, old_messages, recent = parts
+        return [make_summary_message(self.summarize(summary, old_messages)), *recent]
+
+    async def acompact(self, history: List[BaseMessage]) -> List[BaseMessage]:
+        """Bản async của compact."""
+        parts = self._split_for_compaction(history)
+        if parts is None:
+            return list(history)
+        summary, old_messages, recent = parts
+        return [make_summary_message(await self.asummarize(summary, old_messages)), *recent]
+
+
+def make_summary_message(summary: str) -> SystemMessage:
+    return SystemMessage(content=summary, additional_kwargs={SUMMARY_KEY: True})
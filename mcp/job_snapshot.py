@@ -0,0 +1,274 @@
+"""
+Snapshot tin tuyển dụng dạng cột (file .jobsnap) thay cho job_data/*_clean.json.
+
+Danh sách việc làm chỉ cần các trường ngắn (tên, công ty, hạn nộp, địa điểm, chuyên ngành...), còn
+description/requirements/benefits là HTML dài chiếm phần lớn dung lượng. File .jobsnap tách hai phần:
+
+- phần tóm tắt: các trường ngắn lưu theo cột, chuỗi được gộp vào một bảng chuỗi không trùng lặp
+  (địa điểm, chuyên ngành, công ty lặp lại rất nhiều), đọc vào bộ nhớ khi mở file;
+- phần blob: HTML của từng tin nén zlib riêng, đọc qua mmap và chỉ giải nén khi cần xem chi tiết.
+
+Cấu trúc file (little-endian):
+    header  "<8sHHII": magic b"SOTAYJOB", phiên bản, số trường blob, số tin, độ dài meta
+    meta    JSON UTF-8: {"fields", "blob_fields", "strings", "columns"}
+    offsets u32 x (số tin * số trường blob + 1): vị trí bắt đầu từng blob trong vùng blob
+    blobs   các blob nén zlib nối liền nhau
+
+Tạo snapshot từ file JSON (ghi cạnh file gốc, đuôi .jobsnap):
+    python -m mcp.job_snapshot job_data/*.json
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Thư mục chứa các file .jobsnap dùng làm dữ liệu dự phòng cho /jobs khi crawl ctsv thất bại; rỗng = tắt
+JOB_SNAPSHOT_DIR = os.getenv("JOB_SNAPSHOT_DIR", "")
+
+MAGIC = b"SOTAYJOB"
+VERSION = 1
+_HEADER = struct.Struct("<8sHHII")
+BLOB_FIELDS = ("description", "requirements", "benefits")
+EXTENSION = ".jobsnap"
+
+# location_code của ctsv (xem main.py: /jobs) -> file snapshot
+SNAPSHOT_FILES = {
+    1: "hust_hot_jobs_clean" + EXTENSION,
+    2: "hust_new_jobs_clean" + EXTENSION,
+    3: "hust_intern_jobs_clean" + EXTENSION,
+}
+
+
+class SnapshotError(Exception):
+    """File không phải snapshot hợp lệ (sai magic/phiên bản, bị cắt cụt)."""
+
+
+def _encode_column(values: List, strings: List[str], string_ids: Dict[str, int]) -> Dict:
+    """Cột toàn chuỗi (hoặc None) lưu theo chỉ số trong bảng chuỗi (-1 = None), cột khác lưu nguyên giá trị."""
+    if all(value is None or isinstance(value, str) for value in values):
+        ids = []
+        for value in values:
+            if value is None:
+                ids.append(-1)
+                continue
+            if value not in string_ids:
+                string_ids[value] = len(strings)
+                strings.append(value)
+            ids.append(string_ids[value])
+        return {"kind": "str", "values": ids}
+    return {"kind": "json", "values": values}
+
+
+def write_snapshot(jobs: Sequence[Dict], path: str, level: int = 6) -> int:
+    """
+    Ghi danh sách tin (dạng đã làm sạch của parse_job_data) thành file snapshot; trả về kích thước file.
+    Thứ tự trường giữ như trong dữ liệu, tin thiếu trường được đọc lại thành None.
+    """
+    fields: List[str] = []
+    for job in jobs:
+        for key in job:
+            if key not in fields:
+                fields.append(key)
+    summary_fields = [key for key in fields if key not in BLOB_FIELDS]
+
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+    columns = {key: _encode_column([job.get(key) for job in jobs], strings, string_ids) for key in summary_fields}
+    meta = json.dumps(
+        {"fields": fields, "blob_fields": list(BLOB_FIELDS), "strings": strings, "columns": columns},
+        ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+
+    offsets = array("I", [0])
+    blobs: List[bytes] = []
+    for job in jobs:
+        for key in BLOB_FIELDS:
+            blob = zlib.compress((job.get(key) or "").encode("utf-8"), level)
+            blobs.append(blob)
+            offsets.append(offsets[-1] + len(blob))
+    if sys.byteorder != "little":
+        offsets.byteswap()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(BLOB_FIELDS), len(jobs), len(meta)))
+            f.write(meta)
+            f.write(offsets.tobytes())
+            f.writelines(blobs)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return os.path.getsize(path)
+
+
+def convert_json(json_path: str, out_path: Optional[str] = None) -> str:
+    """Chuyển một file job_data/*.json (danh sách tin đã làm sạch) sang .jobsnap; trả về đường dẫn file mới."""
+    out_path = out_path or os.path.splitext(json_path)[0] + EXTENSION
+    with open(json_path, "r", encoding="utf-8") as f:
+        jobs = json.load(f)
+    write_snapshot(jobs, out_path)
+    return out_path
+
+
+class JobSnapshot:
+    """
+    Đọc file .jobsnap: phần tóm tắt nằm trong bộ nhớ, phần blob đọc qua mmap (các worker
+    mở cùng file dùng chung page cache của hệ điều hành).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"{path}: {e}") from e
+        try:
+            self._parse()
+        except (ValueError, IndexError, KeyError, struct.error) as e:
+            self._mmap.close()
+            raise SnapshotError(f"{path}: {e}") from e
+        self._lower_cache: Dict[str, List[str]] = {}
+
+    def _parse(self):
+        magic, version, blob_count, count, meta_len = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"magic/phiên bản không hợp lệ ({magic!r}, {version})")
+        start = _HEADER.size
+        meta = json.loads(self._mmap[start:start + meta_len])
+        self.fields: List[str] = meta["fields"]
+        self.blob_fields: List[str] = meta["blob_fields"]
+        if len(self.blob_fields) != blob_count:
+            raise ValueError("số trường blob không khớp")
+        self.summary_fields = [key for key in self.fields if key not in self.blob_fields]
+        strings: List[str] = meta["strings"]
+        self._columns: Dict[str, List] = {}
+        for key, column in meta["columns"].items():
+            values = column["values"]
+            self._columns[key] = [strings[i] if i >= 0 else None for i in values] if column["kind"] == "str" else values
+        self._count = count
+
+        start += meta_len
+        offsets_len = (count * blob_count + 1) * 4
+        self._offsets = array("I")
+        self._offsets.frombytes(self._mmap[start:start + offsets_len])
+        if sys.byteorder != "little":
+            self._offsets.byteswap()
+        self._blob_start = start + offsets_len
+        if self._blob_start + self._offsets[-1] > len(self._mmap):
+            raise ValueError("file bị cắt cụt")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self, index: int, fields: Optional[Iterable[str]] = None) -> Dict:
+        """Các trường tóm tắt của một tin (không đụng tới phần blob)."""
+        return {key: self._columns[key][index] for key in (fields or self.summary_fields)}
+
+    def summaries(self, fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        fields = list(fields or self.summary_fields)
+        return [self.summary(index, fields) for index in range(self._count)]
+
+    def blob(self, index: int, field: str) -> str:
+        """Giải nén một trường HTML của một tin."""
+        position = index * len(self.blob_fields) + self.blob_fields.index(field)
+        start = self._blob_start + self._offsets[position]
+        end = self._blob_start + self._offsets[position + 1]
+        return zlib.decompress(self._mmap[start:end]).decode("utf-8")
+
+    def job(self, index: int) -> Dict:
+        """Tin đầy đủ, giống bản ghi trong file JSON gốc."""
+        return {key: self.blob(index, key) if key in self.blob_fields else self._columns[key][index] for key in self.fields}
+
+    def _lower(self, key: str) -> List[str]:
+        if key not in self._lower_cache:
+            values = self._columns.get(key) or [None] * self._count
+            self._lower_cache[key] = [value.lower() if isinstance(value, str) else "" for value in values]
+        return self._lower_cache[key]
+
+    def filter(self, career: Optional[str] = None, city: Optional[str] = None) -> List[int]:
+        """Chỉ số các tin khớp bộ lọc, cùng cách lọc với fetch_jobs (chuỗi con, không phân biệt hoa/thường)."""
+        indexes = range(self._count)
+        if city:
+            locations = self._lower("location")
+            normalized_city = city.strip().lower()
+            indexes = [i for i in indexes if normalized_city in locations[i]]
+        if career:
+            majors = self._lower("majors_required")
+            normalized_career = career.strip().lower()
+            indexes = [i for i in indexes if normalized_career in majors[i]]
+        return list(indexes)
+
+    def jobs(self, career: Optional[str] = None, city: Optional[str] = None) -> List[Dict]:
+        """Các tin đầy đủ khớp bộ lọc (giải nén HTML, nên gọi ngoài event loop)."""
+        return [self.job(index) for index in self.filter(career=career, city=city)]
+
+
+# location_code -> (chữ ký file lúc mở: inode, mtime, kích thước; snapshot hoặc None nếu file lỗi)
+_snapshots: Dict[int, Tuple[Tuple[int, int, int], Optional[JobSnapshot]]] = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_snapshot(location_code: int) -> Optional[JobSnapshot]:
+    """
+    Snapshot của một loại tin; None nếu tắt, không có file hoặc file lỗi.
+    File được mở lại khi bị thay (inode/mtime/kích thước khác, vd sau khi chạy lại `python -m mcp.job_snapshot`),
+    file lỗi cũng được thử lại khi thay đổi. Snapshot cũ không bị đóng ở đây vì request khác có thể vẫn đang đọc;
+    mmap của nó được giải phóng khi không còn ai dùng.
+    """
+    if not JOB_SNAPSHOT_DIR or location_code not in SNAPSHOT_FILES:
+        return None
+    path = os.path.join(JOB_SNAPSHOT_DIR, SNAPSHOT_FILES[location_code])
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+    with _snapshots_lock:
+        cached = _snapshots.get(location_code)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            snapshot = JobSnapshot(path)
+        except (OSError, SnapshotError) as e:
+            print(f"--- JOB SNAPSHOT: không mở được {path}: {e} ---")
+            snapshot = None
+        _snapshots[location_code] = (signature, snapshot)
+        return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển job_data/*.json sang snapshot dạng cột (.jobsnap).")
+    parser.add_argument("inputs", nargs="+", help="Các file JSON danh sách tin đã làm sạch")
+    parser.add_argument("--out-dir", help="Thư mục ghi file .jobsnap (mặc định: cạnh file JSON)")
+    args = parser.parse_args()
+    for json_path in args.inputs:
+        out_path = None
+        if args.out_dir:
+            out_path = os.path.join(args.out_dir, os.path.splitext(os.path.basename(json_path))[0] + EXTENSION)
+        out_path = convert_json(json_path, out_path)
+        print(f"{json_path} ({os.path.getsize(json_path)} bytes) -> {out_path} ({os.path.getsize(out_path)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
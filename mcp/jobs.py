@@ -1,9 +1,16 @@
-import requests
+import os
 import json
 import time
 from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 
+from .metrics import http_post
+
+# Địa chỉ API của ctsv; đổi sang mock server khi chạy load test (bench/load_test.py)
+CTSV_BASE_URL = os.getenv("CTSV_BASE_URL", "https://ctsv.hust.edu.vn").rstrip("/")
+# Thời gian nghỉ giữa hai trang khi crawl, tránh gửi dồn dập tới ctsv
+CTSV_PAGE_DELAY_S = float(os.getenv("CTSV_PAGE_DELAY_S", "0.5"))
+
 # --- Các hàm xử lý và làm sạch dữ liệu (giữ nguyên) ---
 
 # Dữ liệu tĩnh về chuyên ngành và tỉnh thành
@@ -87,7 +94,7 @@ def get_raw_jobs_from_page(page_number: int, location_code: int, page_size: int
     """
     Hàm này giờ có nhiệm vụ lấy dữ liệu thô từ API.
     """
-    url = "https://ctsv.hust.edu.vn/api-t/HWRecruitment/GetPublishRecruitment"
+    url = f"{CTSV_BASE_URL}/api-t/HWRecruitment/GetPublishRecruitment"
     headers = {
         'Accept': 'application/json',
         'Content-Type': 'application/json',
@@ -104,7 +111,7 @@ def get_raw_jobs_from_page(page_number: int, location_code: int, page_size: int
         "PublishLocation": location_code
     }
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
+        response = http_post("ctsv_jobs", url, headers=headers, json=payload, timeout=15)
         response.raise_for_status()
         data = response.json()
         return data.get('RecruitmentLst', [])
@@ -116,10 +123,11 @@ def fetch_jobs(
     location_code: int,
     career: Optional[str] = None,
     city: Optional[str] = None
-) -> List[Dict]:
+) -> Optional[List[Dict]]:
     """
     Hàm chính để crawl và lọc việc làm.
     Nó sẽ crawl toàn bộ dữ liệu trước, sau đó mới áp dụng bộ lọc.
+    Trả về None nếu không gọi được API (trang đầu tiên lỗi).
     """
     all_clean_jobs = []
     
@@ -134,7 +142,12 @@ def fetch_jobs(
             
         print(f"Đang crawl trang {current_page}...")
         raw_jobs_on_page = get_raw_jobs_from_page(current_page, location_code=location_code)
-        
+
+        if raw_jobs_on_page is None and current_page == 1:
+            # Không gọi được ctsv (khác với ctsv không có tin nào)
+            print("Không crawl được trang đầu tiên.")
+            return None
+
         if raw_jobs_on_page is None or not raw_jobs_on_page:
             print("Hết dữ liệu. Kết thúc crawl.")
             break
@@ -145,7 +158,7 @@ def fetch_jobs(
             all_clean_jobs.append(clean_job)
             
         current_page += 1
-        time.sleep(0.5)
+        time.sleep(CTSV_PAGE_DELAY_S)
 
     print(f"Crawl xong. Có tổng cộng {len(all_clean_jobs)} tin tuyển dụng.")
 
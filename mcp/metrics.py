@@ -0,0 +1,257 @@
+"""
+Đo thời gian (span) và xuất số liệu theo định dạng văn bản của Prometheus cho endpoint `/metrics`.
+
+Không phụ thuộc thư viện ngoài. Mỗi span chỉ tốn vài phép cộng dưới một khoá, nên để bật
+thường trực trên production được. Đặt METRICS_TRACE_LOG=1 để in thêm mỗi lượt hỏi một dòng JSON
+liệt kê các span (agent, LLM, tool, Pinecone, HTTP) của lượt đó.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import requests
+
+METRICS_ENABLED = os.getenv("METRICS", "1") == "1"
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "0") == "1"
+METRICS_PREFIX = "sotay_"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # nhãn -> [số đếm theo từng bucket (không cộng dồn), tổng, số lần]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total!r}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# --- Các số liệu của ứng dụng ---
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_seconds", "Thời gian xử lý request (tới khi gửi header).", ["method", "route", "status"])
+AGENT_STEP_SECONDS = Histogram("agent_step_seconds", "Thời gian mỗi bước của agent (agent = gọi LLM, action = chạy tool).", ["node"])
+LLM_CALL_SECONDS = Histogram("llm_call_seconds", "Thời gian mỗi lần gọi LLM.", ["model", "outcome"])
+LLM_TOKENS = Counter("llm_tokens_total", "Số token LLM đã dùng.", ["model", "kind"])
+TOOL_CALL_SECONDS = Histogram("tool_call_seconds", "Thời gian mỗi lần chạy tool.", ["tool", "status"])
+RETRIEVAL_SECONDS = Histogram("retrieval_seconds", "Thời gian mỗi truy vấn get_similar_doc.", ["namespace", "cache"])
+UPSTREAM_HTTP_SECONDS = Histogram("upstream_http_seconds", "Thời gian mỗi request tới dịch vụ ngoài (ctsv, TTS...).", ["target", "status"])
+TTS_BACKEND_SECONDS = Histogram("tts_backend_seconds", "Thời gian mỗi lần tổng hợp giọng nói theo backend.", ["backend", "outcome"])
+TTS_ENCODE_SECONDS = Histogram("tts_encode_seconds", "Thời gian chuyển định dạng audio /tts (không tính thời gian chờ tổng hợp).", ["format"])
+TTS_SOURCE_BYTES = Counter("tts_source_bytes_total", "Số byte audio nguồn (của backend) đưa vào chuyển định dạng.", ["format"])
+TTS_OUTPUT_BYTES = Counter("tts_output_bytes_total", "Số byte audio /tts gửi về sau khi chuyển định dạng.", ["format"])
+
+_METRICS: List[_Metric] = [
+    HTTP_REQUEST_SECONDS,
+    AGENT_STEP_SECONDS,
+    LLM_CALL_SECONDS,
+    LLM_TOKENS,
+    TOOL_CALL_SECONDS,
+    RETRIEVAL_SECONDS,
+    UPSTREAM_HTTP_SECONDS,
+    TTS_BACKEND_SECONDS,
+    TTS_ENCODE_SECONDS,
+    TTS_SOURCE_BYTES,
+    TTS_OUTPUT_BYTES,
+]
+
+# Các hàm trả về số liệu tại thời điểm xuất: (tên, mô tả, loại, [(nhãn, giá trị)])
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]):
+    """Đăng ký một hàm cung cấp số liệu lấy tại thời điểm xuất (kích thước cache, số phiên...)."""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    """Xuất toàn bộ số liệu theo định dạng văn bản của Prometheus."""
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception as e:
+            print(f"Lỗi khi lấy số liệu cho /metrics: {e}")
+            continue
+        for name, documentation, kind, values in samples:
+            full_name = METRICS_PREFIX + name
+            lines.append(f"# HELP {full_name} {documentation}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in values:
+                lines.append(f"{full_name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Span ---
+
+# Danh sách span của lượt hỏi hiện tại (None nếu không ghi trace)
+_current_trace: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("sotay_trace", default=None)
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """
+    Gom các span phát sinh trong khối lệnh (kể cả trong task con) thành một trace,
+    in ra một dòng JSON khi kết thúc nếu METRICS_TRACE_LOG=1.
+    """
+    if not METRICS_TRACE_LOG:
+        yield
+        return
+    spans: list = []
+    token = _current_trace.set(spans)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+        print(json.dumps({
+            "trace": name,
+            **attributes,
+            "duration_s": round(time.perf_counter() - started, 4),
+            "spans": spans,
+        }, ensure_ascii=False))
+
+
+@contextmanager
+def span(histogram: Histogram, **labels):
+    """
+    Đo thời gian khối lệnh và ghi vào `histogram`. Khối lệnh có thể sửa `labels`
+    (ví dụ gán status sau khi có kết quả); lỗi không bắt được sẽ được ghi với status="error".
+    """
+    if not METRICS_ENABLED:
+        yield labels
+        return
+    started = time.perf_counter()
+    try:
+        yield labels
+    except BaseException as e:
+        labels.setdefault("status", "cancelled" if isinstance(e, asyncio.CancelledError) else "error")
+        raise
+    finally:
+        observe(histogram, time.perf_counter() - started, **labels)
+
+
+def observe(histogram: Histogram, duration_s: float, **labels):
+    """Ghi một span đã đo sẵn thời gian."""
+    if not METRICS_ENABLED:
+        return
+    histogram.observe(duration_s, **labels)
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append({"span": histogram.name[len(METRICS_PREFIX):].removesuffix("_seconds"), **labels, "duration_s": round(duration_s, 4)})
+
+
+def record_llm_call(model: str, duration_s: float, outcome: str, message=None):
+    """Ghi thời gian và số token của một lần gọi LLM."""
+    if not METRICS_ENABLED:
+        return
+    usage = (getattr(message, "usage_metadata", None) or {}) if message is not None else {}
+    LLM_CALL_SECONDS.observe(duration_s, model=model, outcome=outcome)
+    LLM_TOKENS.inc(usage.get("input_tokens", 0), model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.get("output_tokens", 0), model=model, kind="completion")
+    spans = _current_trace.get()
+    if spans is not None:
+        spans.append({
+            "span": "llm_call",
+            "model": model,
+            "outcome": outcome,
+            "prompt_tokens": usage.get("input_tokens", 0),
+            "completion_tokens": usage.get("output_tokens", 0),
+            "duration_s": round(duration_s, 4),
+        })
+
+
+def http_post(target: str, url: str, **kwargs) -> requests.Response:
+    """requests.post có đo thời gian; `target` là tên ngắn của dịch vụ (ví dụ "ctsv_jobs")."""
+    with span(UPSTREAM_HTTP_SECONDS, target=target) as labels:
+        response = requests.post(url, **kwargs)
+        labels["status"] = str(response.status_code)
+        return response
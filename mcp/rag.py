@@ -1,10 +1,13 @@
+import asyncio
+import contextvars
+import hashlib
 import os
-from typing import Annotated, List, Tuple
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Annotated, AsyncIterator, Iterator, List, Optional, Tuple
 
 from langchain_core.messages import BaseMessage, ToolMessage, AIMessage, HumanMessage, SystemMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.graph import END, StateGraph
-from langgraph.prebuilt import ToolNode
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from typing_extensions import TypedDict
 from dotenv import load_dotenv
 
@@ -12,41 +15,232 @@ load_dotenv()
 
 from .tools import (
     get_scholarships,
+    get_scholarship_detail,
     search_student_handbook,
     search_academic_regulations,
     search_law_vietnam,
-    search_website
+    search_website,
+    embed_query
 )
+from .answer_cache import ANSWER_CACHE_ENABLED, AnswerCache
+from .budget import RunBudget
+from .cascade import DEFAULT_CASCADE_MODELS, ModelCascade
+from .history import HistoryManager
+from .metrics import AGENT_STEP_SECONDS, TOOL_CALL_SECONDS, span, trace
 
 # --- Khởi tạo ---
 
 os.environ["LANGCHAIN_PROJECT"] = "HUST-AI-Assistant"
 os.environ["LANGCHAIN_TRACING_V2"] = "false"
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0.2)
 tools = [
     get_scholarships,
+    get_scholarship_detail,
     search_academic_regulations,
     search_student_handbook,
     search_law_vietnam,
     search_website,
 ]
 
-llm_with_tools = llm.bind_tools(tools)
-tool_node = ToolNode(tools)
+# Model cascade: model rẻ/nhanh chọn tool và trả lời câu đơn giản, chỉ chuyển lên model mạnh
+# khi câu trả lời chưa đạt (cấu hình qua CASCADE_MODELS, ví dụ "gemini-2.5-flash-lite,gemini-2.5-flash").
+# Client Gemini và graph được tạo khi dùng lần đầu (get_cascade/get_graph) hoặc khi prewarm (mcp/startup.py),
+# nên import module này không kéo theo langchain_google_genai.
+_cascade: Optional[ModelCascade] = None
+_graph = None
+_init_lock = threading.Lock()
+
+
+def get_cascade() -> ModelCascade:
+    if _cascade is None:
+        with _init_lock:
+            if _cascade is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                _install_cascade(ModelCascade.from_models(
+                    [(name, ChatGoogleGenerativeAI(model=name, temperature=0.2)) for name in DEFAULT_CASCADE_MODELS],
+                    tools,
+                ))
+    return _cascade
+
+
+def get_llm():
+    """Model mạnh nhất, dùng cho các việc ngoài agent."""
+    return get_cascade().strongest.llm
+
+
+def is_llm_ready() -> bool:
+    """Model cascade và graph đã được khởi tạo chưa."""
+    return _cascade is not None and _graph is not None
+
+
+tools_by_name = {t.name: t for t in tools}
+
+# Pool dùng chung để chạy tool có deadline. Python không thể "giết" thread đang chạy,
+# nên tool quá hạn sẽ bị bỏ rơi (kết quả bị bỏ qua) thay vì chặn agent.
+tool_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AGENT_TOOL_WORKERS", "16")), thread_name_prefix="agent-tool")
+
+FORCE_ANSWER_PROMPT = (
+    "Đã hết thời gian/số lượt tra cứu cho câu hỏi này. KHÔNG gọi thêm tool. "
+    "Hãy trả lời ngay dựa trên các thông tin đã thu thập được ở trên; "
+    "nếu chưa đủ thông tin, hãy nói rõ phần nào chưa tìm thấy."
+)
 
 
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], lambda x, y: x + y]
 
+
+def _get_budget(config: Optional[RunnableConfig]) -> Optional[RunBudget]:
+    return ((config or {}).get("configurable") or {}).get("budget")
+
+def _tool_error(call: dict, content: str) -> ToolMessage:
+    return ToolMessage(content=content, name=call["name"], tool_call_id=call["id"], status="error")
+
+TOOL_TIMEOUT_MESSAGE = "Tool bị huỷ do vượt quá thời gian cho phép, không có kết quả."
+
+
+def _run_tool(tool, call: dict) -> ToolMessage:
+    with span(TOOL_CALL_SECONDS, tool=call["name"]) as labels:
+        result = tool.invoke({**call, "type": "tool_call"})
+        labels["status"] = result.status
+        return result
+
+
+async def _arun_tool(tool, call: dict) -> ToolMessage:
+    with span(TOOL_CALL_SECONDS, tool=call["name"]) as labels:
+        result = await tool.ainvoke({**call, "type": "tool_call"})
+        labels["status"] = result.status
+        return result
+
 # --- NODES ---
+# Mỗi node có hai bản: sync (graph.invoke/stream) và async (graph.ainvoke/astream).
+# Bản async không chiếm thread trong lúc chờ LLM/tool nên server phục vụ được nhiều hội thoại đồng thời.
 
-def agent_node(state: AgentState):
-    """Gọi LLM để quyết định hành động tiếp theo."""
+def _agent_messages(state: AgentState, budget: Optional[RunBudget]) -> Tuple[bool, List[BaseMessage]]:
+    """Trả về (chỉ được trả lời, danh sách message) cho lượt agent (buộc trả lời nếu đã hết ngân sách)."""
     print("--- NODE: AGENT ---")
-    response = llm_with_tools.invoke(state["messages"])
+    if budget is not None and budget.exhausted():
+        # Hết ngân sách: buộc agent trả lời từ ngữ cảnh đã có
+        print(f"--- BUDGET: hết ngân sách ({budget.tool_rounds} vòng tool, còn {budget.remaining():.1f}s), buộc trả lời ---")
+        budget.forced_answer = True
+        return True, state["messages"] + [HumanMessage(content=FORCE_ANSWER_PROMPT)]
+    return False, state["messages"]
+
+
+def agent_node(state: AgentState, config: RunnableConfig):
+    """Gọi LLM (qua model cascade) để quyết định hành động tiếp theo."""
+    budget = _get_budget(config)
+    answer_only, messages = _agent_messages(state, budget)
+    with span(AGENT_STEP_SECONDS, node="agent"):
+        response = get_cascade().invoke(messages, answer_only=answer_only, budget=budget)
+    return {"messages": [response]}
+
+
+async def aagent_node(state: AgentState, config: RunnableConfig):
+    """Bản async của agent_node."""
+    budget = _get_budget(config)
+    answer_only, messages = _agent_messages(state, budget)
+    with span(AGENT_STEP_SECONDS, node="agent"):
+        response = await get_cascade().ainvoke(messages, answer_only=answer_only, budget=budget)
     return {"messages": [response]}
 
+
+def action_node(state: AgentState, config: RunnableConfig):
+    """
+    Chạy song song các tool mà LLM yêu cầu, có giới hạn thời gian.
+    Tool chưa xong khi tới deadline được trả về một ToolMessage báo hết giờ và agent tiếp tục ngay.
+    Giới hạn: thread đang chạy không huỷ được (future.cancel() chỉ bỏ được tool chưa bắt đầu), nên tool bị treo
+    vẫn chiếm một worker của tool_executor tới khi tự kết thúc. Server dùng bản async (aaction_node).
+    """
+    with span(AGENT_STEP_SECONDS, node="action"):
+        return _action_node(state, config)
+
+
+def _action_node(state: AgentState, config: RunnableConfig):
+    tool_calls = state["messages"][-1].tool_calls
+    budget = _get_budget(config)
+    timeout = budget.tool_time_left() if budget is not None else None
+
+    futures = {}
+    results: List[ToolMessage] = []
+    for call in tool_calls:
+        tool = tools_by_name.get(call["name"])
+        if tool is None:
+            results.append(_tool_error(call, f"Lỗi: không có tool tên '{call['name']}'."))
+            continue
+        # Chạy trong context hiện tại để span của tool được gom vào trace của lượt hỏi
+        futures[tool_executor.submit(contextvars.copy_context().run, _run_tool, tool, call)] = call
+
+    done, not_done = wait(futures, timeout=timeout)
+
+    cancelled = []
+    for future, call in futures.items():
+        if future in done:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(_tool_error(call, f"Lỗi khi chạy tool: {e}"))
+        else:
+            future.cancel()
+            cancelled.append(call["name"])
+            print(f"--- BUDGET: huỷ tool {call['name']} do quá thời gian ---")
+            results.append(_tool_error(call, TOOL_TIMEOUT_MESSAGE))
+
+    if budget is not None:
+        errors = [message.name for message in results if message.status == "error"]
+        budget.record_round([call["name"] for call in tool_calls], cancelled, errors)
+    return {"messages": results}
+
+
+async def aaction_node(state: AgentState, config: RunnableConfig):
+    """
+    Bản async của action_node. Tool quá hạn bị huỷ thật sự (task.cancel()),
+    không để lại thread chạy dở như bản sync.
+    """
+    with span(AGENT_STEP_SECONDS, node="action"):
+        return await _aaction_node(state, config)
+
+
+async def _aaction_node(state: AgentState, config: RunnableConfig):
+    tool_calls = state["messages"][-1].tool_calls
+    budget = _get_budget(config)
+    timeout = budget.tool_time_left() if budget is not None else None
+
+    tasks = {}
+    results: List[ToolMessage] = []
+    for call in tool_calls:
+        tool = tools_by_name.get(call["name"])
+        if tool is None:
+            results.append(_tool_error(call, f"Lỗi: không có tool tên '{call['name']}'."))
+            continue
+        tasks[asyncio.create_task(_arun_tool(tool, call))] = call
+
+    done = set()
+    if tasks:
+        done, _ = await asyncio.wait(tasks, timeout=timeout)
+
+    cancelled = []
+    for task, call in tasks.items():
+        if task in done:
+            try:
+                results.append(task.result())
+            except asyncio.CancelledError:
+                # Tool tự bị huỷ từ bên trong (không phải do node này): trả về lỗi thay vì làm hỏng cả graph
+                results.append(_tool_error(call, "Lỗi khi chạy tool: tool bị huỷ."))
+            except Exception as e:
+                results.append(_tool_error(call, f"Lỗi khi chạy tool: {e}"))
+        else:
+            task.cancel()
+            cancelled.append(call["name"])
+            print(f"--- BUDGET: huỷ tool {call['name']} do quá thời gian ---")
+            results.append(_tool_error(call, TOOL_TIMEOUT_MESSAGE))
+
+    if budget is not None:
+        errors = [message.name for message in results if message.status == "error"]
+        budget.record_round([call["name"] for call in tool_calls], cancelled, errors)
+    return {"messages": results}
+
 # --- CONDITIONAL EDGES ---
 
 def should_continue(state: AgentState) -> str:
@@ -56,15 +250,31 @@ def should_continue(state: AgentState) -> str:
     return "end"
 
 # --- XÂY DỰNG GRAPH ---
-graph_builder = StateGraph(AgentState)
-graph_builder.add_node("agent", agent_node)
-graph_builder.add_node("action", tool_node)
+def _build_graph():
+    from langgraph.graph import END, StateGraph
+
+    graph_builder = StateGraph(AgentState)
+    graph_builder.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
+    graph_builder.add_node("action", RunnableLambda(action_node, afunc=aaction_node, name="action"))
+
+    graph_builder.set_entry_point("agent")
+    graph_builder.add_conditional_edges("agent", should_continue, {"continue_to_tool": "action", "end": END})
+    graph_builder.add_edge("action", "agent")
 
-graph_builder.set_entry_point("agent")
-graph_builder.add_conditional_edges("agent", should_continue, {"continue_to_tool": "action", "end": END})
-graph_builder.add_edge("action", "agent")
+    return graph_builder.compile()
 
-graph = graph_builder.compile()
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _init_lock:
+            if _graph is None:
+                _graph = _build_graph()
+    return _graph
+
+# Lịch sử gửi cho LLM được cắt theo ngân sách token, phần cũ được tóm tắt lại
+# (việc tóm tắt dùng model rẻ nhất, được gán khi cascade được khởi tạo)
+history_manager = HistoryManager()
 
 
 # --- SYSTEM PROMPT TỐI ƯU ---
@@ -75,32 +285,295 @@ QUY TẮC BẮT BUỘC:
 1.  KIỂM DUYỆT TRƯỚC: Đầu tiên, hãy kiểm tra câu hỏi. Nếu nó chứa nội dung nhạy cảm (chính trị, tôn giáo) hoặc không phù hợp, hãy trả lời ngay lập tức bằng câu sau và dừng lại: "Xin lỗi, tôi là trợ lý ảo của Đại học Bách Khoa Hà Nội và chỉ có thể trả lời các câu hỏi liên quan đến quy chế, học bổng và đời sống sinh viên tại trường."
 2.  QUY TRÌNH TÌM KIẾM:
     a. Ưu tiên dùng tool nội bộ: Luôn thử `search_student_handbook`, `search_academic_regulations`, `get_scholarships`, `search_law_vietnam` trước.
-    b. Bắt buộc dùng tool dự phòng: Nếu các tool nội bộ không có kết quả hoặc kết quả không đủ thông tin, BẮT BUỘC phải gọi `search_website` để tìm câu trả lời.
-    c. Trả lời khi không tìm thấy: Nếu đã thử tất cả các tool mà vẫn không có thông tin, hãy trả lời: "Tôi không tìm thấy thông tin chính xác về [chủ đề câu hỏi]."
+    b. Học bổng: `get_scholarships` chỉ trả danh sách tóm tắt (id, tên, giá trị, số suất, hạn nộp, trạng thái). Chỉ gọi `get_scholarship_detail` với id của một hoặc hai học bổng mà sinh viên hỏi cụ thể (điều kiện, hồ sơ, liên hệ).
+    c. Bắt buộc dùng tool dự phòng: Nếu các tool nội bộ không có kết quả hoặc kết quả không đủ thông tin, BẮT BUỘC phải gọi `search_website` để tìm câu trả lời.
+    d. Trả lời khi không tìm thấy: Nếu đã thử tất cả các tool mà vẫn không có thông tin, hãy trả lời: "Tôi không tìm thấy thông tin chính xác về [chủ đề câu hỏi]."
 3.  ĐỊNH DẠNG TRẢ LỜI: Ngắn gọn, đi thẳng vào vấn đề, không chào hỏi.
 4.  KHÔNG NÓI VỀ QUÁ TRÌNH: Không bao giờ nói "Tôi đang tìm kiếm...", chỉ đưa ra câu trả lời cuối cùng.
 """
 
-def get_response(question: str, message_history: List[BaseMessage]) -> Tuple[str, List[BaseMessage]]:
+# Cache câu trả lời cho câu hỏi không có ngữ cảnh (lượt đầu của phiên)
+answer_cache = AnswerCache(
+    embed_fn=embed_query,
+    prompt_version=hashlib.sha1(system_prompt.encode("utf-8")).hexdigest()[:12],
+) if ANSWER_CACHE_ENABLED else None
+
+SUMMARY_SECTION = """
+TÓM TẮT CÁC LƯỢT HỘI THOẠI TRƯỚC (chỉ dùng làm ngữ cảnh):
+{summary}
+"""
+
+def _text_of(content) -> str:
+    """Lấy phần văn bản từ content của message (có thể là chuỗi hoặc danh sách content block)."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+class _PreparedRun:
+    """Dữ liệu đầu vào chung cho get_response và stream_response."""
+
+    def __init__(self, question: str, message_history: List[BaseMessage], budget: RunBudget):
+        self.question = question
+        self.message_history = message_history
+        self.budget = budget
+        self.cached_answer: Optional[str] = None
+        self.cache_embedding = None
+        self.messages: List[BaseMessage] = []
+        self.config: dict = {}
+        # Message cuối cùng của agent (dùng khi stream)
+        self.final_message: Optional[AIMessage] = None
+        # Lượt agent hiện tại đã stream token nào chưa
+        self.streamed_tokens = False
+
+
+def _use_cached_answer(run: _PreparedRun, entry, embedding) -> bool:
+    run.cache_embedding = embedding
+    if entry is None:
+        return False
+    run.budget.cache_hit = True
+    run.budget.finish()
+    print(f"--- ANSWER CACHE: hit cho '{run.question}' (đã lưu từ '{entry.question}') ---")
+    run.cached_answer = entry.answer
+    return True
+
+
+def _build_messages(run: _PreparedRun):
+    budget = run.budget
+    summary, recent_history = history_manager.prepare(run.message_history)
+    budget.history_tokens = history_manager.count_tokens(recent_history)
+
+    prompt = system_prompt
+    if summary:
+        prompt += SUMMARY_SECTION.format(summary=summary)
+    run.messages = [
+        SystemMessage(content=prompt),
+        *recent_history,
+        HumanMessage(content=run.question)
+    ]
+
+    # Mỗi vòng tool tốn 2 bước (agent + action), cộng thêm lượt trả lời cuối
+    run.config = {
+        "configurable": {"budget": budget},
+        "recursion_limit": 2 * budget.max_tool_rounds + 4,
+    }
+
+
+def _prepare_run(question: str, message_history: List[BaseMessage], budget: Optional[RunBudget]) -> _PreparedRun:
+    run = _PreparedRun(question, message_history, (budget or RunBudget()).start())
+    # Câu hỏi không có lịch sử: thử lấy từ answer cache trước
+    if answer_cache is not None and not message_history:
+        if _use_cached_answer(run, *answer_cache.lookup(question)):
+            return run
+    _build_messages(run)
+    return run
+
+
+async def _aprepare_run(question: str, message_history: List[BaseMessage], budget: Optional[RunBudget]) -> _PreparedRun:
+    run = _PreparedRun(question, message_history, (budget or RunBudget()).start())
+    if answer_cache is not None and not message_history:
+        if _use_cached_answer(run, *await answer_cache.alookup(question)):
+            return run
+    _build_messages(run)
+    return run
+
+
+def _finish_run(run: _PreparedRun, final_answer: str) -> List[BaseMessage]:
+    """Lưu cache (nếu được) và trả về lịch sử đã thêm lượt hỏi đáp mới."""
+    budget = run.budget
+    print(f"--- BUDGET: {budget.report()} ---")
+
+    # Câu trả lời bị cắt ngang do hết ngân sách, hoặc dựa trên tool lỗi/bị huỷ thì không lưu cache
+    degraded = budget.forced_answer or budget.llm_timeouts or budget.tool_errors or budget.cancelled_tools
+    if answer_cache is not None and not run.message_history and not budget.cache_hit and not degraded:
+        answer_cache.store(run.question, final_answer, budget.tool_calls, budget.elapsed(), embedding=run.cache_embedding)
+
+    return run.message_history + [
+        HumanMessage(content=run.question),
+        AIMessage(content=final_answer)
+    ]
+
+
+def get_response(
+    question: str,
+    message_history: List[BaseMessage],
+    budget: Optional[RunBudget] = None,
+) -> Tuple[str, List[BaseMessage]]:
     """
     Xử lý một câu hỏi, có tính đến lịch sử hội thoại.
+    `budget` giới hạn thời gian và số vòng gọi tool; mức sử dụng được ghi lại trong chính đối tượng này.
+    Chỉ các lượt gần nhất (theo ngân sách token của `history_manager`) được gửi nguyên văn,
+    phần cũ hơn được thay bằng bản tóm tắt. Lịch sử trả về vẫn đầy đủ, việc nén do `compact_history` đảm nhận.
     """
-    messages_for_run = [
-        SystemMessage(content=system_prompt),
-        *message_history,
-        HumanMessage(content=question)
-    ]
+    run = _prepare_run(question, message_history, budget)
+    if run.cached_answer is not None:
+        return run.cached_answer, _finish_run(run, run.cached_answer)
+
+    try:
+        with trace("get_response", question=question):
+            final_state = get_graph().invoke({"messages": run.messages}, config=run.config)
+    finally:
+        run.budget.finish()
 
-    final_state = graph.invoke({"messages": messages_for_run})
-    
     final_answer = final_state["messages"][-1].content
-    
-    updated_history = message_history + [
-        HumanMessage(content=question),
-        AIMessage(content=final_answer)
+    return final_answer, _finish_run(run, final_answer)
+
+
+async def aget_response(
+    question: str,
+    message_history: List[BaseMessage],
+    budget: Optional[RunBudget] = None,
+) -> Tuple[str, List[BaseMessage]]:
+    """Bản async của get_response (dùng graph.ainvoke, LLM và tool đều chạy async)."""
+    run = await _aprepare_run(question, message_history, budget)
+    if run.cached_answer is not None:
+        return run.cached_answer, _finish_run(run, run.cached_answer)
+
+    try:
+        with trace("get_response", question=question):
+            final_state = await get_graph().ainvoke({"messages": run.messages}, config=run.config)
+    finally:
+        run.budget.finish()
+
+    final_answer = final_state["messages"][-1].content
+    return final_answer, _finish_run(run, final_answer)
+
+
+STREAM_MODES = ["messages", "updates"]
+
+
+def _stream_event(run: _PreparedRun, mode: str, payload) -> Optional[dict]:
+    """Chuyển một phần tử của graph.stream thành sự kiện cho client (hoặc None nếu bỏ qua)."""
+    if mode == "messages":
+        chunk, metadata = payload
+        if metadata.get("langgraph_node") != "agent" or getattr(chunk, "tool_call_chunks", None):
+            return None
+        text = _text_of(chunk.content)
+        if not text:
+            return None
+        run.budget.mark_first_token()
+        run.streamed_tokens = True
+        return {"type": "token", "text": text}
+    if "agent" in payload:
+        run.final_message = payload["agent"]["messages"][-1]
+        streamed, run.streamed_tokens = run.streamed_tokens, False
+        if run.final_message.tool_calls:
+            return {"type": "tool_start", "tools": [call["name"] for call in run.final_message.tool_calls]}
+        # Câu trả lời của tầng model rẻ không được stream (có thể bị loại), gửi nguyên câu khi đã được chấp nhận
+        text = _text_of(run.final_message.content)
+        if not streamed and text:
+            run.budget.mark_first_token()
+            return {"type": "token", "text": text}
+    elif "action" in payload:
+        tool_messages = payload["action"]["messages"]
+        return {
+            "type": "tool_end",
+            "tools": [m.name for m in tool_messages],
+            "failed": [m.name for m in tool_messages if m.status == "error"],
+        }
+    return None
+
+
+def _cached_events(run: _PreparedRun) -> List[dict]:
+    run.budget.mark_first_token()
+    return [
+        {"type": "token", "text": run.cached_answer},
+        {"type": "done", "answer": run.cached_answer, "history": _finish_run(run, run.cached_answer)},
     ]
-    
-    return final_answer, updated_history
+
+
+def _done_event(run: _PreparedRun) -> dict:
+    final_answer = _text_of(run.final_message.content) if run.final_message is not None else ""
+    return {"type": "done", "answer": final_answer, "history": _finish_run(run, final_answer)}
+
+
+def stream_response(
+    question: str,
+    message_history: List[BaseMessage],
+    budget: Optional[RunBudget] = None,
+) -> Iterator[dict]:
+    """
+    Giống get_response nhưng trả về dần các sự kiện trong lúc agent chạy:
+    - {"type": "tool_start", "tools": [...]}: agent quyết định gọi tool.
+    - {"type": "tool_end", "tools": [...], "failed": [...]}: các tool đã chạy xong (kèm tool lỗi hoặc bị huỷ).
+    - {"type": "token", "text": "..."}: một đoạn câu trả lời cuối do LLM sinh ra.
+    - {"type": "done", "answer": "...", "history": [...]}: kết thúc, kèm lịch sử mới.
+    """
+    run = _prepare_run(question, message_history, budget)
+    if run.cached_answer is not None:
+        yield from _cached_events(run)
+        return
+
+    try:
+        for mode, payload in get_graph().stream({"messages": run.messages}, config=run.config, stream_mode=STREAM_MODES):
+            event = _stream_event(run, mode, payload)
+            if event is not None:
+                yield event
+    finally:
+        run.budget.finish()
+    yield _done_event(run)
+
+
+async def astream_response(
+    question: str,
+    message_history: List[BaseMessage],
+    budget: Optional[RunBudget] = None,
+) -> AsyncIterator[dict]:
+    """Bản async của stream_response."""
+    run = await _aprepare_run(question, message_history, budget)
+    if run.cached_answer is not None:
+        for event in _cached_events(run):
+            yield event
+        return
+
+    try:
+        async for mode, payload in get_graph().astream({"messages": run.messages}, config=run.config, stream_mode=STREAM_MODES):
+            event = _stream_event(run, mode, payload)
+            if event is not None:
+                yield event
+    finally:
+        run.budget.finish()
+    yield _done_event(run)
+
+
+def compact_history(message_history: List[BaseMessage]) -> List[BaseMessage]:
+    """
+    Nén lịch sử (tóm tắt các lượt cũ). Gọi LLM nên phải chạy ngoài đường xử lý chính,
+    ví dụ trong BackgroundTasks sau khi đã trả lời client.
+    """
+    if not history_manager.needs_compaction(message_history):
+        return message_history
+    get_cascade()  # gán model tóm tắt cho history_manager nếu chưa khởi tạo
+    return history_manager.compact(message_history)
+
+
+async def acompact_history(message_history: List[BaseMessage]) -> List[BaseMessage]:
+    """Bản async của compact_history."""
+    if not history_manager.needs_compaction(message_history):
+        return message_history
+    get_cascade()
+    return await history_manager.acompact(message_history)
+
+
+def set_cascade(new_cascade: Optional[ModelCascade]):
+    """
+    Thay model cascade dùng cho agent và tóm tắt lịch sử
+    (ví dụ cascade gồm các model giả lập khi chạy benchmark/kiểm thử).
+    """
+    with _init_lock:
+        _install_cascade(new_cascade)
+
+
+def _install_cascade(new_cascade: Optional[ModelCascade]):
+    global _cascade
+    _cascade = new_cascade
+    # None: quay về cascade mặc định, tạo lại ở lần dùng tiếp theo
+    history_manager.llm = new_cascade.cheapest.llm if new_cascade is not None else None
+
+
+def set_llm(new_llm):
+    """Dùng một model duy nhất (cascade một tầng). Model cần hỗ trợ bind_tools."""
+    set_cascade(ModelCascade.from_models([(getattr(new_llm, "model", None) or type(new_llm).__name__, new_llm)], tools))
 
 if __name__ == "__main__":
     conversation_history = []
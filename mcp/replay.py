@@ -0,0 +1,337 @@
+"""
+Ghi lại (record) và phát lại (replay) các lời gọi ra ngoài của agent: LLM, `index.search` của Pinecone,
+tìm kiếm/scrape web và crawl học bổng ctsv. Dùng để benchmark và kiểm thử hồi quy `get_response`
+mà không cần key Gemini/Pinecone/Tavily, với kết quả không phụ thuộc mạng.
+
+    cassette = Cassette.load("bench/cassettes/agent.json")
+    restore = install(cassette, mode="replay", latency=LatencyProfile(scale=1.0))
+    ...
+    restore()
+
+Ở chế độ "record", các lời gọi thật được chuyển qua và kết quả cùng độ trễ đo được ghi vào cassette
+(gọi `cassette.save()` khi xong). Ở chế độ "replay", kết quả được lấy từ cassette và độ trễ được giả lập
+theo `LatencyProfile`; lời gọi không có trong cassette gây ra `ReplayMiss`.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+CASSETTE_VERSION = 1
+
+
+class ReplayMiss(KeyError):
+    """Lời gọi không có trong cassette (prompt hoặc graph đã thay đổi so với lúc ghi)."""
+
+
+def _digest(payload) -> str:
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _canonical_message(message: BaseMessage) -> list:
+    # Bỏ id của tool call và metadata vì chúng khác nhau giữa các lần chạy
+    row = [message.type, message.content]
+    if isinstance(message, AIMessage) and message.tool_calls:
+        row.append([[call["name"], call["args"]] for call in message.tool_calls])
+    if isinstance(message, ToolMessage):
+        row.append(message.name)
+    return row
+
+
+def _llm_keys(model: str, messages: List[BaseMessage], tool_choice: Optional[str]) -> List[str]:
+    """
+    Khoá chính: toàn bộ nội dung prompt. Khoá dự phòng: (câu hỏi, số bước agent đã qua),
+    để cassette vẫn dùng được khi chỉ system prompt hoặc định dạng kết quả tool thay đổi.
+    """
+    primary = _digest(["llm", model, tool_choice, [_canonical_message(m) for m in messages]])
+    human_messages = [m.content for m in messages if isinstance(m, HumanMessage)]
+    steps = sum(1 for m in messages if isinstance(m, AIMessage))
+    fallback = _digest(["llm-step", model, tool_choice, human_messages, steps])
+    return [primary, fallback]
+
+
+def _dump_ai_message(message: AIMessage) -> dict:
+    return {
+        "content": message.content,
+        "tool_calls": [{"name": c["name"], "args": c["args"], "id": c.get("id")} for c in message.tool_calls],
+        "usage_metadata": dict(message.usage_metadata or {}),
+        "response_metadata": {k: v for k, v in (message.response_metadata or {}).items() if isinstance(v, (str, int, float, bool))},
+    }
+
+
+def _load_ai_message(data: dict) -> AIMessage:
+    return AIMessage(
+        content=data["content"],
+        tool_calls=data["tool_calls"],
+        usage_metadata=data["usage_metadata"] or None,
+        response_metadata=data["response_metadata"],
+    )
+
+
+class LatencyProfile:
+    """
+    Độ trễ giả lập khi replay. Với mỗi loại lời gọi (llm, search, web): nếu đặt giá trị cố định (giây)
+    thì dùng giá trị đó, nếu không thì dùng độ trễ đã ghi nhân với `scale` (scale=0 để chạy nhanh nhất).
+    """
+
+    def __init__(self, scale: float = 1.0, llm: Optional[float] = None, search: Optional[float] = None, web: Optional[float] = None):
+        self.scale = scale
+        self.fixed = {"llm": llm, "search": search, "web": web}
+
+    def delay(self, kind: str, recorded_s: float) -> float:
+        fixed = self.fixed.get(kind)
+        return fixed if fixed is not None else recorded_s * self.scale
+
+
+class Cassette:
+    """Tập các lời gọi đã ghi: {loại: {khoá: {"result": ..., "latency_s": ...}}}."""
+
+    KINDS = ("llm", "search", "web")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.entries: Dict[str, Dict[str, dict]] = {kind: {} for kind in self.KINDS}
+        # Tên các tầng model của cascade lúc ghi
+        self.models: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        cassette = cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Cassette {path} có phiên bản {data.get('version')}, cần {CASSETTE_VERSION}.")
+        cassette.models = data.get("models", [])
+        for kind in cls.KINDS:
+            cassette.entries[kind] = data.get(kind, {})
+        return cassette
+
+    def save(self, path: Optional[str] = None):
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            data = {"version": CASSETTE_VERSION, "models": self.models, **self.entries}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+
+    def put(self, kind: str, keys: List[str], result, latency_s: float):
+        entry = {"result": result, "latency_s": round(latency_s, 4)}
+        with self._lock:
+            for key in keys:
+                # Khoá dự phòng chỉ giữ lần ghi đầu tiên
+                self.entries[kind].setdefault(key, entry)
+            self.entries[kind][keys[0]] = entry
+
+    def get(self, kind: str, keys: List[str]) -> dict:
+        with self._lock:
+            for key in keys:
+                entry = self.entries[kind].get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+            self.misses += 1
+        raise ReplayMiss(f"Không có lời gọi {kind} này trong cassette {self.path or ''}.")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, **{kind: len(entries) for kind, entries in self.entries.items()}}
+
+
+class CassetteChatModel(BaseChatModel):
+    """
+    Chat model ghi/phát lại. Khi ghi, `inner` là model thật; bind_tools được chuyển cho model thật
+    và khoá của lời gọi gồm cả `tool_choice`.
+    """
+
+    cassette: Any
+    mode: str = "replay"
+    model_name: str = "replay"
+    latency: Any = None
+    inner: Any = None
+    tool_choice: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette-chat"
+
+    def bind_tools(self, tools, tool_choice: Optional[str] = None, **kwargs):
+        update = {"tool_choice": tool_choice}
+        if self.mode == "record":
+            update["inner"] = self.inner.bind_tools(tools, tool_choice=tool_choice, **kwargs)
+        return self.model_copy(update=update)
+
+    def _result(self, message: AIMessage) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        keys = _llm_keys(self.model_name, messages, self.tool_choice)
+        if self.mode == "record":
+            started = time.monotonic()
+            message = self.inner.invoke(messages)
+            self.cassette.put("llm", keys, _dump_ai_message(message), time.monotonic() - started)
+            return self._result(message)
+        entry = self.cassette.get("llm", keys)
+        time.sleep(self.latency.delay("llm", entry["latency_s"]))
+        return self._result(_load_ai_message(entry["result"]))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        keys = _llm_keys(self.model_name, messages, self.tool_choice)
+        if self.mode == "record":
+            started = time.monotonic()
+            message = await self.inner.ainvoke(messages)
+            self.cassette.put("llm", keys, _dump_ai_message(message), time.monotonic() - started)
+            return self._result(message)
+        entry = self.cassette.get("llm", keys)
+        await asyncio.sleep(self.latency.delay("llm", entry["latency_s"]))
+        return self._result(_load_ai_message(entry["result"]))
+
+
+def _search_keys(namespace: str, query: dict) -> List[str]:
+    return [_digest(["search", namespace, query["inputs"]["text"], query["top_k"]])]
+
+
+def _docs_to_results(docs: List[str]) -> dict:
+    return {"result": {"hits": [{"fields": {"text": doc}} for doc in docs]}}
+
+
+class CassetteIndex:
+    """Pinecone index ghi/phát lại (bản sync). Khi ghi, `inner` là index thật."""
+
+    def __init__(self, cassette: Cassette, mode: str, latency: LatencyProfile, inner=None):
+        self.cassette = cassette
+        self.mode = mode
+        self.latency = latency
+        self.inner = inner
+
+    def _record(self, namespace: str, query: dict, fields=None):
+        from .tools import _hits_to_docs
+
+        started = time.monotonic()
+        docs = _hits_to_docs(self.inner.search(namespace=namespace, query=query, fields=fields))
+        self.cassette.put("search", _search_keys(namespace, query), docs, time.monotonic() - started)
+        return _docs_to_results(docs)
+
+    def search(self, namespace: str, query: dict, fields=None):
+        if self.mode == "record":
+            return self._record(namespace, query, fields)
+        entry = self.cassette.get("search", _search_keys(namespace, query))
+        time.sleep(self.latency.delay("search", entry["latency_s"]))
+        return _docs_to_results(entry["result"])
+
+
+class CassetteAsyncIndex(CassetteIndex):
+    """Bản async. Khi ghi, lời gọi được chạy bằng index sync thật trong thread."""
+
+    async def search(self, namespace: str, query: dict, fields=None):
+        if self.mode == "record":
+            return await asyncio.to_thread(self._record, namespace, query, fields)
+        entry = self.cassette.get("search", _search_keys(namespace, query))
+        await asyncio.sleep(self.latency.delay("search", entry["latency_s"]))
+        return _docs_to_results(entry["result"])
+
+
+def _wrap_fetch(cassette: Cassette, mode: str, latency: LatencyProfile, name: str, fn: Callable, is_async: bool):
+    """Bọc một hàm lấy dữ liệu web (tham số là chuỗi hoặc không có) để ghi/phát lại kết quả."""
+
+    def keys(args) -> List[str]:
+        return [_digest(["web", name, list(args)])]
+
+    if is_async:
+        async def wrapper(*args):
+            if mode == "record":
+                started = time.monotonic()
+                result = await fn(*args)
+                cassette.put("web", keys(args), result, time.monotonic() - started)
+                return result
+            entry = cassette.get("web", keys(args))
+            await asyncio.sleep(latency.delay("web", entry["latency_s"]))
+            return entry["result"]
+        return wrapper
+
+    def wrapper(*args):
+        if mode == "record":
+            started = time.monotonic()
+            result = fn(*args)
+            cassette.put("web", keys(args), result, time.monotonic() - started)
+            return result
+        entry = cassette.get("web", keys(args))
+        time.sleep(latency.delay("web", entry["latency_s"]))
+        return entry["result"]
+    return wrapper
+
+
+def install(cassette: Cassette, mode: str = "replay", latency: Optional[LatencyProfile] = None) -> Callable[[], None]:
+    """
+    Chuyển agent sang dùng cassette: các tầng model của cascade, Pinecone index, tìm kiếm web
+    (`tools.fetch_web_docs`) và crawl học bổng (`tools.crawl_all_scholarships`).
+    Trả về hàm khôi phục lại cấu hình cũ.
+    """
+    from . import rag, tools
+    from .cascade import ModelCascade
+
+    if mode not in ("record", "replay"):
+        raise ValueError(f"mode không hợp lệ: '{mode}' (chỉ hỗ trợ 'record' hoặc 'replay').")
+    latency = latency or LatencyProfile()
+
+    # None nếu cascade mặc định chưa được tạo; khi khôi phục sẽ quay về tạo lười như cũ
+    old_cascade = rag._cascade
+    old_index, old_async_override = tools._index, tools._async_index_override
+    old_fetchers = {name: getattr(tools, name) for name in ("fetch_web_docs", "afetch_web_docs", "crawl_all_scholarships")}
+
+    if mode == "record":
+        source = rag.get_cascade()
+        cassette.models = [tier.name for tier in source.tiers]
+        models = [
+            (tier.name, CassetteChatModel(cassette=cassette, mode=mode, model_name=tier.name, latency=latency, inner=tier.llm))
+            for tier in source.tiers
+        ]
+        real_index = tools.get_index()
+    else:
+        if not cassette.models:
+            raise ValueError("Cassette không có thông tin về các tầng model.")
+        models = [
+            (name, CassetteChatModel(cassette=cassette, mode=mode, model_name=name, latency=latency))
+            for name in cassette.models
+        ]
+        real_index = None
+
+    rag.set_cascade(ModelCascade.from_models(models, rag.tools))
+    tools.set_index(
+        CassetteIndex(cassette, mode, latency, inner=real_index),
+        CassetteAsyncIndex(cassette, mode, latency, inner=real_index),
+    )
+    tools.fetch_web_docs = _wrap_fetch(cassette, mode, latency, "web_docs", old_fetchers["fetch_web_docs"], is_async=False)
+    tools.afetch_web_docs = _wrap_fetch(cassette, mode, latency, "web_docs", old_fetchers["afetch_web_docs"], is_async=True)
+    tools.crawl_all_scholarships = _wrap_fetch(cassette, mode, latency, "ctsv_scholarships", old_fetchers["crawl_all_scholarships"], is_async=False)
+
+    def restore():
+        rag.set_cascade(old_cascade)
+        tools.set_index(old_index, old_async_override)
+        for name, fn in old_fetchers.items():
+            setattr(tools, name, fn)
+
+    return restore
@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .answer_cache import INDEX_VERSION
+
+# Cấu hình mặc định (có thể chỉnh qua biến môi trường)
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE", "1") == "1"
+RETRIEVAL_CACHE_MAX_ENTRIES = int(os.getenv("RETRIEVAL_CACHE_MAX_ENTRIES", "5000"))
+RETRIEVAL_CACHE_TTL_S = float(os.getenv("RETRIEVAL_CACHE_TTL_S", "3600"))
+
+CacheKey = Tuple[str, str, int, str]
+
+
+class RetrievalCache:
+    """
+    Cache kết quả tìm kiếm Pinecone theo (namespace, câu truy vấn, top_k, INDEX_VERSION).
+    Dùng chung cho mọi lượt hỏi trong tiến trình, nên các câu hỏi trong cùng một batch
+    (hoặc nhiều sinh viên hỏi giống nhau) chỉ tốn một lần search.
+    Với bản async, các truy vấn giống nhau đang chạy đồng thời cũng chỉ gọi Pinecone một lần.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_MAX_ENTRIES, ttl_s: float = RETRIEVAL_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        # khoá -> (hết hạn lúc, danh sách đoạn văn)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, List[str]]]" = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @staticmethod
+    def make_key(namespace: str, text: str, topk: int) -> CacheKey:
+        # Chỉ chuẩn hoá Unicode và khoảng trắng: chữ hoa/thường vẫn có thể cho embedding khác
+        query = " ".join(unicodedata.normalize("NFC", text).split())
+        return (namespace, query, topk, INDEX_VERSION)
+
+    def get(self, key: CacheKey) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(entry[1])
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: CacheKey, docs: List[str]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_s, list(docs))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_search(self, key: CacheKey, search: Callable[[], List[str]]) -> List[str]:
+        docs = self.get(key)
+        if docs is None:
+            docs = search()
+            self.put(key, docs)
+        return docs
+
+    async def aget_or_search(self, key: CacheKey, search: Callable[[], Awaitable[List[str]]]) -> List[str]:
+        docs = self.get(key)
+        if docs is not None:
+            return docs
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            # Search chạy trong task riêng mà mọi lượt chờ (kể cả lượt khởi tạo) đều shield:
+            # tool bị huỷ do hết ngân sách chỉ ngừng chờ, không làm hỏng kết quả của các lượt khác
+            task = asyncio.ensure_future(search())
+            self._inflight[key] = task
+            task.add_done_callback(functools.partial(self._on_done, key))
+        return list(await asyncio.shield(task))
+
+    def _on_done(self, key: CacheKey, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        # task.exception() cũng đánh dấu đã đọc lỗi, asyncio không cảnh báo khi không còn ai chờ
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_inflight": self.shared,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
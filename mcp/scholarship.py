@@ -1,10 +1,16 @@
 from datetime import datetime
 from bs4 import BeautifulSoup
-from typing import Optional
+from typing import Dict, Optional
+import os
 import requests
 import json
 import re
 
+from .metrics import http_post
+
+# Địa chỉ API của ctsv; đổi sang mock server khi chạy load test (bench/load_test.py)
+CTSV_BASE_URL = os.getenv("CTSV_BASE_URL", "https://ctsv.hust.edu.vn").rstrip("/")
+
 class Scholarship:
     """
     Một class để biểu diễn thông tin chi tiết về một học bổng.
@@ -31,7 +37,14 @@ class Scholarship:
 
         # Xử lý các trường dữ liệu để có định dạng tốt hơn
         self.deadline: Optional[datetime] = self._parse_deadline()
-        self.plain_text_content: str = self._parse_html_to_text()
+        # Nội dung HTML chỉ được chuyển sang văn bản khi cần (chế độ tóm tắt không dùng tới)
+        self._plain_text_content: Optional[str] = None
+
+    @property
+    def plain_text_content(self) -> str:
+        if self._plain_text_content is None:
+            self._plain_text_content = self._parse_html_to_text()
+        return self._plain_text_content
 
     def _parse_deadline(self) -> Optional[datetime]:
         """Chuyển đổi chuỗi deadline thành đối tượng datetime."""
@@ -81,6 +94,17 @@ class Scholarship:
         print(self.plain_text_content)
         print("="*50)
         
+    def get_summary(self) -> Dict:
+        """Thông tin ngắn gọn (không có nội dung chi tiết) để liệt kê nhiều học bổng mà không làm đầy ngữ cảnh LLM."""
+        return {
+            "id": self.document_id,
+            "title": self.title,
+            "value": self.total_price,
+            "quantity": self.quantity,
+            "deadline": self.deadline.strftime('%H:%M:%S %d/%m/%Y') if self.deadline else 'Không có',
+            "status": 'Còn hạn' if self.is_active() else 'Hết hạn',
+        }
+
     def get_full_info_string(self) -> str:
         """
         Trả về một chuỗi duy nhất chứa toàn bộ thông tin chi tiết của học bổng,
@@ -123,7 +147,7 @@ def crawl_all_scholarships():
     Returns:
         list: Một danh sách các học bổng, hoặc None nếu có lỗi.
     """
-    api_url = "https://ctsv.hust.edu.vn/api-t/HWScholarship/GetApprovedScholarship"
+    api_url = f"{CTSV_BASE_URL}/api-t/HWScholarship/GetApprovedScholarship"
 
     # Payload là một đối tượng JSON rỗng, dựa trên header được cung cấp
     payload = {}
@@ -140,7 +164,7 @@ def crawl_all_scholarships():
     
     try:
         # Gửi yêu cầu POST với tham số `json` để gửi payload dưới dạng JSON
-        response = requests.post(api_url, headers=headers, json=payload)
+        response = http_post("ctsv_scholarships", api_url, headers=headers, json=payload, timeout=20)
         response.raise_for_status()
 
         data = response.json()
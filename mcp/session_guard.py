@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import hashlib
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# Trong khoảng thời gian này, một yêu cầu trùng (cùng khoá) sẽ nhận lại kết quả đã có
+DEDUP_WINDOW_S = float(os.getenv("DEDUP_WINDOW_S", "15"))
+_MAX_RECENT = 2048
+
+
+def normalize_question(question: str) -> str:
+    """Chuẩn hoá câu hỏi để so trùng: NFC, chữ thường, gộp khoảng trắng."""
+    return " ".join(unicodedata.normalize("NFC", question).lower().split())
+
+
+def make_dedup_key(session_id: Optional[str], question: str, idempotency_key: Optional[str] = None) -> Optional[str]:
+    """
+    Khoá chống gửi trùng:
+    - Nếu client gửi idempotency key thì dùng (session_id, key): key chỉ có nghĩa trong phạm vi một phiên,
+      hai phiên gửi cùng key (vd bộ đếm "1" của client) không nhận nhầm kết quả của nhau.
+    - Nếu không, dùng (session_id, câu hỏi đã chuẩn hoá). Khi chưa có session_id thì không
+      so trùng, vì hai sinh viên khác nhau có thể cùng hỏi một câu.
+    """
+    if idempotency_key:
+        return f"key:{session_id or ''}:{idempotency_key}"
+    if not session_id:
+        return None
+    digest = hashlib.sha1(normalize_question(question).encode("utf-8")).hexdigest()
+    return f"q:{session_id}:{digest}"
+
+
+class SessionCoordinator:
+    """
+    Điều phối các lượt hỏi trong cùng một tiến trình (trên event loop của server):
+    - `session_lock`: các lượt của cùng một phiên được xử lý lần lượt, không chạy song song
+      (tránh hai lượt cùng đọc một lịch sử rồi ghi đè lên nhau).
+    - `run_once`: yêu cầu trùng khoá (và cùng câu hỏi) sẽ gắn vào phép tính đang chạy, hoặc nhận lại
+      kết quả vừa xong trong cửa sổ `window_s`, thay vì chạy thêm một lần LLM.
+
+    Khoá chỉ có hiệu lực trong một tiến trình worker; giữa các worker, việc ghi lịch sử được bảo vệ
+    bằng compare-and-set theo version của phiên (SessionStore.save_turn).
+    """
+
+    def __init__(self, window_s: float = DEDUP_WINDOW_S):
+        self.window_s = window_s
+        # session_id -> [Lock, số lượt đang giữ/chờ]
+        self._session_locks: Dict[str, list] = {}
+        # khoá -> (câu hỏi đã chuẩn hoá, task)
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        # khoá -> (hết hạn lúc, câu hỏi đã chuẩn hoá, kết quả)
+        self._recent: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self.deduplicated = 0
+
+    @asynccontextmanager
+    async def session_lock(self, session_id: str):
+        entry = self._session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._session_locks.pop(session_id, None)
+
+    async def run_once(self, key: Optional[str], fn: Callable[[], Awaitable[Any]], question: str = "") -> Any:
+        """
+        Chạy `fn` một lần cho mỗi khoá. Kết quả chỉ được dùng chung khi câu hỏi cũng trùng: cùng idempotency key
+        mà khác câu hỏi (client dùng lại key) thì chạy riêng, không trả kết quả của câu hỏi khác.
+        """
+        if key is None:
+            return await fn()
+        question = normalize_question(question)
+
+        recent = self._recent.get(key)
+        if recent is not None and recent[0] > time.monotonic():
+            if recent[1] != question:
+                print(f"--- DEDUP: {key} đã dùng cho câu hỏi khác, chạy riêng ---")
+                return await fn()
+            self.deduplicated += 1
+            print(f"--- DEDUP: trả lại kết quả vừa có cho {key} ---")
+            return recent[2]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != question:
+                print(f"--- DEDUP: {key} đang dùng cho câu hỏi khác, chạy riêng ---")
+                return await fn()
+            task = inflight[1]
+            self.deduplicated += 1
+            print(f"--- DEDUP: chờ kết quả của yêu cầu đang chạy {key} ---")
+        else:
+            # Phép tính chạy trong task riêng: yêu cầu nào bị huỷ (client ngắt, hết thời gian) cũng chỉ
+            # ngừng chờ, task vẫn chạy tiếp cho các yêu cầu trùng khác (kể cả yêu cầu gốc)
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = (question, task)
+            task.add_done_callback(functools.partial(self._on_done, key, question))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, question: str, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        # task.exception() cũng đánh dấu đã đọc lỗi, asyncio không cảnh báo khi không còn ai chờ
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._recent[key] = (time.monotonic() + self.window_s, question, task.result())
+        self._recent.move_to_end(key)
+        while len(self._recent) > _MAX_RECENT:
+            self._recent.popitem(last=False)
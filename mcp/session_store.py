@@ -0,0 +1,368 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from .history import SUMMARY_KEY
+
+# Cấu hình mặc định (có thể chỉnh qua biến môi trường)
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE", "sqlite")  # "sqlite" hoặc "memory"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", str(24 * 3600)))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+# Số lần thử ghi lại một lượt khi phiên đã bị worker khác ghi trong lúc chạy agent
+SESSION_CAS_RETRIES = int(os.getenv("SESSION_CAS_RETRIES", "3"))
+
+# Nén zlib khi payload lớn hơn ngưỡng này (byte)
+_COMPRESS_THRESHOLD = 512
+_RAW, _ZLIB = b"j", b"z"
+
+
+# --- Tuần tự hoá message gọn nhẹ ---
+
+def serialize_messages(messages: List[BaseMessage]) -> bytes:
+    """
+    Chuyển danh sách message thành bytes gọn: JSON dạng [[loại, nội dung], ...],
+    nén zlib nếu đủ lớn. Lịch sử chỉ gồm Human/AI và bản tóm tắt nên không cần lưu metadata khác.
+    """
+    rows = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            rows.append(["h", m.content])
+        elif isinstance(m, AIMessage):
+            rows.append(["a", m.content])
+        elif isinstance(m, SystemMessage):
+            rows.append(["S" if m.additional_kwargs.get(SUMMARY_KEY) else "s", m.content])
+    raw = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) > _COMPRESS_THRESHOLD:
+        return _ZLIB + zlib.compress(raw, 6)
+    return _RAW + raw
+
+
+def deserialize_messages(data: bytes) -> List[BaseMessage]:
+    flag, body = data[:1], data[1:]
+    if flag == _ZLIB:
+        body = zlib.decompress(body)
+    messages: List[BaseMessage] = []
+    for kind, content in json.loads(body):
+        if kind == "h":
+            messages.append(HumanMessage(content=content))
+        elif kind == "a":
+            messages.append(AIMessage(content=content))
+        elif kind == "S":
+            messages.append(SystemMessage(content=content, additional_kwargs={SUMMARY_KEY: True}))
+        else:
+            messages.append(SystemMessage(content=content))
+    return messages
+
+
+# --- Giao diện chung ---
+
+class SessionConflictError(Exception):
+    """Phiên đã bị ghi bởi một lượt khác (thường là ở worker khác) kể từ khi được đọc."""
+
+
+class SessionStore(ABC):
+    """
+    Nơi lưu lịch sử hội thoại theo session_id.
+    Mỗi phiên có một version tăng sau mỗi lần ghi (0 = chưa tồn tại); `set` với `expected_version`
+    là compare-and-set, dùng để phát hiện hai worker cùng ghi một phiên.
+    """
+
+    @abstractmethod
+    def load(self, session_id: str) -> Tuple[Optional[List[BaseMessage]], int]:
+        """Trả về (lịch sử, version) của phiên; (None, 0) nếu phiên không tồn tại/đã hết hạn."""
+
+    @abstractmethod
+    def set(self, session_id: str, messages: List[BaseMessage], expected_version: Optional[int] = None) -> int:
+        """
+        Ghi (đè) lịch sử của phiên, trả về version mới.
+        Nếu có `expected_version` mà version hiện tại khác thì không ghi và ném SessionConflictError.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Xoá một phiên."""
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        """Số liệu về store (số phiên, dung lượng, số lần bị loại bỏ...)."""
+
+    def get(self, session_id: str) -> Optional[List[BaseMessage]]:
+        """Trả về lịch sử của phiên, hoặc None nếu phiên không tồn tại/đã hết hạn."""
+        return self.load(session_id)[0]
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        """Phiên còn tồn tại và chưa hết hạn (không đọc/giải nén lịch sử)."""
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.exists(session_id)
+
+    def save_turn(self, session_id: str, history: List[BaseMessage], version: int, updated_history: List[BaseMessage]) -> List[BaseMessage]:
+        """
+        Ghi lịch sử sau một lượt hỏi đáp (`history`, `version` là lúc đọc, `updated_history` = history + lượt mới).
+        Nếu phiên đã bị ghi trong lúc chạy agent (worker khác), nối lượt mới vào lịch sử mới nhất rồi ghi lại,
+        tối đa SESSION_CAS_RETRIES lần; vẫn xung đột thì ném SessionConflictError. Trả về lịch sử đã ghi.
+        """
+        new_turn = updated_history[len(history):]
+        for _ in range(SESSION_CAS_RETRIES):
+            try:
+                self.set(session_id, updated_history, expected_version=version)
+                return updated_history
+            except SessionConflictError:
+                current, version = self.load(session_id)
+                updated_history = (current or []) + new_turn
+                print(f"--- SESSION: phiên {session_id} vừa được ghi ở nơi khác, ghi lại lượt mới (version {version}) ---")
+        raise SessionConflictError(f"Phiên {session_id} đang được cập nhật đồng thời, vui lòng thử lại.")
+
+
+class InMemorySessionStore(SessionStore):
+    """
+    Store trong bộ nhớ tiến trình, loại bỏ theo LRU + TTL.
+    Dung lượng mỗi phiên được tính bằng kích thước bản tuần tự hoá, và tổng dung lượng
+    bị chặn bởi `max_bytes` để tiến trình không phình ra vô hạn.
+    Chỉ phù hợp khi chạy một worker.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, max_bytes: int = SESSION_MAX_BYTES, ttl_s: float = SESSION_TTL_S):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        # session_id -> (hết hạn lúc, số byte, lịch sử, version)
+        self._data: "OrderedDict[str, Tuple[float, int, List[BaseMessage], int]]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, session_id: str):
+        _, size, _, _ = self._data.pop(session_id)
+        self._bytes -= size
+
+    def _live(self, session_id: str):
+        entry = self._data.get(session_id)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(session_id)
+            self._expirations += 1
+            return None
+        return entry
+
+    def load(self, session_id: str) -> Tuple[Optional[List[BaseMessage]], int]:
+        with self._lock:
+            entry = self._live(session_id)
+            if entry is None:
+                return None, 0
+            _, size, messages, version = entry
+            # Đọc cũng gia hạn TTL và đưa phiên về cuối hàng đợi LRU
+            self._data[session_id] = (time.monotonic() + self.ttl_s, size, messages, version)
+            self._data.move_to_end(session_id)
+            return list(messages), version
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._live(session_id) is not None
+
+    def set(self, session_id: str, messages: List[BaseMessage], expected_version: Optional[int] = None) -> int:
+        size = len(serialize_messages(messages))
+        with self._lock:
+            entry = self._live(session_id)
+            version = entry[3] if entry is not None else 0
+            if expected_version is not None and expected_version != version:
+                raise SessionConflictError(f"Phiên {session_id}: version {version}, mong đợi {expected_version}")
+            if entry is not None:
+                self._remove(session_id)
+            self._data[session_id] = (time.monotonic() + self.ttl_s, size, list(messages), version + 1)
+            self._bytes += size
+            self._evict()
+            return version + 1
+
+    def _evict(self):
+        now = time.monotonic()
+        # Phiên cũ nhất nằm ở đầu OrderedDict
+        while self._data:
+            oldest_id, (expires_at, _, _, _) = next(iter(self._data.items()))
+            if expires_at < now:
+                self._remove(oldest_id)
+                self._expirations += 1
+            elif len(self._data) > self.max_sessions or self._bytes > self.max_bytes:
+                self._remove(oldest_id)
+                self._evictions += 1
+            else:
+                break
+
+    def delete(self, session_id: str):
+        with self._lock:
+            if session_id in self._data:
+                self._remove(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._data),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store bền vững dùng SQLite (chế độ WAL), dùng chung được giữa nhiều worker uvicorn
+    trên cùng một máy. Phiên hết hạn theo TTL và bị cắt bớt khi vượt `max_sessions`.
+    Cột `version` cho phép compare-and-set giữa các worker (khoá phiên của SessionCoordinator chỉ có
+    hiệu lực trong một tiến trình).
+    """
+
+    # Dọn dẹp phiên hết hạn sau mỗi N lần ghi
+    _PURGE_EVERY = 200
+
+    def __init__(self, path: str = SESSION_DB_PATH, max_sessions: int = SESSION_MAX_SESSIONS, ttl_s: float = SESSION_TTL_S):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_s = ttl_s
+        self._local = threading.local()
+        self._writes = 0
+        self._evictions = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)")
+        conn.commit()
+        self._add_version_column(conn)
+
+    @staticmethod
+    def _add_version_column(conn: sqlite3.Connection):
+        """File sessions.db tạo từ bản cũ chưa có cột version."""
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+        if "version" in columns:
+            return
+        try:
+            with conn:
+                conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError as e:
+            # Worker khác vừa thêm cột cùng lúc
+            if "duplicate column" not in str(e):
+                raise
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3.Connection không dùng chung giữa các thread được, nên mỗi thread giữ một kết nối
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, session_id: str) -> Tuple[Optional[List[BaseMessage]], int]:
+        row = self._conn().execute(
+            "SELECT data, updated_at, version FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None, 0
+        data, updated_at, version = row
+        if updated_at + self.ttl_s < time.time():
+            self._delete_version(session_id, version)
+            return None, 0
+        return deserialize_messages(data), version
+
+    def exists(self, session_id: str) -> bool:
+        row = self._conn().execute(
+            "SELECT 1 FROM sessions WHERE id = ? AND updated_at >= ?", (session_id, time.time() - self.ttl_s)
+        ).fetchone()
+        return row is not None
+
+    def set(self, session_id: str, messages: List[BaseMessage], expected_version: Optional[int] = None) -> int:
+        data, now = serialize_messages(messages), time.time()
+        conn = self._conn()
+        with conn:
+            if expected_version is None:
+                conn.execute(
+                    "INSERT INTO sessions (id, data, updated_at, version) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at,"
+                    " version = sessions.version + 1",
+                    (session_id, data, now),
+                )
+                version = conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()[0]
+            elif expected_version == 0:
+                cur = conn.execute(
+                    "INSERT INTO sessions (id, data, updated_at, version) VALUES (?, ?, ?, 1) ON CONFLICT(id) DO NOTHING",
+                    (session_id, data, now),
+                )
+                version = 1
+            else:
+                cur = conn.execute(
+                    "UPDATE sessions SET data = ?, updated_at = ?, version = version + 1 WHERE id = ? AND version = ?",
+                    (data, now, session_id, expected_version),
+                )
+                version = expected_version + 1
+            if expected_version is not None and cur.rowcount == 0:
+                raise SessionConflictError(f"Phiên {session_id}: version đã khác {expected_version}")
+        self._writes += 1
+        if self._writes % self._PURGE_EVERY == 0:
+            self.purge()
+        return version
+
+    def _delete_version(self, session_id: str, version: int):
+        # Chỉ xoá phiên hết hạn nếu chưa có ai ghi đè trong lúc này
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ? AND version = ?", (session_id, version))
+
+    def delete(self, session_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge(self):
+        """Xoá phiên hết hạn và các phiên cũ nhất nếu vượt quá max_sessions."""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_s,))
+            cur = conn.execute(
+                "DELETE FROM sessions WHERE id IN ("
+                " SELECT id FROM sessions ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+            self._evictions += cur.rowcount
+
+    def stats(self) -> Dict:
+        count, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM sessions"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": count,
+            "bytes": size,
+            "max_sessions": self.max_sessions,
+            "evictions": self._evictions,
+        }
+
+
+def create_session_store(backend: str = SESSION_STORE_BACKEND) -> SessionStore:
+    """Tạo session store theo cấu hình (biến môi trường SESSION_STORE)."""
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "sqlite":
+        return SQLiteSessionStore()
+    raise ValueError(f"SESSION_STORE không hợp lệ: '{backend}' (chỉ hỗ trợ 'sqlite' hoặc 'memory').")
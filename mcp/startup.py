@@ -0,0 +1,76 @@
+"""
+Khởi tạo trước (prewarm) các thành phần nặng của agent: model cascade (langchain_google_genai),
+graph LangGraph, client Pinecone (tra host của index) và Tavily.
+
+Các thành phần này đều được tạo khi dùng lần đầu, nên server khởi động nhanh và các endpoint
+không cần LLM (/jobs, /activities...) phục vụ được ngay. Prewarm chạy trong một thread nền
+lúc server khởi động để lượt /ask đầu tiên không phải chờ; tắt bằng PREWARM=0.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+PREWARM_ENABLED = os.getenv("PREWARM", "1") == "1"
+
+# Thành phần -> thời gian khởi tạo (giây) / lỗi khi khởi tạo
+_timings: Dict[str, float] = {}
+_errors: Dict[str, str] = {}
+_thread: Optional[threading.Thread] = None
+
+
+def _components() -> List[Tuple[str, Callable[[], object]]]:
+    from . import rag, tools
+
+    return [
+        ("llm", rag.get_cascade),
+        ("graph", rag.get_graph),
+        ("pinecone_index", tools.get_index),
+        ("tavily", tools.get_tavily_tool),
+    ]
+
+
+def prewarm():
+    """Khởi tạo lần lượt các thành phần; lỗi (thiếu key, mất mạng) chỉ được ghi lại, lần dùng sau sẽ thử lại."""
+    started = time.perf_counter()
+    for name, init in _components():
+        component_started = time.perf_counter()
+        try:
+            init()
+            _errors.pop(name, None)
+        except Exception as e:
+            _errors[name] = str(e)
+            print(f"--- PREWARM: lỗi khi khởi tạo {name}: {e} ---")
+        finally:
+            _timings[name] = time.perf_counter() - component_started
+    print(f"--- PREWARM: xong sau {time.perf_counter() - started:.2f}s {({k: round(v, 3) for k, v in _timings.items()})} ---")
+
+
+def start_prewarm() -> threading.Thread:
+    """Chạy prewarm trong thread nền (chỉ một lần cho mỗi tiến trình)."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def status() -> Dict:
+    from . import rag
+
+    return {
+        "prewarm_enabled": PREWARM_ENABLED,
+        "prewarm_running": _thread is not None and _thread.is_alive(),
+        "llm_ready": rag.is_llm_ready(),
+        "components": {name: {"seconds": round(seconds, 3), "error": _errors.get(name)} for name, seconds in _timings.items()},
+    }
+
+
+def collect_metrics():
+    """Collector cho /metrics: thời gian khởi tạo từng thành phần và trạng thái sẵn sàng của agent."""
+    from . import rag
+
+    yield "startup_component_seconds", "Thời gian khởi tạo từng thành phần nặng (prewarm).", "gauge", [
+        ({"component": name}, seconds) for name, seconds in _timings.items()
+    ]
+    yield "llm_ready", "1 nếu model cascade và graph đã được khởi tạo.", "gauge", [({}, 1 if rag.is_llm_ready() else 0)]
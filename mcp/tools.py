@@ -1,43 +1,173 @@
 from .scholarship import *
 
+import asyncio
 import os
 from datetime import datetime, timedelta
 from typing import List, Optional
 import calendar
 from typing import Dict, List
 from langchain_core.tools import tool
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_community.document_loaders import WebBaseLoader
-from pinecone import Pinecone
 from dotenv import load_dotenv
 load_dotenv()
 
+from .metrics import RETRIEVAL_SECONDS, UPSTREAM_HTTP_SECONDS, span
+from .retrieval_cache import RETRIEVAL_CACHE_ENABLED, RetrievalCache
+
 
 # --- Khởi tạo Pinecone (chỉ cho tool tìm kiếm sổ tay) ---
+# Client Pinecone, Tavily (và thư viện của chúng) được import/tạo khi dùng lần đầu
+# để import module này nhanh và không cần mạng/key (xem mcp/startup.py để khởi tạo trước).
 
-pinecone_api_key = os.getenv("PICONE_API_KEY")
-pc = Pinecone(api_key=pinecone_api_key)
-index_name = "sotayhust"  
-index = pc.Index(index_name)
+index_name = "sotayhust"
+_pc = None
+_tavily_tool = None
 
-#Thiết lập tool search web tavily
-tavily_tool = TavilySearchResults(max_results=5)
 
-def get_similar_doc(text, namespace, topk = 5):
-    results = index.search(
-        namespace=namespace, 
-        query={
-            "inputs": {"text": text}, 
-            "top_k": topk
-        },
-        fields=["text"]
-    )
+def get_pinecone():
+    global _pc
+    if _pc is None:
+        from pinecone import Pinecone
+
+        _pc = Pinecone(api_key=os.getenv("PICONE_API_KEY"))
+    return _pc
+
+
+def get_tavily_tool():
+    """Tool search web Tavily."""
+    global _tavily_tool
+    if _tavily_tool is None:
+        from langchain_community.tools.tavily_search import TavilySearchResults
+
+        _tavily_tool = TavilySearchResults(max_results=5)
+    return _tavily_tool
+
+# Client index được tạo khi dùng lần đầu (pc.Index cần gọi mạng để tra host của index).
+# Client async gắn với event loop tạo ra nó nên được giữ riêng theo từng loop (loop đã đóng bị loại bỏ).
+_index = None
+_index_host: Optional[str] = None
+_async_indexes: Dict[asyncio.AbstractEventLoop, object] = {}
+_async_index_override = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = get_pinecone().Index(host=get_index_host())
+    return _index
+
+
+def get_index_host() -> str:
+    global _index_host
+    if _index_host is None:
+        _index_host = get_pinecone().describe_index(index_name).host
+    return _index_host
+
+
+async def get_async_index():
+    """
+    Client Pinecone async cho event loop hiện tại.
+    Lần đầu, việc tạo client Pinecone và tra host (describe_index, gọi mạng đồng bộ) chạy trong thread
+    để không chặn event loop; thường thì prewarm (mcp/startup.py) đã làm sẵn.
+    """
+    if _async_index_override is not None:
+        return _async_index_override
+    loop = asyncio.get_running_loop()
+    async_index = _async_indexes.get(loop)
+    if async_index is None:
+        host = _index_host or await asyncio.to_thread(get_index_host)
+        async_index = _async_indexes.get(loop)
+        if async_index is None:
+            async_index = get_pinecone().IndexAsyncio(host=host)
+            for closed in [other for other in _async_indexes if other.is_closed()]:
+                del _async_indexes[closed]
+            _async_indexes[loop] = async_index
+    return async_index
+
+
+def set_index(index, async_index=None):
+    """Thay client index (dùng cho benchmark/kiểm thử với index giả lập)."""
+    global _index, _async_index_override
+    _index = index
+    _async_index_override = async_index
+    _async_indexes.clear()
+    if retrieval_cache is not None:
+        retrieval_cache.clear()
+
+
+def _hits_to_docs(results) -> List[str]:
     list_doc = []
     for doc in results["result"]['hits']:
         list_doc.append(doc['fields']['text'])
     return list_doc
 
 
+# Kết quả search dùng chung giữa các lượt hỏi (tự mất hiệu lực khi tăng INDEX_VERSION)
+retrieval_cache = RetrievalCache() if RETRIEVAL_CACHE_ENABLED else None
+
+
+def get_similar_doc(text, namespace, topk = 5):
+    with span(RETRIEVAL_SECONDS, namespace=namespace, cache="hit") as labels:
+        return _get_similar_doc(text, namespace, topk, labels)
+
+
+def _get_similar_doc(text, namespace, topk, labels):
+    def search():
+        labels["cache"] = "miss"
+        results = get_index().search(
+            namespace=namespace, 
+            query={
+                "inputs": {"text": text}, 
+                "top_k": topk
+            },
+            fields=["text"]
+        )
+        return _hits_to_docs(results)
+
+    if retrieval_cache is None:
+        return search()
+    return retrieval_cache.get_or_search(RetrievalCache.make_key(namespace, text, topk), search)
+
+
+async def aget_similar_doc(text, namespace, topk = 5):
+    """Bản async của get_similar_doc, không chiếm thread trong lúc chờ Pinecone."""
+    with span(RETRIEVAL_SECONDS, namespace=namespace, cache="hit") as labels:
+        return await _aget_similar_doc(text, namespace, topk, labels)
+
+
+async def _aget_similar_doc(text, namespace, topk, labels):
+    async def search():
+        labels["cache"] = "miss"
+        results = await (await get_async_index()).search(
+            namespace=namespace,
+            query={
+                "inputs": {"text": text},
+                "top_k": topk
+            },
+            fields=["text"]
+        )
+        return _hits_to_docs(results)
+
+    if retrieval_cache is None:
+        return await search()
+    return await retrieval_cache.aget_or_search(RetrievalCache.make_key(namespace, text, topk), search)
+
+
+# Model embedding dùng cho answer cache (so khớp câu hỏi tương tự)
+embed_model = os.getenv("EMBED_MODEL", "multilingual-e5-large")
+
+def embed_query(text: str) -> List[float]:
+    """Tạo embedding cho một câu hỏi bằng Pinecone Inference."""
+    with span(UPSTREAM_HTTP_SECONDS, target="pinecone_embed") as labels:
+        embeddings = get_pinecone().inference.embed(
+            model=embed_model,
+            inputs=[text],
+            parameters={"input_type": "query", "truncate": "END"}
+        )
+        labels["status"] = "ok"
+    embedding = embeddings[0]
+    return embedding["values"] if isinstance(embedding, dict) else embedding.values
+
+
 # --- Định nghĩa Tool 1: Tìm kiếm Sổ tay Sinh viên ---
 @tool
 def search_student_handbook(query: str) -> List[str]:
@@ -50,6 +180,12 @@ def search_student_handbook(query: str) -> List[str]:
     print(f"---SỬ DỤNG TOOL: search_student_handbook với query: {query}---")
     return get_similar_doc(query, namespace = "semantic_chunker")
 
+async def _asearch_student_handbook(query: str) -> List[str]:
+    print(f"---SỬ DỤNG TOOL: search_student_handbook với query: {query}---")
+    return await aget_similar_doc(query, namespace="semantic_chunker")
+
+search_student_handbook.coroutine = _asearch_student_handbook
+
 @tool
 def search_academic_regulations(query: str) -> List[str]:
     """
@@ -61,6 +197,12 @@ def search_academic_regulations(query: str) -> List[str]:
     print(f"---TOOL: search_academic_regulations (namespace: QCDT2025) | Query: {query}---")
     return get_similar_doc(query, namespace="QCDT2025")
 
+async def _asearch_academic_regulations(query: str) -> List[str]:
+    print(f"---TOOL: search_academic_regulations (namespace: QCDT2025) | Query: {query}---")
+    return await aget_similar_doc(query, namespace="QCDT2025")
+
+search_academic_regulations.coroutine = _asearch_academic_regulations
+
 @tool
 def search_law_vietnam(query: str) -> List[str]:
     """
@@ -71,18 +213,17 @@ def search_law_vietnam(query: str) -> List[str]:
     print(f"---TOOL: search_law_vietnam (namespace: LawVN) | Query: {query}---")
     return get_similar_doc(query, namespace="LawVN")
 
-@tool
-def search_website(query: str) -> List[str]:
-    """
-    Sử dụng Tavily API để tìm kiếm website liên quan đến query,
-    sau đó scrape nội dung các website đó và trả về danh sách đoạn văn bản.
-    Hữu ích cho các câu hỏi cần thông tin mới, thời sự hoặc không có trong cơ sở dữ liệu.
-    """
-    print(f"---TOOL: search_website | Query: {query}---")
-    
+async def _asearch_law_vietnam(query: str) -> List[str]:
+    print(f"---TOOL: search_law_vietnam (namespace: LawVN) | Query: {query}---")
+    return await aget_similar_doc(query, namespace="LawVN")
+
+search_law_vietnam.coroutine = _asearch_law_vietnam
+
+def fetch_web_docs(query: str) -> List[str]:
+    """Tìm URL liên quan bằng Tavily rồi scrape nội dung các trang đó."""
     # 1. Tìm kiếm URL liên quan bằng Tavily
     try:
-        results = tavily_tool.invoke({"query": query})
+        results = get_tavily_tool().invoke({"query": query})
         urls = [item["url"] for item in results if "url" in item]
     except Exception as e:
         print(f"Lỗi khi gọi Tavily: {e}")
@@ -93,6 +234,8 @@ def search_website(query: str) -> List[str]:
 
     # 2. Scrape nội dung từ các URL
     try:
+        from langchain_community.document_loaders import WebBaseLoader
+
         loader = WebBaseLoader(urls)
         docs = loader.load()
         list_doc = [doc.page_content for doc in docs if doc.page_content.strip()]
@@ -101,29 +244,56 @@ def search_website(query: str) -> List[str]:
         print(f"Lỗi khi scrape website: {e}")
         return [f"Lỗi khi scrape website: {e}"]
 
+async def afetch_web_docs(query: str) -> List[str]:
+    """Bản async của fetch_web_docs (scrape song song các URL)."""
+    # 1. Tìm kiếm URL liên quan bằng Tavily
+    try:
+        results = await get_tavily_tool().ainvoke({"query": query})
+        urls = [item["url"] for item in results if "url" in item]
+    except Exception as e:
+        print(f"Lỗi khi gọi Tavily: {e}")
+        return [f"Lỗi khi tìm kiếm với Tavily: {e}"]
+
+    if not urls:
+        return ["Không tìm thấy website nào liên quan."]
+
+    # 2. Scrape song song nội dung từ các URL
+    try:
+        from langchain_community.document_loaders import WebBaseLoader
+
+        loader = WebBaseLoader(urls)
+        docs = [doc async for doc in loader.alazy_load()]
+        return [doc.page_content for doc in docs if doc.page_content.strip()]
+    except Exception as e:
+        print(f"Lỗi khi scrape website: {e}")
+        return [f"Lỗi khi scrape website: {e}"]
+
 @tool
-def get_scholarships(
-    time_period: str = "upcoming", status: str = "all"
-) -> List[Dict]:
+def search_website(query: str) -> List[str]:
     """
-    Sử dụng để lấy danh sách học bổng, có thể lọc theo thời gian và trạng thái (còn hạn/hết hạn).
-    
-    Tham số `status` chấp nhận: "open", "expired", "all".
-    
-    Tham số `time_period` chấp nhận:
-    - Các từ khóa: "upcoming", "this_week", "this_month", "last_7_days", "last_month".
-    - Tháng cụ thể: chuỗi "YYYY-MM" (ví dụ: "2025-08" cho tháng 8 năm 2025).
-    - Ngày cụ thể: chuỗi "YYYY-MM-DD" (ví dụ: "2025-09-01").
+    Sử dụng Tavily API để tìm kiếm website liên quan đến query,
+    sau đó scrape nội dung các website đó và trả về danh sách đoạn văn bản.
+    Hữu ích cho các câu hỏi cần thông tin mới, thời sự hoặc không có trong cơ sở dữ liệu.
     """
-    print(f"---TOOL: get_scholarships (time_period: {time_period}, status: {status})---")
+    print(f"---TOOL: search_website | Query: {query}---")
+    return fetch_web_docs(query)
 
-    all_scholarships = crawl_all_scholarships()
-    if not all_scholarships:
-        return [{"error": "Không thể crawl dữ liệu học bổng."}]
+async def _asearch_website(query: str) -> List[str]:
+    print(f"---TOOL: search_website | Query: {query}---")
+    return await afetch_web_docs(query)
 
-    today = datetime.now()
-    start_dt, end_dt = None, None
+# Khi chạy async (agent.ainvoke), tool sẽ dùng các coroutine này thay vì chiếm một thread.
+# get_scholarships/get_scholarship_detail không có bản async riêng nên langchain sẽ chạy chúng trong executor.
+search_website.coroutine = _asearch_website
 
+# Số học bổng tối đa mỗi lần gọi get_scholarships (mỗi học bổng chỉ ở dạng tóm tắt)
+SCHOLARSHIP_PAGE_SIZE = int(os.getenv("SCHOLARSHIP_PAGE_SIZE", "10"))
+SCHOLARSHIP_MAX_PAGE_SIZE = 30
+
+
+def _time_period_range(time_period: str):
+    """Khoảng (bắt đầu, kết thúc) của `time_period`, hoặc None nếu giá trị không hợp lệ."""
+    today = datetime.now()
     time_period_mapping = {
         "upcoming": (today, today + timedelta(days=30)),
         "this_week": (today - timedelta(days=today.weekday()), (today - timedelta(days=today.weekday())) + timedelta(days=6)),
@@ -147,12 +317,43 @@ def get_scholarships(
                 parsed_date = datetime.strptime(time_period, "%Y-%m-%d")
                 start_dt = end_dt = parsed_date
             except ValueError:
-                return [{"error": f"Giá trị time_period '{time_period}' không hợp lệ. Phải là từ khóa hoặc theo định dạng YYYY-MM, YYYY-MM-DD."}]
+                return None
 
     # Đảm bảo bao trọn cả ngày
-    start_dt = start_dt.replace(hour=0, minute=0, second=0)
-    end_dt = end_dt.replace(hour=23, minute=59, second=59)
+    return start_dt.replace(hour=0, minute=0, second=0), end_dt.replace(hour=23, minute=59, second=59)
 
+
+@tool
+def get_scholarships(
+    time_period: str = "upcoming", status: str = "all", limit: int = SCHOLARSHIP_PAGE_SIZE, offset: int = 0
+) -> List[Dict]:
+    """
+    Sử dụng để lấy danh sách học bổng, có thể lọc theo thời gian và trạng thái (còn hạn/hết hạn).
+    Mỗi học bổng chỉ gồm thông tin tóm tắt: id, tên, giá trị, số suất, hạn nộp, trạng thái.
+    Muốn biết điều kiện, hồ sơ, liên hệ... của một học bổng thì gọi `get_scholarship_detail` với id của nó.
+    
+    Tham số `status` chấp nhận: "open", "expired", "all".
+    
+    Tham số `time_period` chấp nhận:
+    - Các từ khóa: "upcoming", "this_week", "this_month", "last_7_days", "last_month".
+    - Tháng cụ thể: chuỗi "YYYY-MM" (ví dụ: "2025-08" cho tháng 8 năm 2025).
+    - Ngày cụ thể: chuỗi "YYYY-MM-DD" (ví dụ: "2025-09-01").
+
+    Kết quả sắp theo hạn nộp, tối đa `limit` học bổng bắt đầu từ vị trí `offset`;
+    nếu còn học bổng khác, phần tử cuối cho biết `offset` để gọi tiếp.
+    """
+    print(f"---TOOL: get_scholarships (time_period: {time_period}, status: {status}, limit: {limit}, offset: {offset})---")
+
+    period = _time_period_range(time_period)
+    if period is None:
+        return [{"error": f"Giá trị time_period '{time_period}' không hợp lệ. Phải là từ khóa hoặc theo định dạng YYYY-MM, YYYY-MM-DD."}]
+    start_dt, end_dt = period
+
+    all_scholarships = crawl_all_scholarships()
+    if not all_scholarships:
+        return [{"error": "Không thể crawl dữ liệu học bổng."}]
+
+    today = datetime.now()
     filtered_list = []
     for hb in all_scholarships:
         try:
@@ -164,11 +365,9 @@ def get_scholarships(
                 continue
             
             is_expired = deadline_dt < today
-            current_status = "Expired" if is_expired else "Open"
 
             if status == "all" or (status == "open" and not is_expired) or (status == "expired" and is_expired):
-                hb = Scholarship(hb)
-                filtered_list.append(hb.get_full_info_string())
+                filtered_list.append((deadline_dt, hb))
         except (ValueError, KeyError, TypeError) as e:
             print(f"Bỏ qua học bổng bị lỗi: {hb.get('Title')}, Lỗi: {e}")
             continue
@@ -176,7 +375,33 @@ def get_scholarships(
     if not filtered_list:
         return [{"message": f"Không tìm thấy học bổng nào với trạng thái '{status}' trong khoảng thời gian '{time_period}'."}]
 
-    return filtered_list
+    filtered_list.sort(key=lambda item: item[0])
+    limit = max(1, min(limit, SCHOLARSHIP_MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    page = [Scholarship(hb).get_summary() for _, hb in filtered_list[offset:offset + limit]]
+    remaining = len(filtered_list) - offset - len(page)
+    if not page:
+        return [{"message": f"Chỉ có {len(filtered_list)} học bổng phù hợp, offset={offset} vượt quá danh sách."}]
+    if remaining > 0:
+        page.append({"message": f"Còn {remaining} học bổng khác, gọi lại với offset={offset + len(page)} để xem tiếp."})
+    return page
+
+
+@tool
+def get_scholarship_detail(document_id: int) -> str:
+    """
+    Lấy toàn bộ thông tin của một học bổng (loại, giá trị, số suất, hạn nộp, email liên hệ
+    và nội dung chi tiết: điều kiện, hồ sơ...) theo `document_id` là trường "id" do `get_scholarships` trả về.
+    """
+    print(f"---TOOL: get_scholarship_detail (document_id: {document_id})---")
+
+    all_scholarships = crawl_all_scholarships()
+    if not all_scholarships:
+        return "Không thể crawl dữ liệu học bổng."
+    for hb in all_scholarships:
+        if str(hb.get('DocumentId')) == str(document_id):
+            return Scholarship(hb).get_full_info_string()
+    return f"Không tìm thấy học bổng có id {document_id}."
 
 if __name__ == "__main__":
     print(get_scholarships("2025-08", "all"))
@@ -0,0 +1,407 @@
+"""
+Các backend tổng hợp giọng nói cho /tts, theo thứ tự ưu tiên: các server TTS HTTP (StyleTTS trên Colab qua ngrok...)
+rồi gTTS làm dự phòng cuối.
+
+- Circuit breaker cho từng backend: lỗi liên tiếp TTS_BREAKER_FAILURES lần (hoặc health probe thất bại)
+  thì bỏ qua backend đó trong TTS_BREAKER_COOLDOWN_S giây, sau đó cho thử lại (half-open).
+- Health probe chủ động: mỗi TTS_PROBE_INTERVAL_S giây gọi GET <url><TTS_PROBE_PATH>, nên khi máy Colab tắt
+  các request không phải chờ hết timeout mới biết.
+- Hedging: nếu backend đang gọi chưa trả lời sau TTS_HEDGE_AFTER_S giây, gọi song song backend kế tiếp
+  và lấy kết quả nào về trước.
+
+Cấu hình backend HTTP bằng TTS_BACKENDS="tên=url,tên=url" (mặc định: external=EXTERNAL_TTS_URL).
+"""
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from .metrics import TTS_BACKEND_SECONDS, observe
+
+# Dịch vụ TTS ngoài (qua ngrok); đặt rỗng để chỉ dùng gTTS
+EXTERNAL_TTS_URL = os.getenv("EXTERNAL_TTS_URL", "https://9721771d4d78.ngrok-free.app").rstrip("/")
+TTS_BACKENDS = os.getenv("TTS_BACKENDS", f"external={EXTERNAL_TTS_URL}" if EXTERNAL_TTS_URL else "")
+TTS_GTTS_FALLBACK = os.getenv("TTS_GTTS", "1") == "1"
+TTS_TIMEOUT_S = float(os.getenv("TTS_TIMEOUT_S", "60"))
+TTS_HEDGE_AFTER_S = float(os.getenv("TTS_HEDGE_AFTER_S", "4"))
+TTS_PROBE_INTERVAL_S = float(os.getenv("TTS_PROBE_INTERVAL_S", "30"))
+TTS_PROBE_TIMEOUT_S = float(os.getenv("TTS_PROBE_TIMEOUT_S", "3"))
+TTS_PROBE_PATH = os.getenv("TTS_PROBE_PATH", "/health")
+TTS_BREAKER_FAILURES = int(os.getenv("TTS_BREAKER_FAILURES", "3"))
+TTS_BREAKER_COOLDOWN_S = float(os.getenv("TTS_BREAKER_COOLDOWN_S", "30"))
+
+
+class TTSError(Exception):
+    """Backend không tổng hợp được audio (lỗi HTTP, dịch vụ tắt, mọi backend đều lỗi...)."""
+
+
+class CircuitBreaker:
+    """
+    closed: gọi bình thường. open: bỏ qua backend tới khi hết `cooldown_s`.
+    half_open: hết cooldown, cho đúng một request thử (các request khác vẫn bỏ qua backend tới khi
+    lượt thử xong); thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = TTS_BREAKER_FAILURES, cooldown_s: float = TTS_BREAKER_COOLDOWN_S):
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.opened = 0
+        # Đang có request thử ở trạng thái half_open
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.cooldown_s:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Backend có được gọi không (chỉ kiểm tra, không giữ lượt thử)."""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self.trial_in_flight)
+
+    def acquire(self) -> bool:
+        """Như allow(), nhưng ở half_open thì giữ lượt thử cho request này (trả lại bằng release/record_*)."""
+        if not self.allow():
+            return False
+        if self.state == self.HALF_OPEN:
+            self.trial_in_flight = True
+        return True
+
+    def release(self):
+        """Lượt thử bị huỷ giữa chừng (không có kết quả): cho request khác thử."""
+        self.trial_in_flight = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self):
+        if self.state != self.OPEN:
+            self.opened += 1
+        self.opened_at = time.monotonic()
+        self.trial_in_flight = False
+
+
+class TTSBackend(ABC):
+    """Một backend TTS: tổng hợp có đo thời gian/ghi lỗi vào circuit breaker, và health probe (nếu có)."""
+
+    media_type = "audio/wav"
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.requests = 0
+        self.errors = 0
+        self.cancelled = 0
+        self.latency_s = 0.0
+        self.last_error: Optional[str] = None
+        self.last_probe_ok: Optional[bool] = None
+        self.last_probe_s: Optional[float] = None
+
+    @abstractmethod
+    async def _synthesize(self, text: str, speaker_id: int) -> bytes:
+        """Gọi dịch vụ TTS, trả về audio (định dạng `media_type`); lỗi thì ném exception."""
+
+    async def _probe(self) -> Optional[bool]:
+        """True/False nếu kiểm tra được, None nếu backend không có cách kiểm tra rẻ."""
+        return None
+
+    async def synthesize(self, text: str, speaker_id: int) -> bytes:
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            content = await self._synthesize(text, speaker_id)
+            outcome = "ok"
+            self.breaker.record_success()
+            return content
+        except asyncio.CancelledError:
+            # Bị huỷ vì backend khác (hedge) đã trả lời trước: không tính là lỗi
+            outcome = "cancelled"
+            raise
+        except Exception as e:
+            outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+            self.last_error = f"{type(e).__name__}: {e}"
+            self.breaker.record_failure()
+            raise
+        finally:
+            duration_s = time.perf_counter() - started
+            if outcome == "cancelled":
+                self.cancelled += 1
+            else:
+                self.requests += 1
+                if outcome == "ok":
+                    self.latency_s += duration_s
+                else:
+                    self.errors += 1
+            observe(TTS_BACKEND_SECONDS, duration_s, backend=self.name, outcome=outcome)
+
+    async def probe(self) -> Optional[bool]:
+        started = time.perf_counter()
+        try:
+            ok = await self._probe()
+        except Exception:
+            ok = False
+        if ok is None:
+            return None
+        self.last_probe_ok = ok
+        self.last_probe_s = time.perf_counter() - started
+        if ok:
+            # Chỉ đóng breaker đang mở; không xoá đếm lỗi khi backend vẫn đang được dùng bình thường
+            if self.breaker.state != CircuitBreaker.CLOSED:
+                self.breaker.record_success()
+        else:
+            self.breaker.trip()
+        return ok
+
+    def stats(self) -> Dict:
+        return {
+            "name": self.name,
+            "media_type": self.media_type,
+            "state": self.breaker.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "error_rate": round(self.errors / self.requests, 4) if self.requests else 0.0,
+            "avg_latency_s": round(self.latency_s / (self.requests - self.errors), 3) if self.requests > self.errors else None,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "circuit_opened": self.breaker.opened,
+            "last_error": self.last_error,
+            "last_probe_ok": self.last_probe_ok,
+            "last_probe_s": round(self.last_probe_s, 3) if self.last_probe_s is not None else None,
+        }
+
+
+class HttpTTSBackend(TTSBackend):
+    """Server TTS HTTP: POST <url>/tts {text, speaker_id} -> audio/wav."""
+
+    def __init__(self, name: str, url: str, client: "TTSClient", timeout_s: float = TTS_TIMEOUT_S,
+                 probe_path: str = TTS_PROBE_PATH, probe_timeout_s: float = TTS_PROBE_TIMEOUT_S, breaker: Optional[CircuitBreaker] = None):
+        super().__init__(name, breaker)
+        self.url = url.rstrip("/")
+        self.client = client
+        self.timeout_s = timeout_s
+        self.probe_path = probe_path
+        self.probe_timeout_s = probe_timeout_s
+
+    @staticmethod
+    def _is_up(response: httpx.Response) -> bool:
+        # ngrok trả 404/502 kèm header ngrok-error-code khi máy phía sau đã tắt
+        return response.status_code < 500 and "ngrok-error-code" not in response.headers
+
+    async def _synthesize(self, text: str, speaker_id: int) -> bytes:
+        response = await self.client.get().post(f"{self.url}/tts", json={"text": text, "speaker_id": speaker_id}, timeout=self.timeout_s)
+        if not response.is_success or not self._is_up(response):
+            raise TTSError(f"HTTP {response.status_code}")
+        return response.content
+
+    async def _probe(self) -> bool:
+        response = await self.client.get().get(f"{self.url}{self.probe_path}", timeout=self.probe_timeout_s)
+        return self._is_up(response)
+
+
+class GTTSBackend(TTSBackend):
+    """gTTS (Google Translate TTS), trả về MP3. Không có health probe: chỉ dựa vào lỗi khi gọi."""
+
+    media_type = "audio/mpeg"
+
+    async def _synthesize(self, text: str, speaker_id: int) -> bytes:
+        import io
+
+        import gtts  # chỉ cần khi các backend khác lỗi, không import lúc khởi động
+
+        mp3_fp = io.BytesIO()
+        await asyncio.to_thread(gtts.gTTS(text=text, lang="vi").write_to_fp, mp3_fp)
+        return mp3_fp.getvalue()
+
+
+class TTSClient:
+    """httpx.AsyncClient dùng chung cho các backend HTTP (giữ kết nối giữa các đoạn của một câu trả lời)."""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def get(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=TTS_TIMEOUT_S)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class TTSRegistry:
+    """Danh sách backend theo thứ tự ưu tiên, chọn backend theo circuit breaker và gọi có hedging."""
+
+    def __init__(self, backends: Sequence[TTSBackend], hedge_after_s: float = TTS_HEDGE_AFTER_S, client: Optional[TTSClient] = None):
+        self.backends = list(backends)
+        self.hedge_after_s = hedge_after_s
+        self.client = client
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def get(self, name: str) -> TTSBackend:
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        raise KeyError(name)
+
+    def candidates(self, backends: Optional[Sequence[TTSBackend]] = None) -> List[TTSBackend]:
+        """Các backend được phép gọi; nếu tất cả đang bị ngắt thì vẫn thử backend cuối (dự phòng)."""
+        backends = list(backends or self.backends)
+        return [backend for backend in backends if backend.breaker.allow()] or backends[-1:]
+
+    async def synthesize(self, text: str, speaker_id: int, backends: Optional[Sequence[TTSBackend]] = None) -> Tuple[TTSBackend, bytes]:
+        """
+        Gọi backend đầu tiên còn dùng được; lỗi thì chuyển ngay sang backend kế tiếp (kể cả khi còn
+        backend khác đang chạy song song), chậm quá `hedge_after_s` thì gọi thêm backend kế tiếp song song.
+        Backend đang half_open chỉ nhận một request thử tại một thời điểm. Trả về (backend thắng, audio).
+        """
+        candidates = self.candidates(backends)
+        if not candidates:
+            raise TTSError("không có backend TTS")
+        # Mọi backend đều đang bị ngắt: vẫn gọi backend dự phòng cuối cùng
+        forced = len(candidates) == 1 and not candidates[0].breaker.allow()
+        pending: Dict[asyncio.Task, TTSBackend] = {}
+        trials = set()
+        errors: List[str] = []
+        started = 0
+        hedged = False
+
+        def start_next() -> bool:
+            """Bắt đầu backend kế tiếp còn được gọi; False nếu không còn backend nào."""
+            nonlocal started
+            while started < len(candidates):
+                backend = candidates[started]
+                started += 1
+                half_open = backend.breaker.state == CircuitBreaker.HALF_OPEN
+                acquired = backend.breaker.acquire()
+                # Backend vừa chuyển sang half_open và đã có request khác giữ lượt thử thì bỏ qua
+                if not acquired and not forced:
+                    continue
+                task = asyncio.create_task(backend.synthesize(text, speaker_id))
+                pending[task] = backend
+                if half_open and acquired:
+                    trials.add(task)
+                return True
+            return False
+
+        start_next()
+        try:
+            while pending:
+                can_hedge = started < len(candidates)
+                done, _ = await asyncio.wait(pending, timeout=self.hedge_after_s if can_hedge else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    print(f"--> [TTS] {', '.join(b.name for b in pending.values())} chưa trả lời sau {self.hedge_after_s}s, gọi thêm backend kế tiếp.")
+                    self.hedges += 1
+                    hedged = True
+                    start_next()
+                    continue
+                failed = 0
+                for task in done:
+                    backend = pending.pop(task)
+                    if task.exception() is None:
+                        if hedged and backend is not candidates[0]:
+                            self.hedge_wins += 1
+                        return backend, task.result()
+                    failed += 1
+                    errors.append(f"{backend.name}: {task.exception()}")
+                    print(f"--> [TTS] {backend.name} lỗi: {task.exception()!r}")
+                # Không chờ hết hedge_after_s của backend còn đang chạy: thay backend lỗi ngay
+                for _ in range(failed):
+                    if not start_next():
+                        break
+        finally:
+            for task in pending:
+                task.cancel()
+                if task in trials:
+                    pending[task].breaker.release()
+        raise TTSError("; ".join(errors) or "mọi backend TTS đang bị ngắt")
+
+    async def probe_all(self):
+        await asyncio.gather(*(backend.probe() for backend in self.backends))
+
+    async def _probe_loop(self, interval_s: float):
+        while True:
+            await self.probe_all()
+            await asyncio.sleep(interval_s)
+
+    def start_probes(self, interval_s: float = TTS_PROBE_INTERVAL_S):
+        """Chạy health probe định kỳ trong event loop hiện tại (gọi từ lifespan của FastAPI)."""
+        if interval_s > 0 and self._probe_task is None:
+            self._probe_task = asyncio.create_task(self._probe_loop(interval_s))
+
+    async def aclose(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+        if self.client is not None:
+            await self.client.aclose()
+
+    def stats(self) -> Dict:
+        return {
+            "hedge_after_s": self.hedge_after_s,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+    def collect_metrics(self):
+        """Collector cho /metrics: trạng thái circuit breaker, số lần gọi/lỗi theo backend và số lần hedge."""
+        yield "tts_backend_circuit_open", "1 nếu backend TTS đang bị bỏ qua (circuit breaker mở).", "gauge", [
+            ({"backend": backend.name}, 1 if backend.breaker.state == CircuitBreaker.OPEN else 0) for backend in self.backends
+        ]
+        yield "tts_backend_requests_total", "Số lần gọi backend TTS (không tính lần bị huỷ do hedge).", "counter", [
+            sample
+            for backend in self.backends
+            for sample in (({"backend": backend.name, "result": "ok"}, backend.requests - backend.errors),
+                           ({"backend": backend.name, "result": "error"}, backend.errors))
+        ]
+        yield "tts_backend_probe_up", "Kết quả health probe gần nhất (1 = sống).", "gauge", [
+            ({"backend": backend.name}, 1 if backend.last_probe_ok else 0) for backend in self.backends if backend.last_probe_ok is not None
+        ]
+        yield "tts_hedges_total", "Số lần gọi thêm backend dự phòng vì backend đang gọi quá chậm.", "counter", [({}, self.hedges)]
+
+
+def parse_backend_urls(spec: str) -> List[Tuple[str, str]]:
+    """
+    Đọc TTS_BACKENDS dạng "a=http://x,b=http://y"; mục không có tên được đặt tên theo vị trí.
+    Chỉ coi là "tên=url" khi phần trước dấu "=" không phải một phần URL, nên URL có query
+    ("https://abc.ngrok.app/tts?token=xyz") vẫn được giữ nguyên.
+    """
+    pairs = []
+    for index, item in enumerate(part.strip() for part in spec.split(",")):
+        if not item:
+            continue
+        name, sep, url = item.partition("=")
+        if sep and "://" not in name and "/" not in name:
+            pairs.append((name.strip(), url.strip()))
+        else:
+            pairs.append((f"http{index}", item))
+    return pairs
+
+
+def create_tts_registry(spec: str = TTS_BACKENDS, gtts_fallback: bool = TTS_GTTS_FALLBACK) -> TTSRegistry:
+    client = TTSClient()
+    backends: List[TTSBackend] = [HttpTTSBackend(name, url, client) for name, url in parse_backend_urls(spec)]
+    if gtts_fallback:
+        backends.append(GTTSBackend("gtts"))
+    return TTSRegistry(backends, client=client)
@@ -0,0 +1,141 @@
+"""
+Tổng hợp giọng nói theo từng câu cho /tts: chia văn bản thành các đoạn ngắn (mỗi đoạn được chuẩn hoá riêng),
+tổng hợp song song (giới hạn số đoạn chạy cùng lúc) và trả audio về theo đúng thứ tự
+ngay khi từng đoạn xong, nên trình phát bắt đầu đọc sau câu đầu tiên thay vì chờ cả câu trả lời.
+
+- WAV (API TTS ngoài): gửi một header WAV "streaming" (độ dài không xác định) rồi nối PCM của từng đoạn.
+- MP3 (gTTS): các frame MP3 nối trực tiếp được, nên gửi lần lượt nội dung từng đoạn.
+"""
+import asyncio
+import io
+import os
+import re
+import struct
+import wave
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple, TypeVar
+
+TTS_CHUNKED = os.getenv("TTS_CHUNKED", "1") == "1"
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "3"))
+# Câu ngắn hơn TTS_CHUNK_MIN_CHARS được gộp với câu sau; câu dài hơn TTS_CHUNK_MAX_CHARS bị cắt ở dấu phẩy/khoảng trắng
+TTS_CHUNK_MIN_CHARS = int(os.getenv("TTS_CHUNK_MIN_CHARS", "60"))
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "300"))
+
+_SENTENCE_END = re.compile(r'(?<=[.!?…;:])\s+|\s*\n\s*')
+_CLAUSE_END = re.compile(r'(?<=,)\s+')
+
+# Tham số PCM của một file WAV: (số kênh, số byte mỗi mẫu, tần số lấy mẫu)
+PcmFormat = Tuple[int, int, int]
+T = TypeVar("T")
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """Cắt câu quá dài ở dấu phẩy, nếu vẫn dài thì ở khoảng trắng."""
+    parts: List[str] = []
+    for clause in _CLAUSE_END.split(sentence):
+        while len(clause) > max_chars:
+            cut = clause.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            parts.append(clause[:cut].strip())
+            clause = clause[cut:].strip()
+        if clause:
+            parts.append(clause)
+    # Gộp lại các mệnh đề ngắn liền nhau miễn là không vượt max_chars
+    merged: List[str] = []
+    for part in parts:
+        if merged and len(merged[-1]) + 1 + len(part) <= max_chars:
+            merged[-1] = f"{merged[-1]} {part}"
+        else:
+            merged.append(part)
+    return merged
+
+
+def split_sentences(text: str, min_chars: int = TTS_CHUNK_MIN_CHARS, max_chars: int = TTS_CHUNK_MAX_CHARS) -> List[str]:
+    """
+    Chia văn bản thành các đoạn cỡ một câu để tổng hợp riêng. Dấu chấm trong số ("5.000.000")
+    không theo sau bởi khoảng trắng nên không bị coi là hết câu.
+    """
+    pieces: List[str] = []
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        if sentence:
+            pieces.extend(_split_long(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+    chunks: List[str] = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) < min_chars and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece}"
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def parse_wav(content: bytes) -> Optional[Tuple[PcmFormat, bytes]]:
+    """Tách (định dạng PCM, dữ liệu PCM) từ file WAV; None nếu không phải WAV PCM."""
+    try:
+        with wave.open(io.BytesIO(content), "rb") as reader:
+            pcm_format = (reader.getnchannels(), reader.getsampwidth(), reader.getframerate())
+            return pcm_format, reader.readframes(reader.getnframes())
+    except (wave.Error, EOFError):
+        return None
+
+
+def wav_stream_header(pcm_format: PcmFormat) -> bytes:
+    """Header WAV cho luồng chưa biết độ dài: kích thước RIFF/data đặt tối đa, trình phát đọc tới hết luồng."""
+    channels, sample_width, sample_rate = pcm_format
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 0xFFFFFFFF, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, sample_rate * block_align, block_align, sample_width * 8,
+        b"data", 0xFFFFFFFF,
+    )
+
+
+def finalize_wav(data: bytes) -> bytes:
+    """Ghi độ dài thật vào luồng WAV (header 44 byte của wav_stream_header + PCM) để lưu thành file hoàn chỉnh."""
+    data_size = len(data) - 44
+    return data[:4] + struct.pack("<I", 36 + data_size) + data[8:40] + struct.pack("<I", data_size) + data[44:]
+
+
+class OrderedResults:
+    """
+    Kết quả của các task theo đúng thứ tự (async iterator). `aclose()` huỷ các task chưa xong,
+    kể cả khi chưa đọc kết quả nào (khác với async generator chưa chạy, aclose không làm gì).
+    """
+
+    def __init__(self, tasks: List["asyncio.Future[T]"]):
+        self._tasks = tasks
+        self._next = 0
+
+    def __aiter__(self) -> "OrderedResults":
+        return self
+
+    async def __anext__(self) -> T:
+        if self._next >= len(self._tasks):
+            raise StopAsyncIteration
+        task = self._tasks[self._next]
+        self._next += 1
+        return await task
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+def synthesize_in_order(
+    chunks: Sequence[str],
+    synthesize: Callable[[str], Awaitable[T]],
+    concurrency: int = TTS_CHUNK_CONCURRENCY,
+) -> AsyncIterator[T]:
+    """
+    Bắt đầu ngay `synthesize` cho mọi đoạn (không chờ tới lúc đọc kết quả), tối đa `concurrency` đoạn
+    cùng lúc (đoạn đầu được bắt đầu trước), và trả kết quả theo đúng thứ tự các đoạn.
+    Phải gọi `aclose()` khi không dùng nữa (client ngắt kết nối...) để huỷ các đoạn chưa xong.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(chunk: str) -> T:
+        async with semaphore:
+            return await synthesize(chunk)
+
+    return OrderedResults([asyncio.ensure_future(run(chunk)) for chunk in chunks])
@@ -1,7 +1,11 @@
-from mcp.rag import llm
+import json
+import os
 import re
-from vietnam_number import n2w
 from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from vietnam_number import n2w
 
 # Từ điển dịch tên tháng sang tiếng Việt
 MONTHS_VI = {
@@ -19,71 +23,127 @@ MONTHS_VI = {
     'December': 'tháng Mười Hai'
 }
 
+# Từ viết tắt mặc định. Có thể bổ sung/ghi đè bằng file JSON {"viết tắt": "dạng đầy đủ"}
+# đặt qua biến môi trường TTS_ABBREVIATIONS_PATH, hoặc gọi set_abbreviations khi chạy.
+DEFAULT_ABBREVIATIONS = {
+    "sv": "sinh viên",
+    "hcm": "hồ chí minh",
+    "CNTT&TT" : "công nghệ thông tin và truyền thông"
+}
+ABBREVIATIONS_PATH = os.getenv("TTS_ABBREVIATIONS_PATH")
+
+# Số, '&' và '/' được thay trong cùng một lượt (nhóm 1..3)
+_TOKEN_PATTERN = re.compile(r'(\d[\d.,]*)|(&)|(/)')
+_SYMBOL_WORDS = (None, None, " và ", " trên ")
+
+
+@lru_cache(maxsize=4096)
+def number_to_words(number_str: str) -> str:
+    """n2w có cache: năm, số tín chỉ, số tiền... lặp lại rất nhiều giữa các câu trả lời."""
+    return n2w(number_str)
+
+
+@lru_cache(maxsize=4096)
+def _number_token_words(token: str) -> str:
+    """Đọc một cụm số như "200.000" (bỏ dấu phân cách); giữ nguyên nếu n2w không đọc được."""
+    try:
+        return number_to_words(token.replace('.', '').replace(',', ''))
+    except (ValueError, IndexError):
+        return token
+
+
+@lru_cache(maxsize=1024)
+def _date_words(date_str: str) -> str:
+    """Đọc ngày dạng dd/mm/yyyy; ngày không hợp lệ được giữ nguyên (số và '/' sẽ được đọc ở lượt sau)."""
+    try:
+        date_obj = datetime.strptime(date_str, "%d/%m/%Y")
+        day_str = number_to_words(date_obj.strftime("%d"))
+        month_str = MONTHS_VI[date_obj.strftime("%B")]
+        year_str = number_to_words(date_obj.strftime("%Y"))
+        return f"ngày {day_str} {month_str} năm {year_str}"
+    except (ValueError, IndexError):
+        return date_str
+
+
+def _replace_token(match: re.Match) -> str:
+    index = match.lastindex
+    if index == 1:
+        return _number_token_words(match.group(1))
+    return _SYMBOL_WORDS[index]
+
+
+def load_abbreviations(path: Optional[str] = None) -> Dict[str, str]:
+    """Từ điển viết tắt mặc định, cộng thêm các mục trong file JSON `path` (nếu có)."""
+    abbreviations = dict(DEFAULT_ABBREVIATIONS)
+    if path:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                abbreviations.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Không đọc được từ điển viết tắt {path}: {e}. Dùng từ điển mặc định.")
+    return abbreviations
+
+
+class VietnameseNormalizer:
+    """
+    Chuẩn hoá văn bản trước khi đưa vào TTS: mở rộng viết tắt, đọc ngày tháng, số và ký tự đặc biệt.
+    Regex được biên dịch một lần khi tạo đối tượng:
+    - Lượt 1: từ viết tắt (không phân biệt hoa/thường, ưu tiên theo thứ tự trong từ điển) và ngày dd/mm/yyyy.
+    - Lượt 2: số, '&' và '/'; sau đó bỏ "lẽ" và gộp khoảng trắng.
+    Ngày phải được đọc trước số để ngày không hợp lệ vẫn được đọc như số thường, giống bản cũ.
+    """
+
+    def __init__(self, abbreviations: Optional[Dict[str, str]] = None):
+        self.abbreviations = dict(DEFAULT_ABBREVIATIONS if abbreviations is None else abbreviations)
+        keys = [abbr for abbr in self.abbreviations if abbr]
+        self._expansions = [self.abbreviations[abbr] for abbr in keys]
+        # Nhóm 1..n: từ viết tắt, nhóm n+1: ngày tháng. Lookahead theo ký tự đầu giúp bỏ qua nhanh
+        # những vị trí không thể khớp (nhanh gần gấp đôi trên văn bản dài so với thử cả nhánh ở mọi vị trí)
+        first_chars = ''.join(sorted({re.escape(abbr[0]) for abbr in keys}))
+        abbr_pattern = r'(?i:\b(?:' + '|'.join(f'({re.escape(abbr)})' for abbr in keys) + r')\b)|' if keys else ''
+        self._first_pass = re.compile(
+            rf'(?i:(?=[{first_chars}\d]))(?:' + abbr_pattern + r'\b(\d{1,2}/\d{1,2}/\d{4})\b)'
+        )
+        self._date_group = len(keys) + 1
+
+    def _replace_first(self, match: re.Match) -> str:
+        index = match.lastindex
+        if index == self._date_group:
+            return _date_words(match.group(index))
+        return self._expansions[index - 1]
+
+    def normalize(self, text: str) -> str:
+        text = self._first_pass.sub(self._replace_first, text)
+        text = _TOKEN_PATTERN.sub(_replace_token, text)
+        # Bỏ "lẽ" sau khi đã đọc số: n2w có thể trả về chuỗi rỗng (ví dụ "00"), nối hai phần thành "lẽ"
+        text = text.replace("lẽ", "")
+        # Gộp khoảng trắng: str.split() và \s dùng cùng định nghĩa khoảng trắng Unicode
+        return ' '.join(text.split())
+
+    def normalize_batch(self, texts: Iterable[str]) -> List[str]:
+        normalize = self.normalize
+        return [normalize(text) for text in texts]
+
+
+default_normalizer = VietnameseNormalizer(load_abbreviations(ABBREVIATIONS_PATH))
+
+
+def set_abbreviations(abbreviations: Dict[str, str]):
+    """Thay từ điển viết tắt dùng cho preprocess_text."""
+    global default_normalizer
+    default_normalizer = VietnameseNormalizer(abbreviations)
+
+
 def preprocess_text(text: str) -> str:
     """
     Tiền xử lý văn bản: chuyển số, ngày tháng, ký tự đặc biệt, viết tắt sang dạng đầy đủ.
     """
-    # 1. Mở rộng từ viết tắt (Ưu tiên số 1)
-    abbreviations = {
-        "sv": "sinh viên",
-        "hcm": "hồ chí minh",
-        "CNTT&TT" : "công nghệ thông tin và truyền thông"
-    }
-    for abbr, full_text in abbreviations.items():
-        text = re.sub(r'\b' + re.escape(abbr) + r'\b', full_text, text, flags=re.IGNORECASE)
-
-    # 2. Chuyển đổi ngày tháng (Dùng datetime - Ưu tiên số 2)
-    matches = list(re.finditer(r'\b(\d{1,2}/\d{1,2}/\d{4})\b', text))
-    if matches:
-        processed_text_parts = []
-        last_index = 0
-        for match in matches:
-            date_str = match.group(0)
-            try:
-                date_obj = datetime.strptime(date_str, "%d/%m/%Y")
-                
-                day_str = n2w(date_obj.strftime("%d"))
-                month_str = MONTHS_VI[date_obj.strftime("%B")]
-                year_str = n2w(date_obj.strftime("%Y"))
-                
-                formatted_date = f"ngày {day_str} {month_str} năm {year_str}"
-                
-                processed_text_parts.append(text[last_index:match.start()])
-                processed_text_parts.append(formatted_date)
-            except (ValueError, IndexError):
-                processed_text_parts.append(text[last_index:match.end()])
-            
-            last_index = match.end()
-        
-        processed_text_parts.append(text[last_index:])
-        text = ''.join(processed_text_parts)
-
-    # 3. Chuyển đổi các con số còn lại thành chữ (Ưu tiên số 3)
-    matches = list(re.finditer(r'(\d[\d\.,]*)', text))
-    if matches:
-        processed_text_parts = []
-        last_index = 0
-        for match in matches:
-            processed_text_parts.append(text[last_index:match.start()])
-            number_str = match.group(0).replace('.', '').replace(',', '')
-            try:
-                processed_text_parts.append(n2w(number_str))
-            except (ValueError, IndexError):
-                processed_text_parts.append(match.group(0))
-            last_index = match.end()
-        processed_text_parts.append(text[last_index:])
-        text = ''.join(processed_text_parts)
-    
-    # 4. Thay thế ký tự đặc biệt (Ưu tiên số 4 - Cuối cùng)
-    # Bây giờ, chuỗi ngày tháng đã được xử lý xong, không còn ký tự '/'
-    text = text.replace("&", " và ")
-    text = text.replace("/", " trên ")
-    text = text.replace("lẽ", "")
-    
-    # 5. Loại bỏ các ký tự không mong muốn và khoảng trắng thừa
-    # Tinh chỉnh regex để xử lý tốt hơn
-    print(text)
-    return re.sub(r'\s+', ' ', text).strip()
+    return default_normalizer.normalize(text)
+
+
+def preprocess_texts(texts: Iterable[str]) -> List[str]:
+    """Bản xử lý theo lô của preprocess_text (ví dụ các câu của một câu trả lời dài)."""
+    return default_normalizer.normalize_batch(texts)
 
 # print(preprocess_text("""
 # Đại học Bách khoa Hà Nội được thành lập ngày 6/3/1956. Trường đã chuyển thành Đại học Bách khoa Hà Nội theo Quyết định số 1512/QĐ-TTg ngày 02/12/2022 của Thủ tướng Chính phủ. Hiện tại, Đại học Bách khoa Hà Nội có hơn 200.000 cựu sinh viên, với cơ cấu gồm 10 Trường & Khoa đào tạo, 03 Khoa đào tạo cơ bản, 06 Viện/Trung tâm nghiên cứu và 12 Phòng nghiên cứu trọng điểm.